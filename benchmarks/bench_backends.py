@@ -0,0 +1,41 @@
+"""Compare per-call latency of the read-only query backends
+
+Run from inside of any git repo:
+
+    % venv/bin/python benchmarks/bench_backends.py -n 200
+"""
+import timeit
+import click
+from easy_workflow_manager import backends
+
+
+QUERIES = (
+    ('branch_name', ()),
+    ('local_branches', ()),
+    ('branch_date', ('HEAD',)),
+    ('origin_url', ()),
+    ('first_commit_id', ()),
+    ('last_commit_id', ()),
+)
+
+
+@click.command()
+@click.option(
+    '--number', '-n', 'number', default=100,
+    help='Number of calls to time for each query'
+)
+def main(number):
+    """Show microseconds per call for each query, per backend"""
+    names = sorted(backends.BACKENDS)
+    print('{:<18}'.format('query') + ''.join(['{:>14}'.format(name) for name in names]))
+    for method, args in QUERIES:
+        row = '{:<18}'.format(method)
+        for name in names:
+            func = getattr(backends.BACKENDS[name], method)
+            seconds = timeit.timeit(lambda: func(*args), number=number)
+            row += '{:>12.1f}us'.format(seconds / number * 1e6)
+        print(row)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Report startup cost of each ewm-* console script
+
+For every console script of the installed package, this shows the import time
+of the script module (from `python -X importtime`, best of n runs in fresh
+interpreters) and the wall time of running the script with `--help`
+
+    % venv/bin/python benchmarks/bench_imports.py -n 5
+    % venv/bin/python benchmarks/bench_imports.py --max-ms 150
+"""
+import subprocess
+import sys
+import time
+import click
+from importlib.metadata import entry_points
+
+
+def get_console_scripts():
+    """Return sorted list of (script name, module name) for easy_workflow_manager"""
+    return sorted([
+        (ep.name, ep.value.split(':')[0])
+        for ep in entry_points(group='console_scripts')
+        if ep.value.startswith('easy_workflow_manager.')
+    ])
+
+
+def import_time_us(module):
+    """Return cumulative import time (us) of module in a fresh interpreter"""
+    output = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import {}'.format(module)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        check=True,
+    ).stderr.decode('utf-8')
+    for line in reversed(output.splitlines()):
+        parts = [part.strip() for part in line.split('|')]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1])
+    return 0
+
+
+def help_time_ms(module):
+    """Return wall time (ms) of running the script's main with --help"""
+    code = 'from {} import main; main(["--help"])'.format(module)
+    start = time.time()
+    subprocess.run(
+        [sys.executable, '-c', code],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return (time.time() - start) * 1000
+
+
+@click.command()
+@click.option(
+    '--number', '-n', 'number', default=3,
+    help='Number of fresh interpreters to time for each script (best is shown)'
+)
+@click.option(
+    '--max-ms', 'max_ms', type=float, default=None,
+    help='Exit with status 1 if any script imports slower than this'
+)
+def main(number, max_ms):
+    """Show import time and --help wall time for each ewm-* script"""
+    scripts = get_console_scripts()
+    if not scripts:
+        print('No console scripts found; is easy_workflow_manager installed?')
+        sys.exit(1)
+    print('{:<30}{:>12}{:>12}'.format('script', 'import ms', '--help ms'))
+    slow = []
+    for name, module in scripts:
+        imported = min([import_time_us(module) for _ in range(number)]) / 1000
+        helped = min([help_time_ms(module) for _ in range(number)])
+        print('{:<30}{:>12.1f}{:>12.1f}'.format(name, imported, helped))
+        if max_ms is not None and imported > max_ms:
+            slow.append(name)
+    if slow:
+        print('\nSlower than {}ms: {}'.format(max_ms, ', '.join(slow)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+"""Time every public ewm operation on synthetic repos of increasing size
+
+For each scale, a bare remote + clone pair is generated (see synthetic.py) and
+every public get_* and show_* function is timed in the clone. Then
+deploy_to_qa, merge_qa_to_source, and tag_release are timed (in that order,
+non-interactively) on a fresh pair for each run, since they change the repos.
+
+Ref listing and fetch caches are disabled (REF_CACHE_SECONDS and
+FETCH_WINDOW_SECONDS set to 0) unless --warm is used, so the numbers show the
+cost of the real git work. Output of the operations is discarded.
+
+    % venv/bin/python benchmarks/run.py -s small -s medium -o results.json
+    % venv/bin/python benchmarks/run.py -s large --only qa --compare results.json
+
+Results are written as JSON:
+
+    {"meta": {...}, "results": [{"scale": ..., "counts": {...},
+     "operation": ..., "runs": ..., "min_ms": ..., "median_ms": ...,
+     "max_ms": ..., "ok": ...}, ...]}
+"""
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+import click
+
+
+os.environ['QA_BRANCHES'] = 'qa1, qa2, qa3'
+os.environ['IGNORE_BRANCHES'] = 'master'
+os.environ['SOURCE_BRANCH'] = 'master'
+os.environ['TAG_BRANCH'] = 'master'
+os.environ.setdefault('LOCAL_BRANCH', 'mylocalbranch')
+os.environ['EWM_NO_DAEMON'] = '1'
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic
+
+
+SCALES = {
+    'small': dict(branches=10, tags=5, commits=50, qa_envs=2, files=20),
+    'medium': dict(branches=200, tags=50, commits=1000, qa_envs=20, files=200),
+    'large': dict(branches=2000, tags=500, commits=10000, qa_envs=200, files=2000),
+}
+# Positional args for functions that need them; called with the clone's info
+ARGS = {
+    'get_setting': lambda paths: ('SOURCE_BRANCH',),
+    'get_branch_date': lambda paths: ('HEAD',),
+    'get_refs_with_times': lambda paths: ('refs/remotes/origin/',),
+    'show_workspace_info': lambda paths: (os.path.dirname(paths['local']),),
+}
+# get_* functions that change the clone (timed as part of the write operations)
+SKIP = ('get_clean_local_branch',)
+WRITE_OPERATIONS = (
+    ('deploy_to_qa', lambda ewm: ewm.deploy_to_qa(
+        qa=synthetic.QA_NAMES[-1], branches='feature-0001, feature-0002'
+    )),
+    ('merge_qa_to_source', lambda ewm: ewm.merge_qa_to_source(
+        qa=synthetic.QA_NAMES[-1], auto=True
+    )),
+    ('tag_release', lambda ewm: ewm.tag_release(auto=True)),
+)
+
+
+def get_read_operations(ewm):
+    """Return sorted names of the public get_* and show_* functions that
+    don't change the repo"""
+    return sorted([
+        name for name in dir(ewm)
+        if name.startswith(('get_', 'show_')) and name not in SKIP
+        and callable(getattr(ewm, name))
+    ])
+
+
+@contextmanager
+def _quiet():
+    """Discard anything written to stdout/stderr, including by subprocesses"""
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = (os.dup(1), os.dup(2))
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    try:
+        os.dup2(devnull, 1)
+        os.dup2(devnull, 2)
+        yield
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(saved[0], 1)
+        os.dup2(saved[1], 2)
+        for fd in saved + (devnull,):
+            os.close(fd)
+
+
+def _time_call(func):
+    """Return (milliseconds, ok) for one call of func"""
+    start = time.perf_counter()
+    try:
+        with _quiet():
+            result = func()
+        ok = result is not None and result is not False
+    except Exception:
+        ok = False
+    return (time.perf_counter() - start) * 1000, ok
+
+
+def _result(scale, counts, operation, timings, ok):
+    return {
+        'scale': scale,
+        'counts': counts,
+        'operation': operation,
+        'runs': len(timings),
+        'min_ms': round(min(timings), 3),
+        'median_ms': round(statistics.median(timings), 3),
+        'max_ms': round(max(timings), 3),
+        'ok': ok,
+    }
+
+
+def bench_scale(root, scale, counts, number, only=''):
+    """Return list of result dicts for one scale
+
+    - root: directory to generate repos in
+    - scale: name of the scale
+    - counts: kwargs for synthetic.make_repo_pair
+    - number: number of runs of each operation
+    - only: if set, only time operations whose name contains this
+    """
+    import easy_workflow_manager as ewm
+    results = []
+    cwd = os.getcwd()
+    try:
+        paths = synthetic.make_repo_pair(os.path.join(root, scale, 'read'), **counts)
+        os.chdir(paths['local'])
+        for name in get_read_operations(ewm):
+            if only and only not in name:
+                continue
+            func = getattr(ewm, name)
+            args = ARGS.get(name, lambda paths: ())(paths)
+            timed = [_time_call(lambda: func(*args)) for _ in range(number)]
+            # Most get_* functions return falsy values when there is nothing to show
+            results.append(_result(
+                scale, counts, name, [t for t, _ in timed], None
+            ))
+
+        write_ops = [(n, f) for n, f in WRITE_OPERATIONS if not only or only in n]
+        timings = dict([(name, []) for name, _ in write_ops])
+        oks = dict([(name, True) for name, _ in write_ops])
+        for i in range(number if write_ops else 0):
+            os.chdir(cwd)
+            paths = synthetic.make_repo_pair(
+                os.path.join(root, scale, 'write-{}'.format(i)), **counts
+            )
+            os.chdir(paths['local'])
+            for name, func in WRITE_OPERATIONS:
+                ms, ok = _time_call(lambda: func(ewm))
+                if name in timings:
+                    timings[name].append(ms)
+                    oks[name] = oks[name] and ok
+        for name, _ in write_ops:
+            results.append(_result(scale, counts, name, timings[name], oks[name]))
+    finally:
+        os.chdir(cwd)
+    return results
+
+
+def _load_previous(path):
+    """Return dict of (scale, operation) -> median_ms from a results file"""
+    with open(path, 'r') as fp:
+        data = json.load(fp)
+    return dict([
+        ((r['scale'], r['operation']), r['median_ms'])
+        for r in data.get('results', [])
+    ])
+
+
+def _git_version():
+    try:
+        return subprocess.run(
+            ['git', '--version'], stdout=subprocess.PIPE, check=True
+        ).stdout.decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+@click.command()
+@click.option(
+    '--scale', '-s', 'scales', multiple=True, type=click.Choice(sorted(SCALES)),
+    help='Scale to run (can be repeated; default is small and medium)'
+)
+@click.option(
+    '--number', '-n', 'number', default=3,
+    help='Number of runs of each operation'
+)
+@click.option(
+    '--only', default='',
+    help='Only time operations whose name contains this string'
+)
+@click.option(
+    '--warm', '-w', 'warm', is_flag=True, default=False,
+    help='Leave the ref listing and fetch caches enabled'
+)
+@click.option(
+    '--output', '-o', 'output', default=None,
+    help='File to write JSON results to ("-" for stdout)'
+)
+@click.option(
+    '--compare', '-c', 'compare', type=click.Path(exists=True), default=None,
+    help='JSON results file from an earlier run to compare median times with'
+)
+@click.option(
+    '--keep', '-k', 'keep', is_flag=True, default=False,
+    help='Keep the generated repos (their location is shown)'
+)
+def main(scales, number, only, warm, output, compare, keep):
+    """Time ewm operations on synthetic repos at several scales"""
+    if not warm:
+        os.environ['REF_CACHE_SECONDS'] = '0'
+        os.environ['FETCH_WINDOW_SECONDS'] = '0'
+    scales = scales or ('small', 'medium')
+    previous = _load_previous(compare) if compare else {}
+    show_table = output != '-'
+    root = tempfile.mkdtemp(prefix='ewm-bench-')
+    results = []
+    if show_table:
+        header = '{:<10}{:<36}{:>12}{:>12}'.format('scale', 'operation', 'median ms', 'min ms')
+        if previous:
+            header += '{:>12}{:>8}'.format('before ms', 'ratio')
+        print(header)
+    try:
+        for scale in sorted(scales, key=lambda s: SCALES[s]['branches']):
+            for result in bench_scale(root, scale, SCALES[scale], number, only):
+                results.append(result)
+                if not show_table:
+                    continue
+                row = '{:<10}{:<36}{:>12.1f}{:>12.1f}'.format(
+                    scale, result['operation'], result['median_ms'], result['min_ms']
+                )
+                before = previous.get((scale, result['operation']))
+                if before:
+                    row += '{:>12.1f}{:>8.2f}'.format(before, result['median_ms'] / before)
+                if result['ok'] is False:
+                    row += '  (failed)'
+                print(row)
+    finally:
+        if keep:
+            print('\nGenerated repos are in {}'.format(root), file=sys.stderr)
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+    data = {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'git': _git_version(),
+            'platform': platform.platform(),
+            'number': number,
+            'warm': warm,
+            'scales': dict([(scale, SCALES[scale]) for scale in scales]),
+        },
+        'results': results,
+    }
+    if output == '-':
+        print(json.dumps(data, indent=2))
+    elif output:
+        with open(output, 'w') as fp:
+            json.dump(data, fp, indent=2)
+        print('\nWrote {} results to {}'.format(len(results), output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+"""Generate bare remote + clone pairs of any size for benchmarking
+
+The whole history is written with one `git fast-import` into the bare remote,
+then cloned, so even repos with thousands of branches take seconds to make.
+
+- master gets `commits` commits touching `files` files (round robin)
+- `tags` annotated tags are spread evenly over master, named like the tags
+  that tag_release creates
+- `branches` feature branches (feature-0001, ...) each add one file on top of
+  a commit of master, so they merge without conflicts
+- `qa_envs` QA env branches (qa1--with--feature-0001--feature-0002, ...) are
+  merges of master and a few feature branches, spread over every qa name in
+  QA_NAMES except the last one (which is left empty for deploys); each qa
+  branch points at its most recent env branch
+
+    % venv/bin/python benchmarks/synthetic.py /tmp/ewm-big --branches 2000 --tags 200
+"""
+import os
+import subprocess
+import time
+import click
+
+
+QA_NAMES = ('qa1', 'qa2', 'qa3')
+FEATURES_PER_ENV = 3
+START_TIME = 1600000000
+AUTHOR = 'Someone <someone@email.com>'
+
+
+def _data(text):
+    raw = text.encode('utf-8')
+    return b'data ' + str(len(raw)).encode('ascii') + b'\n' + raw + b'\n'
+
+
+class _Stream(object):
+    """Build a fast-import stream of commits with increasing timestamps"""
+    def __init__(self):
+        self.chunks = []
+        self.mark = 0
+        self.timestamp = START_TIME
+
+    def commit(self, ref, message, changes, parent=None, merges=()):
+        """Add a commit to ref and return its mark
+
+        - changes: list of (path, content) to write in the commit
+        - parent: mark of the first parent (if not the current tip of ref)
+        - merges: marks of additional parents
+        """
+        self.mark += 1
+        self.timestamp += 60
+        lines = [
+            'commit {}'.format(ref),
+            'mark :{}'.format(self.mark),
+            'committer {} {} +0000'.format(AUTHOR, self.timestamp),
+        ]
+        self.chunks.append(('\n'.join(lines) + '\n').encode('utf-8') + _data(message))
+        header = []
+        if parent:
+            header.append('from :{}'.format(parent))
+        header.extend(['merge :{}'.format(mark) for mark in merges])
+        if header:
+            self.chunks.append(('\n'.join(header) + '\n').encode('utf-8'))
+        for path, content in changes:
+            self.chunks.append('M 100644 inline {}\n'.format(path).encode('utf-8'))
+            self.chunks.append(_data(content))
+        self.chunks.append(b'\n')
+        return self.mark
+
+    def reset(self, ref, mark):
+        """Point ref at the commit with mark"""
+        self.chunks.append('reset {}\nfrom :{}\n\n'.format(ref, mark).encode('utf-8'))
+
+    def tag(self, name, mark):
+        """Add an annotated tag for the commit with mark"""
+        self.timestamp += 1
+        lines = [
+            'tag {}'.format(name),
+            'from :{}'.format(mark),
+            'tagger {} {} +0000'.format(AUTHOR, self.timestamp),
+        ]
+        self.chunks.append(('\n'.join(lines) + '\n').encode('utf-8') + _data(name + '\n'))
+
+    def getvalue(self):
+        return b''.join(self.chunks)
+
+
+def _file_content(number, revision):
+    return 'file {}\nrevision {}\n'.format(number, revision)
+
+
+def make_stream(branches=10, tags=5, commits=50, qa_envs=2, files=20):
+    """Return the fast-import stream (bytes) for a synthetic history"""
+    stream = _Stream()
+    files = max(files, 1)
+    commits = max(commits, 1)
+    master_marks = []
+    master_marks.append(stream.commit(
+        'refs/heads/master',
+        'Initial commit\n',
+        [
+            ('src/file-{:04d}.txt'.format(i), _file_content(i, 0))
+            for i in range(files)
+        ]
+    ))
+    for i in range(1, commits):
+        number = i % files
+        master_marks.append(stream.commit(
+            'refs/heads/master',
+            'Change file {} ({})\n'.format(number, i),
+            [('src/file-{:04d}.txt'.format(number), _file_content(number, i))]
+        ))
+
+    if tags > 0:
+        step = max(len(master_marks) // tags, 1)
+        for mark in master_marks[step - 1::step][:tags]:
+            name = time.strftime('%Y-%m%d-%H%M%S', time.gmtime(START_TIME + 60 * mark))
+            stream.tag(name, mark)
+
+    feature_marks = []
+    for i in range(branches):
+        name = 'feature-{:04d}'.format(i + 1)
+        base = master_marks[(i * 7) % len(master_marks)]
+        feature_marks.append((name, stream.commit(
+            'refs/heads/{}'.format(name),
+            'Add {}\n'.format(name),
+            [('features/{}.txt'.format(name), '{}\n'.format(name))],
+            parent=base
+        )))
+
+    qa_names = QA_NAMES[:-1]
+    latest = {}
+    for i in range(qa_envs if feature_marks else 0):
+        contains = [
+            feature_marks[(i * FEATURES_PER_ENV + j) % len(feature_marks)]
+            for j in range(min(FEATURES_PER_ENV, len(feature_marks)))
+        ]
+        qa = qa_names[i % len(qa_names)]
+        name = '--'.join([qa, 'with'] + [branch for branch, _ in contains])
+        latest[qa] = stream.commit(
+            'refs/heads/{}'.format(name),
+            'Merge {} to {}\n'.format(', '.join([b for b, _ in contains]), qa),
+            [('features/{}.txt'.format(branch), '{}\n'.format(branch)) for branch, _ in contains],
+            parent=master_marks[-1],
+            merges=[mark for _, mark in contains]
+        )
+    for qa, mark in sorted(latest.items()):
+        stream.reset('refs/heads/{}'.format(qa), mark)
+    return stream.getvalue()
+
+
+def make_repo_pair(root, name='synthetic', branches=10, tags=5, commits=50, qa_envs=2,
+                   files=20):
+    """Create a bare remote and a clone of it under root
+
+    - root: directory to create the repos in (created if needed)
+    - name: name of the clone (the remote is <name>-remote.git); this is the
+      repo name that settings are looked up by
+    - branches: number of feature branches
+    - tags: number of annotated tags on master
+    - commits: number of commits on master
+    - qa_envs: number of qa--with--... branches
+    - files: number of files in the tree
+
+    Return dict with 'remote' and 'local' paths
+    """
+    remote_path = os.path.join(os.path.abspath(root), '{}-remote.git'.format(name))
+    local_path = os.path.join(os.path.abspath(root), name)
+    os.makedirs(root, exist_ok=True)
+    subprocess.run(['git', 'init', '-q', '--bare', remote_path], check=True)
+    subprocess.run(
+        ['git', '--git-dir', remote_path, 'symbolic-ref', 'HEAD', 'refs/heads/master'],
+        check=True
+    )
+    subprocess.run(
+        ['git', '--git-dir', remote_path, 'fast-import', '--quiet'],
+        input=make_stream(branches, tags, commits, qa_envs, files),
+        check=True
+    )
+    subprocess.run(['git', 'clone', '-q', remote_path, local_path], check=True)
+    subprocess.run(['git', '-C', local_path, 'config', 'user.name', 'Someone'], check=True)
+    subprocess.run(
+        ['git', '-C', local_path, 'config', 'user.email', 'someone@email.com'],
+        check=True
+    )
+    return {'remote': remote_path, 'local': local_path}
+
+
+@click.command()
+@click.argument('root', type=click.Path())
+@click.option('--name', default='synthetic', help='Name of the clone')
+@click.option('--branches', '-b', default=10, help='Number of feature branches')
+@click.option('--tags', '-t', default=5, help='Number of tags on master')
+@click.option('--commits', '-c', default=50, help='Number of commits on master')
+@click.option('--qa-envs', '-q', 'qa_envs', default=2, help='Number of qa--with--... branches')
+@click.option('--files', '-f', default=20, help='Number of files in the tree')
+def main(root, name, branches, tags, commits, qa_envs, files):
+    """Create a synthetic bare remote + clone pair under ROOT"""
+    start = time.time()
+    paths = make_repo_pair(root, name, branches, tags, commits, qa_envs, files)
+    print('Created {} (remote {}) in {:.1f}s'.format(
+        paths['local'], paths['remote'], time.time() - start
+    ))
+
+
+if __name__ == '__main__':
+    main()
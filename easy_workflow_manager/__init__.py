@@ -1,22 +1,68 @@
+import os
 import re
-import inspect
-import settings_helper as sh
-import input_helper as ih
-import fs_helper as fh
-import bg_helper as bh
-import dt_helper as dh
+import time
+import threading
+from contextlib import contextmanager
+from functools import wraps
 from io import StringIO
 from os.path import basename
-from pprint import pprint
+from easy_workflow_manager import merge_cache, queries, ref_cache
+from easy_workflow_manager.lazy import LazyModule
 
 
-logger = fh.get_logger(__name__)
-get_setting = sh.settings_getter(__name__)
-RX_NON_TAG = re.compile(r'.*-\d+-g[a-f0-9]+$')
-RX_CONFIG_URL = re.compile('^url\s*=\s*(\S+)$')
+sh = LazyModule('settings_helper')
+ih = LazyModule('input_helper')
+fh = LazyModule('fs_helper')
+command = LazyModule('easy_workflow_manager.command')
+dh = LazyModule('dt_helper')
+backends = LazyModule('easy_workflow_manager.backends')
 FUNCS_ALLOWED_TO_FORCE_PUSH = ('deploy_to_qa', 'merge_qa_to_source')
 FUNCS_ALLOWED_TO_FORCE_PUSH_TO_SOURCE = ('merge_qa_to_source', )
 REPO_SETTINGS_CACHE = {}
+_SETTINGS = {}
+FETCH_STATS = {'count': 0, 'skipped': 0, 'seconds': 0.0, 'last_fetch': None}
+_FETCH_STATE = {'depth': 0, 'fetched': set()}
+_PUSH_GRANTS = threading.local()
+_LOGGER_LOCK = threading.Lock()
+# Not used anymore (tags are read from refs/tags and the origin url comes from
+# the backends); kept for code that imports them
+RX_NON_TAG = re.compile(r'.*-\d+-g[a-f0-9]+$')
+RX_CONFIG_URL = re.compile(r'^url\s*=\s*(\S+)$')
+RX_PUSH_MISSING_REF = re.compile(r"unable to delete '([^']+)': remote ref does not exist")
+RX_SHA = re.compile(r'^[0-9a-f]{40}$')
+RX_GREP_LITERAL = re.compile(r'[^.^$*+?{}|()\[\]\\]*')
+MAX_PREFIX_CASE_VARIANTS = 16
+MAX_BRANCH_PREFIXES = 64
+RX_DELETED_LOCAL_BRANCH = re.compile(r'^Deleted branch (\S+) ', re.MULTILINE)
+REPO_INFO_FIELDS = (
+    'path', 'url', 'branch', 'branch_date', 'branch_tracking',
+    'branch_tracking_date', 'last_tag', 'status', 'stashes', 'unpushed',
+    'commits_since_last_tag', 'commits_since_last_tag_summary',
+)
+
+
+def __getattr__(name):
+    """Create the module logger the first time it is used
+
+    The logger is stored as a module global, so this only runs once (each
+    fh.get_logger call adds more handlers to the same logger)
+    """
+    if name == 'logger':
+        with _LOGGER_LOCK:
+            if 'logger' not in globals():
+                globals()['logger'] = fh.get_logger(__name__)
+        return globals()['logger']
+    raise AttributeError('module {} has no attribute {}'.format(repr(__name__), repr(name)))
+
+
+def get_setting(*args, **kwargs):
+    """Return a setting from the settings.ini file (or environment variable)
+
+    The settings file is found and parsed the first time this is called
+    """
+    if 'getter' not in _SETTINGS:
+        _SETTINGS['getter'] = sh.settings_getter(__name__)
+    return _SETTINGS['getter'](*args, **kwargs)
 
 
 def _get_repo_settings(setting='', repo=''):
@@ -38,6 +84,12 @@ def _get_repo_settings(setting='', repo=''):
         REPO_SETTINGS_CACHE[repo]['LOCAL_BRANCH'] = get_setting('LOCAL_BRANCH', section=repo)
         REPO_SETTINGS_CACHE[repo]['SOURCE_BRANCH'] = get_setting('SOURCE_BRANCH', section=repo)
         REPO_SETTINGS_CACHE[repo]['TAG_BRANCH'] = get_setting('TAG_BRANCH', section=repo)
+        REPO_SETTINGS_CACHE[repo]['REF_CACHE_SECONDS'] = get_setting('REF_CACHE_SECONDS', default=60, section=repo)
+        REPO_SETTINGS_CACHE[repo]['FETCH_WINDOW_SECONDS'] = get_setting('FETCH_WINDOW_SECONDS', default=30, section=repo)
+        REPO_SETTINGS_CACHE[repo]['GIT_BACKEND'] = get_setting('GIT_BACKEND', default='python', section=repo)
+        REPO_SETTINGS_CACHE[repo]['USE_WORKTREE'] = get_setting('USE_WORKTREE', default=False, section=repo)
+        REPO_SETTINGS_CACHE[repo]['MERGE_CACHE_SECONDS'] = get_setting('MERGE_CACHE_SECONDS', default=604800, section=repo)
+        REPO_SETTINGS_CACHE[repo]['MERGE_CACHE_ENTRIES'] = get_setting('MERGE_CACHE_ENTRIES', default=50, section=repo)
         REPO_SETTINGS_CACHE[repo]['RX_QA_PREFIX'] = re.compile('^(' + '|'.join(QA_BRANCHES) + ').*')
         REPO_SETTINGS_CACHE[repo]['NON_SELECTABLE_BRANCHES'] = set(QA_BRANCHES + IGNORE_BRANCHES)
     if setting:
@@ -47,64 +99,389 @@ def _get_repo_settings(setting='', repo=''):
     return result
 
 
-def get_remote_branches(grep='', all_branches=False):
+def get_backend():
+    """Return the backend that answers read-only git queries
+
+    The GIT_BACKEND setting picks one of
+
+    - 'python': read .git files in-process, falling back to subprocess
+    - 'coprocess': answer object lookups (commit dates, tag messages) through
+      long-lived `git cat-file --batch` processes, falling back to subprocess
+    - 'subprocess': always run git
+    """
+    name = _get_repo_settings('GIT_BACKEND')
+    return backends.BACKENDS.get(name, backends.BACKENDS['python'])
+
+
+@contextmanager
+def workflow_operation():
+    """Context manager for a top-level operation; nested fetches share one fetch
+
+    While inside, fetch_all only does a real `git fetch` the first time it is
+    called for a repo. Operations may be nested; the record of which repos were
+    fetched is cleared when the outermost one exits.
+    """
+    _FETCH_STATE['depth'] += 1
+    try:
+        yield
+    finally:
+        _FETCH_STATE['depth'] -= 1
+        if _FETCH_STATE['depth'] == 0:
+            _FETCH_STATE['fetched'].clear()
+
+
+def _workflow_operation(func):
+    """Decorator to run func inside of workflow_operation"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with workflow_operation():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def _force_push_grant(name):
+    """Context manager that lets force_push_local run on behalf of name
+
+    - name: name of the function granting the push (must be in
+      FUNCS_ALLOWED_TO_FORCE_PUSH for force_push_local to do anything)
+
+    Grants are per thread and only last until the block exits
+    """
+    grants = _PUSH_GRANTS.__dict__.setdefault('stack', [])
+    grants.append(name)
+    try:
+        yield
+    finally:
+        grants.pop()
+
+
+def _grants_force_push(func):
+    """Decorator to run func inside of _force_push_grant(func.__name__)"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with _force_push_grant(func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def fetch_all(force=False, show=False, die=False):
+    """Do a `git fetch --all --prune`, unless a fetch was done very recently
+
+    - force: if True, always fetch
+    - show: if True, show the command and its output
+    - die: if True, raise Exception if the fetch fails
+
+    The fetch is skipped if FETCH_HEAD was written in the last
+    FETCH_WINDOW_SECONDS, or if this repo was already fetched during the current
+    workflow_operation. Counts and time spent are tracked in FETCH_STATS.
+
+    Return True if a fetch was run
+    """
+    git_dir = get_git_dir()
+    if not force and git_dir and _fetch_was_recent(git_dir):
+        FETCH_STATS['skipped'] += 1
+        return False
+
+    cmd = ['git', 'fetch', '--all', '--prune']
+    start = time.time()
+    try:
+        if die:
+            command.run_or_die(cmd, show=show)
+        else:
+            command.run(cmd, show=show, quiet=not show)
+    finally:
+        FETCH_STATS['count'] += 1
+        FETCH_STATS['seconds'] += time.time() - start
+        FETCH_STATS['last_fetch'] = time.time()
+    if _FETCH_STATE['depth'] > 0 and git_dir:
+        _FETCH_STATE['fetched'].add(git_dir)
+    return True
+
+
+def _fetch_was_recent(git_dir):
+    """Return True if git_dir was already fetched during the current
+    workflow_operation, or if FETCH_HEAD was written in the last
+    FETCH_WINDOW_SECONDS"""
+    if _FETCH_STATE['depth'] > 0 and git_dir in _FETCH_STATE['fetched']:
+        return True
+    window = _get_repo_settings('FETCH_WINDOW_SECONDS')
+    try:
+        age = time.time() - os.stat(os.path.join(git_dir, 'FETCH_HEAD')).st_mtime
+    except OSError:
+        return False
+    return bool(window) and 0 <= age < window
+
+
+def _fetch_branch_prefixes(prefixes, use_window=False):
+    """Fetch only the remote branches whose names start with one of prefixes
+
+    - prefixes: list of branch name prefixes
+    - use_window: if True, skip the fetch if all of the prefixes were fetched
+      (by any process) in the last FETCH_WINDOW_SECONDS
+
+    The matching branches are fetched with --prune (so deleted branches are
+    dropped), and git sends the prefixes to the server (protocol v2
+    ref-prefix), so the server only advertises matching refs. FETCH_HEAD isn't
+    written, so this doesn't count as a recent fetch for fetch_all; the fetch
+    times are kept in the ref cache directory instead (see
+    ref_cache.get_fetch_times).
+
+    Return True if the fetch was successful (or skipped)
+    """
+    git_dir = get_git_dir()
+    if use_window:
+        window = _get_repo_settings('FETCH_WINDOW_SECONDS')
+        fetch_times = ref_cache.get_fetch_times(git_dir)
+        age = time.time() - min([fetch_times.get(prefix, 0) for prefix in prefixes] or [0])
+        if window and 0 <= age < window:
+            FETCH_STATS['skipped'] += 1
+            return True
+    cmd = ['git', 'fetch', '--prune', '--no-tags', '--no-write-fetch-head', 'origin'] + [
+        '+refs/heads/{0}*:refs/remotes/origin/{0}*'.format(prefix)
+        for prefix in prefixes
+    ]
+    start = time.time()
+    try:
+        ret_code = command.run(cmd, quiet=True)
+    finally:
+        FETCH_STATS['count'] += 1
+        FETCH_STATS['seconds'] += time.time() - start
+        FETCH_STATS['last_fetch'] = time.time()
+    if ret_code != 0:
+        return False
+    ref_cache.put_fetch_times(git_dir, prefixes, start)
+    return True
+
+
+def get_fetch_stats():
+    """Return a dict with the number of fetches run/skipped and seconds spent"""
+    return FETCH_STATS.copy()
+
+
+def _get_cached_refs(key, func, refresh=False):
+    """Return the listing generated by func, using the on-disk ref cache if fresh
+
+    - key: name of the cached listing
+    - func: callable that generates the listing
+    - refresh: if True, ignore any cached listing and regenerate it
+
+    Listings are only cached for REF_CACHE_SECONDS and are invalidated whenever
+    packed-refs, FETCH_HEAD, or anything under refs/remotes or refs/tags changes
+    """
+    git_dir = get_git_dir()
+    ttl = _get_repo_settings('REF_CACHE_SECONDS')
+    if not git_dir or not ttl:
+        return func()
+    signature = ref_cache.get_signature(git_dir)
+    if not refresh:
+        value = ref_cache.get(git_dir, key, ttl, signature)
+        if value is not None:
+            return value
+    value = func()
+    if value:
+        ref_cache.put(git_dir, key, value, signature)
+    return value
+
+
+def _has_cached_refs(key):
+    """Return True if the on-disk ref cache has a fresh listing for key"""
+    git_dir = get_git_dir()
+    ttl = _get_repo_settings('REF_CACHE_SECONDS')
+    if not git_dir or not ttl:
+        return False
+    return ref_cache.get(git_dir, key, ttl, ref_cache.get_signature(git_dir)) is not None
+
+
+def _ls_remote_heads():
+    """Return list of all branch names on origin (via git ls-remote --heads)"""
+    output = command.run_output(queries.LS_REMOTE_HEADS, stderr=False)
+    return list(queries.parse_remote_heads(queries.split_lines(output)))
+
+
+def get_remote_branches(grep='', all_branches=False, refresh=False):
     """Return list of remote branch names (via git ls-remote --heads)
 
     - grep: grep pattern to filter branches by (case-insensitive)
     - all_branches: if True, don't filter out non-selectable branches or branches
       prefixed by a qa branch
+    - refresh: if True, don't use the on-disk ref cache
+
+    When every alternative of grep is anchored to literal text (i.e. '^qa1--')
+    and there is no fresh cached listing, only branches with those prefixes are
+    listed (see _get_remote_branches_with_prefixes); otherwise all branches are
+    listed and filtered here. Nothing is fetched either way.
 
     Results are alphabetized
     """
-    cmd = 'git ls-remote --heads 2>/dev/null | cut -f 2- | cut -c 12- | grep -iE {}'.format(
-        repr(grep)
-    )
-    output = bh.run_output(cmd)
-    branches = []
+    prefixes = _get_literal_prefixes(grep) if grep else None
+    if prefixes and (refresh or not _has_cached_refs('ls-remote-heads')):
+        output = _get_remote_branches_with_prefixes(prefixes)
+    else:
+        output = _get_cached_refs('ls-remote-heads', _ls_remote_heads, refresh=refresh)
     if not output:
-        return branches
-    RX_QA_PREFIX = _get_repo_settings('RX_QA_PREFIX')
-    NON_SELECTABLE_BRANCHES = _get_repo_settings('NON_SELECTABLE_BRANCHES')
-    for branch in re.split('\r?\n', output):
+        return []
+    return _filter_branches(output, grep=grep, all_branches=all_branches)
+
+
+def _get_literal_prefixes(grep):
+    """Return list of branch name prefixes that anything matching grep starts
+    with, or None if grep doesn't allow narrowing it down
+
+    Every alternative of grep (split on '|') must be anchored with '^' and
+    start with literal text, i.e. '^qa1$|^qa1--'. Since grep is case-insensitive,
+    each prefix is expanded into its upper/lower case variants (after being
+    shortened so there are at most MAX_PREFIX_CASE_VARIANTS of them)
+    """
+    if any([char in grep for char in '()[]\\']):
+        return
+    prefixes = set()
+    for part in grep.split('|'):
+        if not part.startswith('^'):
+            return
+        literal = RX_GREP_LITERAL.match(part, 1).group(0)
+        if part[1 + len(literal):1 + len(literal) + 1] in ('*', '?', '{'):
+            literal = literal[:-1]
+        variants = ['']
+        for char in literal:
+            cases = sorted(set([char.lower(), char.upper()]))
+            if len(variants) * len(cases) > MAX_PREFIX_CASE_VARIANTS:
+                break
+            variants = [variant + case for variant in variants for case in cases]
+        if not variants[0]:
+            return
+        prefixes.update(variants)
+    prefixes = [
+        prefix for prefix in sorted(prefixes)
+        if not any([prefix.startswith(p) for p in prefixes if p != prefix])
+    ]
+    if len(prefixes) > MAX_BRANCH_PREFIXES:
+        return
+    return prefixes
+
+
+def _get_remote_branches_with_prefixes(prefixes):
+    """Return sorted list of remote branch names that start with any of prefixes
+    (via git ls-remote --heads origin 'refs/heads/<prefix>*' ...)
+
+    Like the full listing, this only reads the remote's refs (no objects are
+    transferred and no local refs change); git does the prefix matching, so
+    the non-matching names never reach Python
+    """
+    cmd = queries.LS_REMOTE_HEADS + ('origin', ) + tuple([
+        'refs/heads/{}*'.format(prefix) for prefix in prefixes
+    ])
+    output = command.run_output(cmd, stderr=False)
+    return sorted(queries.parse_remote_heads(queries.split_lines(output)))
+
+
+def iter_remote_branches(grep='', all_branches=False):
+    """Yield remote branch names as `git ls-remote --heads` lists them
+
+    - grep: grep pattern to filter branches by (case-insensitive)
+    - all_branches: if True, don't filter out non-selectable branches or branches
+      prefixed by a qa branch
+
+    Unlike get_remote_branches, the on-disk ref cache isn't used and the first
+    names are available before the whole listing has been read
+    """
+    branches = queries.parse_remote_heads(command.iter_output(queries.LS_REMOTE_HEADS))
+    yield from _iter_filtered_branches(branches, grep=grep, all_branches=all_branches)
+
+
+def _iter_filtered_branches(branches, grep='', all_branches=False, repo=''):
+    """Yield the branch names that match grep (and are selectable, unless
+    all_branches is True)
+
+    - repo: name of the repo to use settings for (default is current repo)
+    """
+    rx_grep = re.compile(grep, re.IGNORECASE) if grep else None
+    RX_QA_PREFIX = _get_repo_settings('RX_QA_PREFIX', repo=repo)
+    NON_SELECTABLE_BRANCHES = _get_repo_settings('NON_SELECTABLE_BRANCHES', repo=repo)
+    for branch in branches:
+        if rx_grep and not rx_grep.search(branch):
+            continue
         if all_branches:
-            branches.append(branch)
+            yield branch
         elif not RX_QA_PREFIX.match(branch) and branch not in NON_SELECTABLE_BRANCHES:
-            branches.append(branch)
-    return branches
+            yield branch
+
+
+def _filter_branches(branches, grep='', all_branches=False, repo=''):
+    """Return list of the branch names that match grep (see _iter_filtered_branches)"""
+    return list(_iter_filtered_branches(branches, grep, all_branches, repo))
+
 
+def _for_each_ref(ref_prefix):
+    """Return list of dicts for all refs under ref_prefix (via git for-each-ref)"""
+    output = command.run_output(queries.refs_with_times(ref_prefix), stderr=False)
+    return queries.parse_refs_with_times(output, ref_prefix)
 
-def get_remote_branches_with_times(grep='', all_branches=False, fetch=True):
+
+def get_refs_with_times(ref_prefix, grep='', refresh=False):
+    """Return list of dicts with ref names, commit ids, and last update times
+
+    - ref_prefix: ref namespace to list (i.e. 'refs/heads', 'refs/remotes/origin')
+    - grep: grep pattern to filter names by (case-insensitive)
+    - refresh: if True, don't use the on-disk ref cache
+
+    All refs under ref_prefix are read with a single `git for-each-ref` call, so
+    this costs one subprocess no matter how many refs there are. The 'branch'
+    key of each dict is the ref name with ref_prefix removed. Listings of
+    refs/remotes and refs/tags are served from the on-disk ref cache when fresh.
+
+    Results are ordered by most recent commit
+    """
+    ref_prefix = ref_prefix.rstrip('/')
+    if ref_prefix.startswith(ref_cache.WATCHED_DIRS):
+        results = _get_cached_refs(
+            'for-each-ref:' + ref_prefix,
+            lambda: _for_each_ref(ref_prefix),
+            refresh=refresh
+        )
+    else:
+        results = _for_each_ref(ref_prefix)
+    return queries.filter_refs(results, grep)
+
+
+def get_remote_branches_with_times(grep='', all_branches=False, fetch=True, refresh=False):
     """Return list of dicts with remote branch names and last update time
 
     - grep: grep pattern to filter branches by (case-insensitive)
     - all_branches: if True, don't filter out non-selectable branches or branches
       prefixed by a qa branch
-    - fetch: if True, do a `git fetch` before calling get_remote_branches
+    - fetch: if True, do a `git fetch` (see fetch_all) before reading the remote
+      tracking refs
+    - refresh: if True, don't use the on-disk ref cache
 
     Results are ordered by most recent commit
     """
-    results = []
     if fetch:
-        bh.run('git fetch --all --prune >/dev/null 2>&1')
-    for branch in get_remote_branches(grep, all_branches=all_branches):
-        if not branch:
-            continue
-        time_data = get_branch_date('origin/{}'.format(branch))
-        results.append({
-            'branch': branch,
-            'time': time_data
-        })
-    ih.sort_by_keys(results, 'time', reverse=True)
-    return results
+        fetch_all()
+    results = get_refs_with_times('refs/remotes/origin', grep=grep, refresh=refresh)
+    if all_branches:
+        return results
+    RX_QA_PREFIX = _get_repo_settings('RX_QA_PREFIX')
+    NON_SELECTABLE_BRANCHES = _get_repo_settings('NON_SELECTABLE_BRANCHES')
+    return [
+        result
+        for result in results
+        if not RX_QA_PREFIX.match(result['branch'])
+        and result['branch'] not in NON_SELECTABLE_BRANCHES
+    ]
 
 
-def get_qa_env_branches(qa='', display=False, all_qa=False):
+def get_qa_env_branches(qa='', display=False, all_qa=False, refresh=False):
     """Return a list of dicts with info relating to what is on specified qa env
 
     - qa: name of qa branch that has things pushed to it
         - if no name is passed in assume all_qa=True
     - display: if True, print the info to the screen
     - all_qa: if True and no qa passed in, return info for all qa envs
+    - refresh: if True, don't use the on-disk ref cache
+
+    All qa envs are read from one listing of the remote tracking refs (after a
+    single fetch) and grouped by the qa prefix of each `qa--with--a--b` name
     """
     QA_BRANCHES = _get_repo_settings('QA_BRANCHES')
     if qa:
@@ -116,15 +493,15 @@ def get_qa_env_branches(qa='', display=False, all_qa=False):
     if all_qa:
         qa_branches = QA_BRANCHES
 
+    _fetch_qa_branches(qa_branches)
+    env_branches_by_qa = _group_qa_env_branches(
+        get_remote_branches_with_times(all_branches=True, fetch=False, refresh=refresh),
+        qa_branches
+    )
+
     full_results = []
-    bh.run('git fetch --all --prune >/dev/null 2>&1')
     for qa_name in qa_branches:
-        results = []
-        for branch in get_remote_branches_with_times(grep='^{}--'.format(qa_name), all_branches=True, fetch=False):
-            _qa, _, *env_branches = branch['branch'].split('--')
-            branch['contains'] = env_branches
-            results.append(branch)
-
+        results = env_branches_by_qa[qa_name]
         if results and display:
             print('\nEnvironment: {} ({})'.format(qa_name, results[0]['time']))
             for branch in results[0]['contains']:
@@ -138,30 +515,67 @@ def get_qa_env_branches(qa='', display=False, all_qa=False):
     return full_results
 
 
-def get_non_empty_qa():
-    """Return a set of all QA branches with something deployed"""
+def _fetch_qa_branches(qa_branches):
+    """Fetch the remote qa branches (and their `qa--with--...` branches) unless
+    fetch_all would skip fetching
+
+    Only refs starting with the qa names are fetched; if that fails, fetch_all
+    is used
+    """
+    git_dir = get_git_dir()
+    if git_dir and _fetch_was_recent(git_dir):
+        FETCH_STATS['skipped'] += 1
+    elif not _fetch_branch_prefixes(qa_branches, use_window=True):
+        fetch_all()
+
+
+def _group_qa_env_branches(refs, qa_branches):
+    """Return dict of qa name -> list of its `qa--with--a--b` refs (with a
+    'contains' key added), from a list of dicts like get_refs_with_times returns
+
+    - qa_branches: list of qa names to include
+    """
+    env_branches_by_qa = dict([(qa_name, []) for qa_name in qa_branches])
+    for branch in refs:
+        if '--' not in branch['branch']:
+            continue
+        _qa, _, *env_branches = branch['branch'].split('--')
+        if _qa in env_branches_by_qa:
+            branch['contains'] = env_branches
+            env_branches_by_qa[_qa].append(branch)
+    return env_branches_by_qa
+
+
+def get_non_empty_qa(refresh=False):
+    """Return a set of all QA branches with something deployed
+
+    - refresh: if True, don't use the on-disk ref cache
+    """
     return set([
         eb['branch'].split('--', 1)[0]
-        for eb in get_qa_env_branches()
+        for eb in get_qa_env_branches(refresh=refresh)
     ])
 
 
-def get_empty_qa():
-    """Return a set of all QA branches with nothing deployed"""
+def get_empty_qa(refresh=False):
+    """Return a set of all QA branches with nothing deployed
+
+    - refresh: if True, don't use the on-disk ref cache
+    """
     QA_BRANCHES = _get_repo_settings('QA_BRANCHES')
-    non_empty = get_non_empty_qa()
+    non_empty = get_non_empty_qa(refresh=refresh)
     return set(QA_BRANCHES) - non_empty
 
 
 def get_local_branches(grep=''):
-    """Return list of local branch names (via git branch)
+    """Return list of local branch names (like git branch)
 
     - grep: grep pattern to filter branches by (case-insensitive)
     """
-    output = bh.run_output('git branch | cut -c 3- | grep -iE {}'.format(repr(grep)))
-    if not output:
-        return []
-    branches = re.split('\r?\n', output)
+    branches = get_backend().local_branches()
+    if grep:
+        rx_grep = re.compile(grep, re.IGNORECASE)
+        branches = [branch for branch in branches if rx_grep.search(branch)]
     return branches
 
 
@@ -169,54 +583,44 @@ def get_local_branches_with_times(grep=''):
     """Return list of dicts with local branch names and last update time
 
     - grep: grep pattern to filter branches by (case-insensitive)
+
+    Results are ordered by most recent commit
     """
-    results = []
-    for branch in get_local_branches(grep):
-        if not branch:
-            continue
-        time_data = get_branch_date(branch)
-        results.append({
-            'branch': branch,
-            'time': time_data
-        })
-    ih.sort_by_keys(results, 'time', reverse=True)
-    return results
+    return get_refs_with_times('refs/heads', grep=grep)
 
 
 def get_merged_remote_branches():
     """Return a list of branches on origin that have been merged into SOURCE_BRANCH"""
     SOURCE_BRANCH = _get_repo_settings('SOURCE_BRANCH')
-    bh.run('git fetch --all --prune >/dev/null 2>&1')
-    cmd = 'git branch -r --merged origin/{} | grep -v origin/{} | cut -c 10-'.format(
-        SOURCE_BRANCH, SOURCE_BRANCH
-    )
-    output = bh.run_output(cmd)
-    branches = []
-    if not output:
-        return branches
-    branches = re.split('\r?\n', output)
-    return branches
+    fetch_all()
+    cmd = [
+        'git', 'for-each-ref', '--merged', 'origin/{}'.format(SOURCE_BRANCH),
+        '--format=%(refname:strip=3)', 'refs/remotes/origin'
+    ]
+    return [
+        branch
+        for branch in command.run_output(cmd, stderr=False).splitlines()
+        if branch and branch not in ('HEAD', SOURCE_BRANCH)
+    ]
 
 
 def get_merged_local_branches():
     """Return a list of local branches that have been merged into SOURCE_BRANCH"""
     SOURCE_BRANCH = _get_repo_settings('SOURCE_BRANCH')
-    cmd = 'git branch --merged {} | cut -c 3- | grep -v "^{}$"'.format(
-        SOURCE_BRANCH, SOURCE_BRANCH
-    )
-    output = bh.run_output(cmd)
-    branches = []
-    if not output:
-        return branches
-    branches = re.split('\r?\n', output)
-    return branches
+    cmd = [
+        'git', 'for-each-ref', '--merged', SOURCE_BRANCH,
+        '--format=%(refname:strip=2)', 'refs/heads'
+    ]
+    return [
+        branch
+        for branch in command.run_output(cmd, stderr=False).splitlines()
+        if branch and branch != SOURCE_BRANCH
+    ]
 
 
 def get_branch_name():
     """Return current branch name"""
-    output = bh.run_output('git rev-parse --abbrev-ref HEAD')
-    output = 'HEAD' if output.startswith('fatal:') else output
-    return output
+    return get_backend().branch_name()
 
 
 def get_branch_date(branch):
@@ -224,15 +628,18 @@ def get_branch_date(branch):
 
     Prefix branch name with 'origin/' to get date info of remote branch
     """
-    cmd = 'git show --format="%ci %cr" {} | head -n 1'.format(branch)
-    return bh.run_output(cmd)
+    return get_backend().branch_date(branch)
 
 
-def get_tracking_branch():
-    """Return remote tracking branch for current branch"""
-    branch = get_branch_name()
-    cmd = 'git branch -r | grep "/{}$" | grep -v HEAD'.format(branch)
-    return bh.run_output(cmd)
+def get_tracking_branch(branch=''):
+    """Return remote tracking branch for current branch
+
+    - branch: name of the current branch, if already known
+    """
+    if not branch:
+        branch = get_branch_name()
+    output = command.run_output(queries.REMOTE_REF_NAMES, stderr=False)
+    return queries.parse_tracking_branch(output, branch)
 
 
 def get_local_repo_path():
@@ -245,53 +652,59 @@ def get_local_repo_name():
     return basename(fh.repopath())
 
 
-def get_origin_url():
-    """Return url to remote origin (from .git/config file)"""
+def get_git_dir():
+    """Return path to the .git directory of local repository
+
+    If .git is a file (worktree or submodule checkout), the gitdir it points to
+    is returned
+    """
     local_path = get_local_repo_path()
     if not local_path:
         return
-    cmd = 'grep "remote \\"origin\\"" -A 2 {}/.git/config | grep url'.format(
-        local_path
-    )
-    output = bh.run_output(cmd)
-    match = RX_CONFIG_URL.match(output)
-    if match:
-        return match.group(1)
-    return ''
+    return _get_git_dir_at(local_path)
+
+
+def _get_git_dir_at(local_path):
+    """Return path to the .git directory of the repo at local_path"""
+    git_dir = os.path.join(local_path, '.git')
+    if os.path.isfile(git_dir):
+        with open(git_dir, 'r') as fp:
+            text = fp.read().strip()
+        if text.startswith('gitdir:'):
+            git_dir = os.path.normpath(os.path.join(local_path, text[7:].strip()))
+    return git_dir
+
+
+def get_origin_url():
+    """Return url to remote origin (from .git/config file)"""
+    return get_backend().origin_url()
 
 
 def get_unpushed_commits():
     """Return a list of any local commits that have not been pushed"""
-    cmd = 'git log --find-renames --no-merges --oneline @{u}.. 2>/dev/null'
-    output = bh.run_output(cmd)
-    commits = []
-    if output:
-        commits = re.split('\r?\n', output)
-    return commits
+    return queries.split_lines(command.run_output(queries.UNPUSHED, stderr=False))
 
 
 def get_untracked_files():
     """Return a list of any local files that are not tracked in the git repo"""
-    cmd = 'git ls-files -o --exclude-standard'
-    output = bh.run_output(cmd)
-    files = []
-    if output:
-        files = re.split('\r?\n', output)
-    return files
+    return list(iter_untracked_files())
+
+
+def iter_untracked_files():
+    """Yield any local files that are not tracked in the git repo, as git finds them"""
+    for line in command.iter_output(['git', 'ls-files', '-o', '--exclude-standard']):
+        if line:
+            yield line
 
 
 def get_first_commit_id():
     """Get the first commit id for the repo"""
-    output = bh.run_output('git rev-list --max-parents=0 HEAD')
-    output = '' if output.startswith('fatal:') else output
-    return output
+    return get_backend().first_commit_id()
 
 
 def get_last_commit_id():
     """Get the last commit id for the repo"""
-    output = bh.run_output('git log --no-merges  --format="%h" -1')
-    output = '' if output.startswith('fatal:') else output
-    return output
+    return get_backend().last_commit_id()
 
 
 def get_commits_since_last_tag(until=''):
@@ -301,57 +714,192 @@ def get_commits_since_last_tag(until=''):
 
     If no tag has been made, returns a list of commits since the first commit
     """
+    return list(iter_commits_since_last_tag(until=until))
+
+
+def iter_commits_since_last_tag(until=''):
+    """Yield commits made since last_tag (newest first), as git log finds them
+
+    - until: a recent commit id to stop at (instead of last commit)
+
+    If no tag has been made, yields commits since the first commit
+    """
+    commit_range = _get_range_since_last_tag(until=until)
+    if not commit_range:
+        return
+    for line in command.iter_output(queries.commits(commit_range)):
+        if line:
+            yield line
+
+
+def get_commits_since_last_tag_summary(n=10, until=''):
+    """Return dict with the number of commits made since last_tag and the newest n
+
+    - n: max number of commits to include
+    - until: a recent commit id to stop at (instead of last commit)
+
+    The dict has 'count' (total number of commits) and 'commits' (list of at
+    most n commits, newest first). The range is counted with `git rev-list
+    --count`, and only the n commits that are returned are read by git log
+    """
+    commit_range = _get_range_since_last_tag(until=until)
+    if not commit_range:
+        return queries.make_commit_summary(0, '')
+    count = queries.parse_count(
+        command.run_output(queries.count_commits(commit_range), stderr=False)
+    )
+    commits = ''
+    if count and n > 0:
+        commits = command.run_output(queries.commits(commit_range, n=n), stderr=False)
+    return queries.make_commit_summary(count, commits)
+
+
+def _get_range_since_last_tag(until=''):
+    """Return 'tag..until' for the commits made since last_tag (or since the
+    first commit if no tag has been made), or '' if there are no commits
+
+    - until: a recent commit id to stop at (instead of last commit)
+    """
     tag = get_last_tag()
-    commits = []
-    if not tag:
-        tag = get_first_commit_id()
-        if not tag:
-            return commits
+    first_commit = '' if tag else get_first_commit_id()
+    if not tag and not first_commit:
+        return ''
     if not until:
         until = get_last_commit_id()
-    cmd = 'git log --find-renames --no-merges --oneline {}..{}'.format(tag, until)
-    output = bh.run_output(cmd)
-    if output:
-        commits = re.split('\r?\n', output)
-    return commits
+    return queries.make_commit_range(tag, first_commit, until)
 
 
 def get_stashlist():
     """Return a list of any local stashes"""
-    cmd = 'git stash list'
-    output = bh.run_output(cmd)
-    stashes = []
-    if output:
-        stashes = re.split('\r?\n', output)
-    return stashes
+    return queries.split_lines(command.run_output(queries.STASH_LIST, stderr=False))
 
 
 def get_status():
     """Return a list of any modified or untracked files"""
-    cmd = 'git status -s'
-    output = bh.run_output(cmd)
+    return list(iter_status())
+
+
+def iter_status():
+    """Yield any modified or untracked files (lines of `git status -s`)"""
+    yield from queries.parse_status(command.iter_output(queries.STATUS))
+
+
+def _read_tag_refs(*tags, dates=True):
+    """Return list of [tag, object id, creation timestamp] (via git for-each-ref)
+
+    - tags: names of tags to read (all tags if none are given)
+    - dates: if False, don't read the tag objects to get creation timestamps
+      (timestamps will be 0)
+
+    The tags are passed as full refs, but git still treats them as patterns
+    (glob chars, or 'v1' matching 'v1/...'), so only exact matches are kept
+    """
+    fmt = '%(refname)%09%(objectname)'
+    if dates:
+        fmt += '%09%(creatordate:unix)'
+    wanted = set(['refs/tags/' + tag for tag in tags])
+    cmd = ['git', 'for-each-ref', '--format=' + fmt] + (sorted(wanted) or ['refs/tags'])
+    output = command.run_output(cmd, stderr=False)
     results = []
-    if output:
-        results = re.split('\r?\n\s*', output)
+    if not output:
+        return results
+    for line in re.split('\r?\n', output):
+        parts = line.split('\t')
+        if len(parts) < 2 or (wanted and parts[0] not in wanted):
+            continue
+        timestamp = parts[2] if len(parts) > 2 else ''
+        results.append([parts[0][10:], parts[1], int(timestamp or 0)])
     return results
 
 
-def get_tags():
-    """Return a list of all tags with most recent first"""
-    cmd = 'git describe --tags $(git rev-list --tags) 2>/dev/null'
-    output = bh.run_output(cmd)
-    tags = []
-    if not output:
-        return tags
-    for tag in re.split('\r?\n', output):
-        if not RX_NON_TAG.match(tag):
-            tags.append(tag)
+def _get_tag_index(refresh=False):
+    """Return list of [tag, object id, creation timestamp] for all tags, newest first
+
+    - refresh: if True, rebuild the index from scratch
+
+    The index is kept in the on-disk ref cache. When the tag refs change, only
+    tags that are new (or were moved) have their tag objects read; a full
+    rebuild happens when there is no usable index or too many tags changed
+    """
+    git_dir = get_git_dir()
+    use_cache = git_dir and _get_repo_settings('REF_CACHE_SECONDS')
+    entry = None
+    if use_cache:
+        signature = ref_cache.get_signature(git_dir)
+        if not refresh:
+            entry = ref_cache.get_entry(git_dir, 'tag-index')
+        if entry and entry.get('signature') == signature:
+            return entry['value']
+
+    if entry:
+        known = dict([
+            ((tag, sha), timestamp)
+            for tag, sha, timestamp in entry['value']
+        ])
+        index = _read_tag_refs(dates=False)
+        changed = [
+            tag
+            for tag, sha, _ in index
+            if (tag, sha) not in known
+        ]
+        if len(changed) > 100:
+            index = _read_tag_refs()
+        else:
+            new_dates = {}
+            if changed:
+                new_dates = dict([
+                    ((tag, sha), timestamp)
+                    for tag, sha, timestamp in _read_tag_refs(*changed)
+                ])
+            for item in index:
+                key = (item[0], item[1])
+                item[2] = known.get(key, new_dates.get(key, 0))
+    else:
+        index = _read_tag_refs()
+
+    index.sort(key=lambda item: (item[2], item[0]), reverse=True)
+    if use_cache:
+        ref_cache.put(git_dir, 'tag-index', index, signature)
+    return index
+
+
+def get_tags(limit=None, refresh=False):
+    """Return a list of all tags with most recent first
+
+    - limit: max number of tags to return
+    - refresh: if True, rebuild the tag index instead of updating it
+
+    Tags are ordered by creation date (tagger date for annotated tags, commit
+    date for lightweight tags)
+    """
+    tags = [tag for tag, _, _ in _get_tag_index(refresh=refresh)]
+    if limit:
+        tags = tags[:limit]
     return tags
 
 
+def iter_tags():
+    """Yield all tags with most recent first (same order as get_tags)
+
+    Tags come from the tag index when it is up to date; otherwise they are
+    read from a `git for-each-ref` as git lists them
+    """
+    git_dir = get_git_dir()
+    if git_dir and _get_repo_settings('REF_CACHE_SECONDS'):
+        entry = ref_cache.get_entry(git_dir, 'tag-index')
+        if entry and entry.get('signature') == ref_cache.get_signature(git_dir):
+            for tag, _, _ in entry['value']:
+                yield tag
+            return
+    for line in command.iter_output(queries.tags()):
+        if line:
+            yield line
+
+
 def get_last_tag():
     """Return the most recent tag made"""
-    return bh.run_output('git describe --tags $(git rev-list --tags --max-count=1 2>/dev/null) 2>/dev/null')
+    tags = get_tags(limit=1)
+    return tags[0] if tags else ''
 
 
 def get_tag_message(tag=''):
@@ -363,72 +911,262 @@ def get_tag_message(tag=''):
         tag = get_last_tag()
         if not tag:
             return
-    output = bh.run_output('git tag -n99 {}'.format(tag))
+    output = get_backend().tag_listing(tag)
     return output.replace(tag, '').strip()
 
 
-def get_repo_info_dict():
-    """Return a dict of info about the repo"""
+def get_repo_info_dict(fields=None):
+    """Return a dict of info about the repo
+
+    - fields: list of keys (from REPO_INFO_FIELDS) to include; default is all
+
+    The git queries behind the fields are run concurrently on a thread pool.
+    Keys are always in the order of REPO_INFO_FIELDS
+    """
     data = {}
     repo_path = get_local_repo_path()
     if not repo_path:
         return data
-    data['path'] = repo_path
-    data['url'] = get_origin_url()
-    data['branch'] = get_branch_name()
-    data['branch_date'] = get_branch_date(data['branch'])
-    data['branch_tracking'] = get_tracking_branch()
-    data['branch_tracking_date'] = get_branch_date(data['branch_tracking'])
-    data['last_tag'] = get_last_tag()
-    data['status'] = get_status()
-    data['stashes'] = get_stashlist()
-    data['unpushed'] = get_unpushed_commits()
-    data['commits_since_last_tag'] = get_commits_since_last_tag()
+    fields = _get_repo_info_fields(fields)
+
+    # Warm the per-repo settings cache before the worker threads use it
+    _get_repo_settings()
+    branch = ''
+    if fields & {'branch', 'branch_date', 'branch_tracking', 'branch_tracking_date'}:
+        branch = get_branch_name()
+
+    def tracking_info():
+        tracking = get_tracking_branch(branch)
+        date = None
+        if 'branch_tracking_date' in fields:
+            date = get_branch_date(tracking)
+        return tracking, date
+
+    tasks = {
+        'url': get_origin_url,
+        'branch_date': lambda: get_branch_date(branch),
+        'last_tag': get_last_tag,
+        'status': get_status,
+        'stashes': get_stashlist,
+        'unpushed': get_unpushed_commits,
+        'commits_since_last_tag': get_commits_since_last_tag,
+        'commits_since_last_tag_summary': get_commits_since_last_tag_summary,
+    }
+    from concurrent.futures import ThreadPoolExecutor
+    tasks = dict([(field, func) for field, func in tasks.items() if field in fields])
+    if fields & {'branch_tracking', 'branch_tracking_date'}:
+        tasks['tracking'] = tracking_info
+
+    results = {'path': repo_path, 'branch': branch}
+    if tasks:
+        with ThreadPoolExecutor(max_workers=len(tasks)) as executor:
+            futures = dict([
+                (field, executor.submit(func))
+                for field, func in tasks.items()
+            ])
+            for field, future in futures.items():
+                results[field] = future.result()
+    if 'tracking' in results:
+        results['branch_tracking'], results['branch_tracking_date'] = results.pop('tracking')
+
+    return _order_repo_info(results, fields)
+
+
+def _get_repo_info_fields(fields=None):
+    """Return set of repo info fields to get (REPO_INFO_FIELDS if fields is
+    None); raise ValueError if any are unknown"""
+    if fields is None:
+        fields = REPO_INFO_FIELDS
+    unknown = set(fields) - set(REPO_INFO_FIELDS)
+    if unknown:
+        raise ValueError('Unknown repo info fields: {}'.format(', '.join(sorted(unknown))))
+    return set(fields)
+
+
+def _order_repo_info(results, fields):
+    """Return dict of the requested fields from results, in the order of
+    REPO_INFO_FIELDS"""
+    data = {}
+    for field in REPO_INFO_FIELDS:
+        if field in fields:
+            data[field] = results[field]
     return data
 
 
-def get_repo_info_string():
-    """Build up a string of info from get_repo_info_dict and return it"""
-    info = get_repo_info_dict()
-    if not info:
-        return ''
+def _format_repo_info(info):
+    """Return a string of info from a (possibly partial) get_repo_info_dict"""
     s = StringIO()
-    s.write('{} .::. {} .::. {}'.format(
-        info['path'], info['url'], info['branch']
-    ))
-    if info['branch_tracking']:
+    s.write(' .::. '.join([
+        info[field]
+        for field in ('path', 'url', 'branch')
+        if info.get(field)
+    ]))
+    if info.get('branch_tracking'):
         s.write('\n- tracking: {}'.format(info['branch_tracking']))
-        s.write('\n    - updated: {}'.format(info['branch_tracking_date']))
-        s.write('\n    - local: {}'.format(info['branch_date']))
-    if info['last_tag']:
+        if 'branch_tracking_date' in info:
+            s.write('\n    - updated: {}'.format(info['branch_tracking_date']))
+        if 'branch_date' in info:
+            s.write('\n    - local: {}'.format(info['branch_date']))
+    if info.get('last_tag'):
         s.write('\n- last tag: {}'.format(info['last_tag']))
-    if info['status']:
+    if info.get('status'):
         s.write('\n- status:')
         for filestat in info['status']:
             s.write('\n    - {}'.format(filestat))
-    if info['stashes']:
+    if info.get('stashes'):
         s.write('\n\n- stashes:')
         for stash in info['stashes']:
             s.write('\n    - {}'.format(stash))
-    if info['unpushed']:
+    if info.get('unpushed'):
         s.write('\n\n- unpushed commits:')
         for commit in info['unpushed']:
             s.write('\n    - {}'.format(commit))
-    if info['commits_since_last_tag']:
+    summary = info.get('commits_since_last_tag_summary')
+    if summary is None and info.get('commits_since_last_tag'):
+        summary = {
+            'count': len(info['commits_since_last_tag']),
+            'commits': info['commits_since_last_tag'][:10],
+        }
+    if summary and summary['count']:
         s.write('\n\n- commits since last tag')
-        num_commits = len(info['commits_since_last_tag'])
-        if num_commits > 10:
-            s.write(' ({} total, showing last 10):'.format(num_commits))
+        if summary['count'] > len(summary['commits'][:10]):
+            s.write(' ({} total, showing last 10):'.format(summary['count']))
         else:
             s.write(':')
-        for commit in info['commits_since_last_tag'][:10]:
+        for commit in summary['commits'][:10]:
             s.write('\n    - {}'.format(commit))
     return s.getvalue()
 
 
-def show_repo_info():
-    """Show info about the repo"""
-    print(get_repo_info_string())
+def _get_display_fields(fields=None):
+    """Return the fields to get for showing repo info
+
+    The count and newest commits from 'commits_since_last_tag_summary' are all
+    that is shown, so the full 'commits_since_last_tag' list isn't read
+    """
+    if fields is None:
+        fields = REPO_INFO_FIELDS
+    fields = [
+        'commits_since_last_tag_summary' if field == 'commits_since_last_tag' else field
+        for field in fields
+    ]
+    return [field for i, field in enumerate(fields) if field not in fields[:i]]
+
+
+def get_repo_info_string(fields=None):
+    """Build up a string of info from get_repo_info_dict and return it
+
+    - fields: list of keys (from REPO_INFO_FIELDS) to include; default is all
+    """
+    info = get_repo_info_dict(fields=_get_display_fields(fields))
+    if not info:
+        return ''
+    return _format_repo_info(info)
+
+
+def show_repo_info(fields=None):
+    """Show info about the repo
+
+    - fields: list of keys (from REPO_INFO_FIELDS) to include; default is all
+    """
+    print(get_repo_info_string(fields=fields))
+
+
+def find_repos(root):
+    """Return sorted list of paths to git repos at or under root
+
+    Directories inside of a repo (including nested repos) are not searched
+    """
+    repos = []
+    for dirpath, dirnames, filenames in os.walk(os.path.abspath(root)):
+        if '.git' in dirnames or '.git' in filenames:
+            repos.append(dirpath)
+            dirnames[:] = []
+        else:
+            dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+    return sorted(repos)
+
+
+def _get_repo_info_at(path, fields=None):
+    """Return get_repo_info_dict for the repo at path (run in a worker process)"""
+    os.chdir(path)
+    try:
+        return get_repo_info_dict(fields=fields)
+    except Exception as e:
+        return {'path': path, 'error': repr(e)}
+
+
+def iter_workspace_info(root, fields=None, workers=None):
+    """Yield get_repo_info_dict for each repo under root, as each one finishes
+
+    - root: directory containing git repos
+    - fields: list of keys (from REPO_INFO_FIELDS) to include; default is all
+    - workers: max number of worker processes (default is number of CPUs)
+
+    The 'path' field is always included
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    if fields is not None and 'path' not in fields:
+        fields = ['path'] + list(fields)
+    repos = find_repos(root)
+    if not repos:
+        return
+    workers = min(workers or os.cpu_count() or 1, len(repos))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_get_repo_info_at, path, fields)
+            for path in repos
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def show_workspace_info(root, fields=None, workers=None):
+    """Show info about each repo under root, then a summary
+
+    - root: directory containing git repos
+    - fields: list of keys (from REPO_INFO_FIELDS) to include; default is all
+    - workers: max number of worker processes (default is number of CPUs)
+
+    Return dict of summary lists (repo paths per category)
+    """
+    summary = {
+        'repos': [], 'errors': [], 'dirty': [], 'stashes': [],
+        'unpushed': [], 'untagged': [],
+    }
+    fields = _get_display_fields(fields)
+    for info in iter_workspace_info(root, fields=fields, workers=workers):
+        if not info:
+            continue
+        path = info['path']
+        summary['repos'].append(path)
+        if 'error' in info:
+            summary['errors'].append(path)
+            print('{} .::. ERROR: {}\n'.format(path, info['error']))
+            continue
+        if info.get('status'):
+            summary['dirty'].append(path)
+        if info.get('stashes'):
+            summary['stashes'].append(path)
+        if info.get('unpushed'):
+            summary['unpushed'].append(path)
+        if info.get('commits_since_last_tag_summary', {}).get('count'):
+            summary['untagged'].append(path)
+        print(_format_repo_info(info) + '\n')
+
+    print('{} repos under {}'.format(len(summary['repos']), os.path.abspath(root)))
+    for key, label in (
+        ('dirty', 'with uncommitted changes'),
+        ('stashes', 'with stashes'),
+        ('unpushed', 'with unpushed commits'),
+        ('untagged', 'with commits since last tag'),
+        ('errors', 'with errors'),
+    ):
+        if summary[key]:
+            print('- {} {}:'.format(len(summary[key]), label))
+            for path in sorted(summary[key]):
+                print('    - {}'.format(path))
+    return summary
 
 
 def select_qa(empty_only=False, full_only=False, multi=False):
@@ -523,15 +1261,21 @@ def select_commit_to_tag(n=10):
         'Must be on {} branch to select commit, not {}'.format(SOURCE_BRANCH, branch)
     )
     last_tag = get_last_tag()
-    cmd_part = 'git log --find-renames --no-merges --oneline'
     if last_tag:
-        cmd = cmd_part + ' {}..'.format(last_tag)
+        summary = get_commits_since_last_tag_summary(n=n, until='HEAD')
+        items = summary['commits']
+        if summary['count'] > n:
+            print('{} commits since {}, showing the newest {}'.format(
+                summary['count'], last_tag, n
+            ))
     else:
-        cmd = cmd_part + ' -{}'.format(n)
-    output = bh.run_output(cmd)
-    if not output:
+        output = command.run_output(
+            ['git', 'log', '--find-renames', '--no-merges', '--oneline', '-{}'.format(n)],
+            stderr=False
+        )
+        items = re.split('\r?\n', output) if output else []
+    if not items:
         return
-    items = re.split('\r?\n', output)[:n]
     selected = ih.make_selections(
         items,
         wrap=False,
@@ -588,15 +1332,15 @@ def new_branch(name, source=''):
     """
     if not source:
         source = _get_repo_settings('SOURCE_BRANCH')
-    bh.run_or_die('git fetch --all --prune', show=True)
-    bh.run_or_die('git stash', show=True)
-    cmd = 'git checkout -b {} origin/{} --no-track'.format(name, source)
-    ret_code = bh.run(cmd, show=True)
+    fetch_all(show=True, die=True)
+    command.run_or_die(['git', 'stash'], show=True)
+    cmd = ['git', 'checkout', '-b', name, 'origin/{}'.format(source), '--no-track']
+    ret_code = command.run(cmd, show=True)
     if ret_code == 0:
-        cmd = 'git push -u origin {}'.format(name)
-        return bh.run(cmd, show=True)
+        return command.run(['git', 'push', '-u', 'origin', name], show=True)
 
 
+@_workflow_operation
 def branch_from(branch='', name=''):
     """Create a new branch from specified branch on origin
 
@@ -618,75 +1362,269 @@ def branch_from(branch='', name=''):
         return new_branch(name, branch)
 
 
-def get_clean_local_branch(source=''):
-    """Create a clean LOCAL_BRANCH from remote source"""
+def get_worktree_path():
+    """Return path to the worktree dedicated to LOCAL_BRANCH
+
+    The worktree lives in the ewm-worktrees directory of the main .git
+    directory (even when called from a linked worktree)
+    """
+    git_dir = get_git_dir()
+    if not git_dir:
+        return
+    commondir = os.path.join(git_dir, 'commondir')
+    if os.path.isfile(commondir):
+        with open(commondir, 'r') as fp:
+            git_dir = os.path.normpath(os.path.join(git_dir, fp.read().strip()))
+    return os.path.join(git_dir, 'ewm-worktrees', _get_repo_settings('LOCAL_BRANCH'))
+
+
+def _local_branch_git():
+    """Return the start of a git command (list of args) that operates where
+    LOCAL_BRANCH is prepared (['git'] or ['git', '-C', <worktree>] if
+    USE_WORKTREE is set)"""
+    if _get_repo_settings('USE_WORKTREE'):
+        return ['git', '-C', get_worktree_path()]
+    return ['git']
+
+
+def _get_worktree(source):
+    """Return path to the LOCAL_BRANCH worktree, creating it if needed
+
+    - source: name of remote branch to start a new worktree at
+    """
+    path = get_worktree_path()
+    LOCAL_BRANCH = _get_repo_settings('LOCAL_BRANCH')
+    if get_branch_name() == LOCAL_BRANCH:
+        print('\n{} is checked out here and will be prepared in {} instead'.format(
+            LOCAL_BRANCH, path
+        ))
+        command.run_or_die(['git', 'checkout', '--detach'], show=True)
+    if not os.path.isfile(os.path.join(path, '.git')):
+        command.run(['git', 'worktree', 'prune'], show=True)
+        cmd = ['git', 'worktree', 'add', '--detach', path, 'origin/{}'.format(source)]
+        command.run_or_die(cmd, show=True)
+    return path
+
+
+def get_clean_local_branch(source='', commit=''):
+    """Create a clean LOCAL_BRANCH from remote source
+
+    - commit: commit id to create LOCAL_BRANCH at instead of origin/source
+
+    If USE_WORKTREE is set, LOCAL_BRANCH is reset in its own worktree (see
+    get_worktree_path) and the current working tree is not touched
+    """
     if not source:
         source = _get_repo_settings('SOURCE_BRANCH')
     LOCAL_BRANCH = _get_repo_settings('LOCAL_BRANCH')
-    bh.run_or_die('git fetch --all --prune', show=True)
-    bh.run_or_die('git stash', show=True)
-    cmd = 'git checkout {}'.format(source)
-    bh.run_or_die(cmd, show=True)
-    cmd = 'git branch -D {}'.format(LOCAL_BRANCH)
-    bh.run(cmd, show=True)
-    cmd = 'git checkout -b {} origin/{} --no-track'.format(LOCAL_BRANCH, source)
-    bh.run_or_die(cmd, show=True)
+    start = commit or 'origin/' + source
+    fetch_all(show=True, die=True)
+    if _get_repo_settings('USE_WORKTREE'):
+        git = ['git', '-C', _get_worktree(source)]
+        command.run(git + ['merge', '--abort'], quiet=True)
+        command.run_or_die(git + ['reset', '--hard', '-q'], show=True)
+        command.run_or_die(git + ['clean', '-fdq'], show=True)
+        cmd = git + ['checkout', '-f', '-B', LOCAL_BRANCH, start, '--no-track']
+        command.run_or_die(cmd, show=True)
+        return
+    worktree = get_worktree_path()
+    if worktree and os.path.isfile(os.path.join(worktree, '.git')):
+        # Release LOCAL_BRANCH from the worktree so it can be recreated here
+        command.run(['git', '-C', worktree, 'checkout', '-q', '-f', '--detach'], show=True)
+    command.run_or_die(['git', 'stash'], show=True)
+    command.run_or_die(['git', 'checkout', source], show=True)
+    command.run(['git', 'branch', '-D', LOCAL_BRANCH], show=True)
+    cmd = ['git', 'checkout', '-b', LOCAL_BRANCH, start, '--no-track']
+    command.run_or_die(cmd, show=True)
+
+
+def _merge_tree(ours, theirs):
+    """Merge theirs into ours in the object database only (no working tree)
+
+    Return (tree id, list of conflicting files), or None if git could not do
+    the merge (unknown commit, or git older than 2.38)
+    """
+    cmd = ['git', 'merge-tree', '--write-tree', '--name-only', '--no-messages', ours, theirs]
+    lines = re.split('\r?\n', command.run_output(cmd))
+    if not RX_SHA.match(lines[0]):
+        return
+    return lines[0], [line for line in lines[1:] if line]
+
+
+def precheck_merge_conflicts(*branches, source=''):
+    """Find which remote branches would conflict when merged onto source
 
+    - branches: names of remote branches, in the order they would be merged
+    - source: name of remote branch to merge onto (default is SOURCE_BRANCH)
 
-def merge_branches_locally(*branches, source=''):
+    Works like merge_branches_locally (each clean merge is built on top of the
+    previous ones and a conflicting branch is skipped), but with
+    `git merge-tree`, so the working tree and current branch are not touched
+
+    Return dict of branch name -> list of conflicting files (empty list if it
+    merges cleanly), or None if the check could not be done
+    """
+    if not source:
+        source = _get_repo_settings('SOURCE_BRANCH')
+    fetch_all()
+    current = 'origin/' + source
+    results = {}
+    for branch in branches:
+        merged = _merge_tree(current, 'origin/' + branch)
+        if merged is None:
+            return
+        tree, conflicts = merged
+        results[branch] = conflicts
+        if conflicts:
+            continue
+        cmd = [
+            'git', '-c', 'user.name=ewm', '-c', 'user.email=ewm@localhost',
+            'commit-tree', tree, '-p', current, '-p', 'origin/' + branch,
+            '-m', 'ewm merge precheck'
+        ]
+        commit = command.run_output(cmd)
+        if not RX_SHA.match(commit):
+            return
+        current = commit
+    return results
+
+
+def _get_merge_cache_key(branches, source, octopus=False):
+    """Return the merge_cache key for merging remote branches onto remote source
+    (at their current commits), or None if any of them can't be resolved"""
+    refs = ['origin/' + name for name in (source, ) + tuple(branches)]
+    output = command.run_output(['git', 'rev-parse'] + refs, stderr=False)
+    shas = re.split('\r?\n', output)
+    if len(shas) != len(refs) or not all([RX_SHA.match(sha) for sha in shas]):
+        return
+    return merge_cache.make_key(
+        shas[0], shas[1:], mode='octopus' if octopus else 'sequential'
+    )
+
+
+def _get_cached_merge(key):
+    """Return the cached merge commit for key if it is still in the object store"""
+    git_dir = get_git_dir()
+    commit = merge_cache.get(git_dir, key, _get_repo_settings('MERGE_CACHE_SECONDS'))
+    if not commit:
+        return
+    if command.run_output(['git', 'cat-file', '-t', commit], stderr=False) != 'commit':
+        merge_cache.discard(git_dir, key)
+        return
+    return commit
+
+
+def _octopus_merge(git, branches, source):
+    """Merge the branches that precheck_merge_conflicts finds clean in a single
+    octopus merge
+
+    - git: start of the git command (list of args) to run the merge with
+
+    Return list of branches that still need to be merged one at a time (all
+    of them if the octopus merge could not be done)
+    """
+    conflicts = precheck_merge_conflicts(*branches, source=source)
+    if conflicts is None:
+        return branches
+    clean = [branch for branch in branches if not conflicts[branch]]
+    if len(clean) < 2:
+        return branches
+    cmd = git + ['merge'] + ['origin/' + branch for branch in clean]
+    ret_code = command.run(cmd, show=True)
+    if ret_code != 0:
+        print('\nOctopus merge failed, merging branches one at a time instead')
+        command.run(git + ['reset', '--hard', '-q', 'HEAD'], show=True)
+        return branches
+    return [branch for branch in branches if conflicts[branch]]
+
+
+def merge_branches_locally(*branches, source='', octopus=False, use_cache=False):
     """Create a clean LOCAL_BRANCH from remote SOURCE_BRANCH and merge in remote branches
 
+    - octopus: if True, merge all of the branches that don't conflict in a
+      single multi-parent merge, then merge the conflicting ones one at a time
+    - use_cache: if True and the same commits were merged before (see
+      merge_cache), create LOCAL_BRANCH at the earlier result instead of
+      merging again; results of merges without conflicts are cached
+
     If there are any merge conflicts, you will be dropped into a sub-shell where
     you can resolve them
 
+    If USE_WORKTREE is set, the merges happen in the LOCAL_BRANCH worktree
+
     Return True if merge was successful
     """
     if not source:
         source = _get_repo_settings('SOURCE_BRANCH')
+    key = None
+    if use_cache and _get_repo_settings('MERGE_CACHE_ENTRIES'):
+        fetch_all(show=True, die=True)
+        key = _get_merge_cache_key(branches, source, octopus=octopus)
+        commit = _get_cached_merge(key) if key else None
+        if commit:
+            print('\nReusing earlier merge of the same commits: {}'.format(commit))
+            get_clean_local_branch(source=source, commit=commit)
+            return True
     get_clean_local_branch(source=source)
+    git = _local_branch_git()
+    if octopus and len(branches) > 1:
+        branches = _octopus_merge(git, branches, source)
     bad_merges = []
     for branch in branches:
-        cmd = 'git merge origin/{}'.format(branch)
-        ret_code = bh.run(cmd, show=True)
+        ret_code = command.run(git + ['merge', 'origin/' + branch], show=True)
         if ret_code != 0:
             bad_merges.append(branch)
-            cmd = 'git merge --abort'
-            bh.run(cmd, show=True)
+            command.run(git + ['merge', '--abort'], show=True)
 
     if bad_merges:
         print('\n!!!!! The following branch(es) had merge conflicts: {}'.format(repr(bad_merges)))
         for branch in bad_merges:
-            cmd = 'git merge origin/{}; git status'.format(branch)
-            bh.run(cmd, show=True)
+            command.run(git + ['merge', 'origin/' + branch], show=True)
+            command.run(git + ['status'], show=True)
             print('\nManually resolve the conflict(s), then "git add ____", then "git commit", then "exit"\n')
-            bh.run('sh')
+            if _get_repo_settings('USE_WORKTREE'):
+                command.run(['sh'], cwd=get_worktree_path())
+            else:
+                command.run(['sh'])
 
-            output = bh.run_output("git status -s | grep '^UU'")
-            if output != '':
+            output = command.run_output(git + ['status', '-s'], stderr=False)
+            if any([line.startswith('UU') for line in output.splitlines()]):
                 print('\nConflicts still not resolved, aborting')
-                cmd = 'git merge --abort'
-                bh.run(cmd, show=True)
+                command.run(git + ['merge', '--abort'], show=True)
                 return
+    elif key:
+        merge_cache.put(
+            get_git_dir(), key, command.run_output(git + ['rev-parse', 'HEAD'], stderr=False),
+            _get_repo_settings('MERGE_CACHE_SECONDS'),
+            _get_repo_settings('MERGE_CACHE_ENTRIES')
+        )
 
     return True
 
 
-def force_push_local(qa='', *branches, to_source=False):
+def force_push_local(qa='', *branches, to_source=False, force=False):
     """Do a git push -f of LOCAL_BRANCH to specified qa branch or SOURCE_BRANCH
 
     - qa: name of qa branch to push to
     - branches: list of remote branch names that were merged into LOCAL_BRANCH
     - to_source: if True, force push to SOURCE_BRANCH (only allowed if func
       that called it is in FUNCS_ALLOWED_TO_FORCE_PUSH_TO_SOURCE)
+    - force: if True, replace whatever is already on the qa branch without
+      asking for confirmation
 
     Return True if push was successful
 
-    Only allowed to be called from funcs in FUNCS_ALLOWED_TO_FORCE_PUSH (because
-    these are functions that just finished creating a clean LOCAL_BRANCH from the
-    remote SOURCE_BRANCH, with other remote branches combined in (via rebase or
-    merge)
+    The qa branch and the qa--with--... branch are updated in a single atomic
+    push (if the remote supports it), so they are both updated or neither is
+
+    Only allowed to be called while one of the funcs in FUNCS_ALLOWED_TO_FORCE_PUSH
+    is running in the current thread (because these are functions that just
+    finished creating a clean LOCAL_BRANCH from the remote SOURCE_BRANCH, with
+    other remote branches combined in (via rebase or merge). Those funcs grant
+    the push with the _grants_force_push decorator
     """
-    caller = inspect.stack()[1][3]
+    grants = getattr(_PUSH_GRANTS, 'stack', None)
+    caller = grants[-1] if grants else None
     assert caller in FUNCS_ALLOWED_TO_FORCE_PUSH, (
         'Only allowed to invoke force_push_local func from {}... not {}'.format(
             repr(FUNCS_ALLOWED_TO_FORCE_PUSH), repr(caller)
@@ -701,7 +1639,12 @@ def force_push_local(qa='', *branches, to_source=False):
         )
     QA_BRANCHES = _get_repo_settings('QA_BRANCHES')
     LOCAL_BRANCH = _get_repo_settings('LOCAL_BRANCH')
-    current_branch = get_branch_name()
+    if _get_repo_settings('USE_WORKTREE'):
+        current_branch = command.run_output(
+            _local_branch_git() + ['rev-parse', '--abbrev-ref', 'HEAD'], stderr=False
+        )
+    else:
+        current_branch = get_branch_name()
     if current_branch != LOCAL_BRANCH:
         print('Will not do a force push with branch {}, only {}'.format(
             repr(current_branch), repr(LOCAL_BRANCH)
@@ -711,28 +1654,53 @@ def force_push_local(qa='', *branches, to_source=False):
         print('Branch {} is not one of {}'.format(repr(qa), repr(QA_BRANCHES)))
         return
 
-    env_branches = get_qa_env_branches(qa, display=True)
-    if env_branches:
+    env_branches = get_qa_env_branches(qa, display=True, refresh=True)
+    if env_branches and not force:
         print()
         resp = ih.user_input('Something is already there, are you sure? (y/n)')
         if not resp.lower().startswith('y'):
             return
 
-    ret_codes = []
     combined_name = qa + '--with--' + '--'.join(branches)
-    cmd_part = 'git push -uf origin {}:'.format(LOCAL_BRANCH)
-    ret_codes.append(bh.run(cmd_part + qa, show=True))
-    ret_codes.append(bh.run(cmd_part + combined_name, show=True))
-    if all([x == 0 for x in ret_codes]):
+    refspecs = [
+        '{}:{}'.format(LOCAL_BRANCH, qa), '{}:{}'.format(LOCAL_BRANCH, combined_name)
+    ]
+    cmd = ['git', 'push', '--porcelain', '--atomic', '-uf', 'origin'] + refspecs
+    output = command.run_output(cmd, show=True)
+    if 'does not support --atomic' in output:
+        print(output)
+        print('\nRemote does not support atomic pushes, pushing without --atomic')
+        cmd.remove('--atomic')
+        output = command.run_output(cmd, show=True)
+    print(output)
+    results = _parse_push_porcelain(output)
+    if all([
+        results.get(branch, ('!', ''))[0] != '!'
+        for branch in (qa, combined_name)
+    ]):
         return True
 
 
-def deploy_to_qa(qa='', grep='', branches=''):
+@_workflow_operation
+@_grants_force_push
+def deploy_to_qa(qa='', grep='', branches='', precheck=False, refuse_conflicts=False,
+                 octopus=False, use_cache=False, force=False):
     """Select remote branch(es) to deploy to specified QA branch
 
     - qa: name of qa branch that will receive this deploy
     - grep: grep pattern to filter branches by (case-insensitive)
     - branches: string of branch names separated by any of , ; | (or list)
+    - precheck: if True, check for merge conflicts (without touching the
+      working tree) and show them before merging
+    - refuse_conflicts: if True, do the precheck and don't deploy anything if
+      any branch would conflict
+    - octopus: if True, merge the branches that don't conflict in a single
+      multi-parent merge (see merge_branches_locally)
+    - use_cache: if True, reuse the result of an earlier merge of the same
+      commits instead of merging again (see merge_branches_locally); off by
+      default, so every deploy does a fresh merge
+    - force: if True, replace whatever is already on qa without asking for
+      confirmation
 
     Return qa name if deploy was successful
     """
@@ -750,7 +1718,7 @@ def deploy_to_qa(qa='', grep='', branches=''):
                 _branches.extend(ih.string_to_list(br))
         elif _type == str:
             _branches.extend(ih.string_to_list(branches))
-        remote_branches = get_remote_branches()
+        remote_branches = get_remote_branches(refresh=True)
         valid = set(_branches).intersection(set(remote_branches))
         if len(valid) != len(_branches):
             branches = None
@@ -762,41 +1730,129 @@ def deploy_to_qa(qa='', grep='', branches=''):
     if not branches:
         return
 
-    success = merge_branches_locally(*branch_names)
+    if precheck or refuse_conflicts:
+        conflicts = precheck_merge_conflicts(*branch_names)
+        if conflicts is None:
+            print('\nUnable to check for merge conflicts ahead of time')
+        elif any(conflicts.values()):
+            print('\n!!!!! Merge conflicts found:')
+            for branch in branch_names:
+                if conflicts[branch]:
+                    print('- {}'.format(branch))
+                    for filename in conflicts[branch]:
+                        print('    - {}'.format(filename))
+            if refuse_conflicts:
+                print('\nNot going to deploy to {}'.format(qa))
+                return
+
+    success = merge_branches_locally(*branch_names, octopus=octopus, use_cache=use_cache)
     if success:
-        success2 = force_push_local(qa, *branch_names)
+        success2 = force_push_local(qa, *branch_names, force=force)
         if success2:
             return qa
 
 
-def delete_remote_branches(*branches):
-    """Delete the specified remote branches
+def _parse_push_porcelain(output):
+    """Return dict of branch name -> (flag, summary) from `git push --porcelain`
+
+    Flag is '-' for a successful delete and '!' for a rejected ref
+    """
+    results = {}
+    for line in re.split('\r?\n', output):
+        parts = line.split('\t')
+        if len(parts) < 3 or ':refs/heads/' not in parts[1]:
+            continue
+        branch = parts[1].split(':refs/heads/', 1)[1]
+        results[branch] = (parts[0], parts[2])
+    return results
+
+
+def delete_remote_branches(*branches, atomic=False):
+    """Delete the specified remote branches with a single push
 
+    - atomic: if True, either all of the branches are deleted or none are
+      (requires server support for atomic pushes)
+
+    Branches that no longer exist on the remote are reported and skipped.
     Return True if all deletes were successful
     """
-    ret_codes = []
-    for branch in sorted(set(branches)):
-        cmd = 'git push origin -d {}'.format(branch)
-        ret_codes.append(bh.run(cmd, show=True))
+    branches = sorted(set(branches))
+    if not branches:
+        return True
+    missing = []
+    while branches:
+        cmd = ['git', 'push', '--porcelain'] + (['--atomic'] if atomic else []) + [
+            'origin', '--delete'
+        ] + branches
+        output = command.run_output(cmd, show=True)
+        print(output)
+        gone = set(RX_PUSH_MISSING_REF.findall(output)).intersection(branches)
+        if not gone:
+            break
+        missing.extend(sorted(gone))
+        branches = [b for b in branches if b not in gone]
+
+    return _report_remote_deletes(output, branches, missing)
 
-    if all([x == 0 for x in ret_codes]):
+
+def _report_remote_deletes(output, branches, missing):
+    """Show the result of a delete push and return True if all deletes were successful
+
+    - output: output of the last `git push --porcelain ... --delete` that was run
+    - branches: branches that were still being deleted in that push
+    - missing: branches that were already gone from the remote
+    """
+    if missing:
+        print('\nAlready deleted from remote: {}'.format(', '.join(missing)))
+    if not branches:
         return True
+    results = _parse_push_porcelain(output)
+    failed = [
+        branch
+        for branch in branches
+        if results.get(branch, ('!', ''))[0] != '-'
+    ]
+    if failed:
+        print('\nFailed to delete from remote:')
+        for branch in failed:
+            print('    - {} {}'.format(branch, results.get(branch, ('', 'not attempted'))[1]))
+        return
+    return True
+
 
+def delete_local_branches(*branches, atomic=False):
+    """Delete the specified local branches with a single `git branch -D`
 
-def delete_local_branches(*branches):
-    """Delete the specified local branches
+    - atomic: if True, don't delete anything unless all of the branches
+      exist and none of them are checked out
 
     Return True if all deletes were successful
     """
-    ret_codes = []
-    for branch in sorted(set(branches)):
-        cmd = 'git branch -D {}'.format(branch)
-        ret_codes.append(bh.run(cmd, show=True))
-
-    if all([x == 0 for x in ret_codes]):
+    branches = sorted(set(branches))
+    if not branches:
         return True
+    if atomic:
+        existing = set(get_local_branches())
+        current = get_branch_name()
+        problems = [b for b in branches if b not in existing or b == current]
+        if problems:
+            print('\nNot deleting any local branches, these are missing or checked out: {}'.format(
+                ', '.join(problems)
+            ))
+            return
 
+    output = command.run_output(['git', 'branch', '-D'] + branches, show=True)
+    print(output)
+    deleted = set(RX_DELETED_LOCAL_BRANCH.findall(output))
+    failed = [b for b in branches if b not in deleted]
+    if failed:
+        print('\nFailed to delete local branches: {}'.format(', '.join(failed)))
+        return
+    return True
 
+
+@_workflow_operation
+@_grants_force_push
 def merge_qa_to_source(qa='', auto=False):
     """Merge the QA-verified code to SOURCE_BRANCH and delete merged branch(es)
 
@@ -814,7 +1870,7 @@ def merge_qa_to_source(qa='', auto=False):
         qa = select_qa(full_only=True)
     if not qa:
         return
-    env_branches = get_qa_env_branches(qa, display=True)
+    env_branches = get_qa_env_branches(qa, display=True, refresh=True)
     if not env_branches:
         print('Nothing on {} to merge...'.format(qa))
         return
@@ -835,8 +1891,8 @@ def merge_qa_to_source(qa='', auto=False):
         print('\nThere was a failure, not going to delete these: {}'.format(repr(delete_after_merge)))
         return
 
-    cmd = 'git push -uf origin {}:{}'.format(LOCAL_BRANCH, SOURCE_BRANCH)
-    ret_code = bh.run(cmd, show=True)
+    cmd = ['git', 'push', '-uf', 'origin', '{}:{}'.format(LOCAL_BRANCH, SOURCE_BRANCH)]
+    ret_code = command.run(cmd, show=True)
     if ret_code != 0:
         print('\nThere was a failure, not going to delete these: {}'.format(repr(delete_after_merge)))
         return
@@ -857,10 +1913,10 @@ def update_branch(branch='', pop_stash=False):
     """
     if branch:
         if branch not in get_local_branches():
-            cmd = 'git checkout origin/{}'.format(branch)
+            cmd = ['git', 'checkout', 'origin/{}'.format(branch)]
         else:
-            cmd = 'git checkout {}'.format(branch)
-        bh.run_or_die(cmd, show=True)
+            cmd = ['git', 'checkout', branch]
+        command.run_or_die(cmd, show=True)
 
     branch = get_branch_name()
     url = get_origin_url()
@@ -871,34 +1927,35 @@ def update_branch(branch='', pop_stash=False):
     elif tracking:
         SOURCE_BRANCH = _get_repo_settings('SOURCE_BRANCH')
         NON_SELECTABLE_BRANCHES = _get_repo_settings('NON_SELECTABLE_BRANCHES')
-        stash_output = bh.run_output('git stash', show=True)
+        stash_output = command.run_output(['git', 'stash'], show=True)
         print(stash_output)
-        ret_code = bh.run('git pull --rebase', show=True)
+        ret_code = command.run(['git', 'pull', '--rebase'], show=True)
         if ret_code != 0:
             return
         if branch != SOURCE_BRANCH and branch not in NON_SELECTABLE_BRANCHES:
-            cmd = 'git rebase origin/{}'.format(SOURCE_BRANCH)
-            ret_code = bh.run(cmd, show=True)
+            cmd = ['git', 'rebase', 'origin/{}'.format(SOURCE_BRANCH)]
+            ret_code = command.run(cmd, show=True)
             if ret_code != 0:
                 return
         if pop_stash and stash_output != 'No local changes to save':
-            bh.run_output('git stash pop', show=True)
+            command.run_output(['git', 'stash', 'pop'], show=True)
     else:
-        bh.run_output('git fetch', show=True)
+        command.run_output(['git', 'fetch'], show=True)
 
     return True
 
 
-def show_remote_branches(grep='', all_branches=False):
+def show_remote_branches(grep='', all_branches=False, refresh=False):
     """Show the remote branch names and last update times
 
     - grep: grep pattern to filter branches by (case-insensitive)
     - all_branches: if True, don't filter out non-selectable branches or branches
       prefixed by a qa branch
+    - refresh: if True, don't use the on-disk ref cache
 
     Results are ordered by most recent commit
     """
-    branches = get_remote_branches_with_times(grep=grep, all_branches=all_branches)
+    branches = get_remote_branches_with_times(grep=grep, all_branches=all_branches, refresh=refresh)
     if branches:
         make_string = ih.get_string_maker(item_format='- {branch} .::. {time}')
         print('\n'.join([make_string(branch) for branch in branches]))
@@ -915,16 +1972,18 @@ def show_local_branches(grep=''):
         print('\n'.join([make_string(branch) for branch in branches]))
 
 
-def show_qa(qa='', all_qa=False):
+def show_qa(qa='', all_qa=False, refresh=False):
     """Show what is on a specific QA branch
 
     - qa: name of qa branch that may have things pushed to it
     - all_qa: if True and no qa passed in, return info for all qa envs
+    - refresh: if True, don't use the on-disk ref cache
     """
-    get_qa_env_branches(qa, display=True, all_qa=all_qa)
+    get_qa_env_branches(qa, display=True, all_qa=all_qa, refresh=refresh)
 
 
-def clear_qa(*qas, all_qa=False, force=False):
+@_workflow_operation
+def clear_qa(*qas, all_qa=False, force=False, atomic=False):
     """Clear whatever is on selected QA branches
 
     - qas: names of qa branches that may have things pushed to them
@@ -932,6 +1991,7 @@ def clear_qa(*qas, all_qa=False, force=False):
     - all_qa: if True and no qa passed in, clear all qa branches
     - force: if True, delete the specified qa branches without prompting
       for confirmation
+    - atomic: if True, either all of the qa branches are deleted or none are
 
     Return True if deleting branch(es) was successful
     """
@@ -953,7 +2013,8 @@ def clear_qa(*qas, all_qa=False, force=False):
         parts.append('^{}$|^{}--'.format(qa, qa))
     branches = get_remote_branches(
         grep='|'.join(parts),
-        all_branches=True
+        all_branches=True,
+        refresh=True
     )
 
     if not branches:
@@ -965,9 +2026,10 @@ def clear_qa(*qas, all_qa=False, force=False):
             print('\nNot going to do anything')
             return
 
-    return delete_remote_branches(*branches)
+    return delete_remote_branches(*branches, atomic=atomic)
 
 
+@_workflow_operation
 def tag_release(auto=False):
     """Select a recent remote commit on TAG_BRANCH to tag
 
@@ -999,18 +2061,16 @@ def tag_release(auto=False):
         fp.write('{}\n\n'.format(summary))
         fp.write('\n'.join(commits) + '\n')
 
-    cmd = 'git tag -a {} {} -F {}'.format(
-        tag, commit_id, repr(notes_file)
-    )
+    cmd = ['git', 'tag', '-a', tag, commit_id, '-F', notes_file]
     if not auto:
-        bh.run('vim {}'.format(notes_file))
-        print('Tag command would be -> {}'.format(cmd))
+        command.run(['vim', notes_file])
+        print('Tag command would be -> {}'.format(command.cmd_string(cmd)))
         resp = ih.user_input('Continue? (y/n)')
         if not resp.lower().startswith('y'):
             return
 
-    ret_code = bh.run(cmd, show=True)
+    ret_code = command.run(cmd, show=True)
     if ret_code != 0:
         return
 
-    return bh.run('git push --tags', show=True)
+    return command.run(['git', 'push', '--tags'], show=True)
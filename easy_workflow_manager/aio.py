@@ -0,0 +1,412 @@
+"""Awaitable versions of easy_workflow_manager functions, for asyncio programs
+
+Each function takes the path to the top-level directory of a repo as its first
+argument (instead of using the current directory) and runs git with asyncio
+subprocesses, so many repos and QA envs can be queried from one event loop
+without a thread per call:
+
+    results = await asyncio.gather(*[
+        aio.get_qa_env_branches(path) for path in paths
+    ])
+
+Settings are looked up by the name of the repo directory, like everywhere else.
+Queries always read the remote / refs directly (the on-disk ref cache isn't
+used). Concurrent fetches of the same repo share one `git fetch`.
+
+deploy_to_qa and merge_qa_to_source change the repo's working tree, so they are
+run by easy_workflow_manager itself in a child Python process, one at a time
+per repo. The child can't ask for confirmation, so the checks the sync versions
+prompt about are done first, and WorkflowError is raised instead of a prompt.
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+import weakref
+import easy_workflow_manager as ewm
+from easy_workflow_manager import queries
+from easy_workflow_manager.command import run_output_async
+from easy_workflow_manager.lazy import LazyModule
+
+
+ih = LazyModule('input_helper')
+_LOCKS = weakref.WeakKeyDictionary()
+_FETCHES = weakref.WeakKeyDictionary()
+
+
+class WorkflowError(Exception):
+    """A workflow was refused (where the sync version would ask), or failed
+    in the child process"""
+
+
+def _repo_name(repo):
+    return os.path.basename(os.path.abspath(repo))
+
+
+def _get_lock(repo):
+    """Return the asyncio.Lock for repo (for the running event loop)"""
+    locks = _LOCKS.setdefault(asyncio.get_running_loop(), {})
+    return locks.setdefault(os.path.abspath(repo), asyncio.Lock())
+
+
+async def _git(repo, *args, stderr=True):
+    """Run git with args in repo; Return (exit code, output)"""
+    return await run_output_async(['git'] + list(args), cwd=repo, stderr=stderr)
+
+
+async def _output(repo, cmd):
+    """Return the output of one of the commands in queries, run in repo (stderr
+    is discarded, like it is by the sync functions)"""
+    _, output = await run_output_async(cmd, cwd=repo, stderr=False)
+    return output
+
+
+async def fetch_all(repo, force=False):
+    """Do a `git fetch --all --prune` in repo, unless one was done very recently
+
+    - repo: path to the repo
+    - force: if True, fetch even if FETCH_HEAD was written in the last
+      FETCH_WINDOW_SECONDS
+
+    If a fetch of repo is already running, wait for it instead of starting another.
+    Return True if a fetch was run
+    """
+    repo = os.path.abspath(repo)
+    if not force:
+        window = ewm._get_repo_settings('FETCH_WINDOW_SECONDS', repo=_repo_name(repo))
+        try:
+            fetch_head = os.path.join(ewm._get_git_dir_at(repo), 'FETCH_HEAD')
+            age = time.time() - os.stat(fetch_head).st_mtime
+        except OSError:
+            age = None
+        if window and age is not None and 0 <= age < window:
+            ewm.FETCH_STATS['skipped'] += 1
+            return False
+
+    fetches = _FETCHES.setdefault(asyncio.get_running_loop(), {})
+    task = fetches.get(repo)
+    if task is not None:
+        ewm.FETCH_STATS['skipped'] += 1
+        await asyncio.shield(task)
+        return False
+
+    async def fetch():
+        start = time.time()
+        try:
+            await _git(repo, 'fetch', '--all', '--prune', stderr=False)
+        finally:
+            ewm.FETCH_STATS['count'] += 1
+            ewm.FETCH_STATS['seconds'] += time.time() - start
+            ewm.FETCH_STATS['last_fetch'] = time.time()
+            fetches.pop(repo, None)
+
+    task = asyncio.ensure_future(fetch())
+    fetches[repo] = task
+    await asyncio.shield(task)
+    return True
+
+
+async def get_remote_branches(repo, grep='', all_branches=False):
+    """Return list of remote branch names (via git ls-remote --heads)
+
+    - repo: path to the repo
+    - grep: grep pattern to filter branches by (case-insensitive)
+    - all_branches: if True, don't filter out non-selectable branches or branches
+      prefixed by a qa branch
+
+    Results are alphabetized
+    """
+    output = await _output(repo, queries.LS_REMOTE_HEADS)
+    branches = list(queries.parse_remote_heads(queries.split_lines(output)))
+    return ewm._filter_branches(
+        branches, grep=grep, all_branches=all_branches, repo=_repo_name(repo)
+    )
+
+
+async def get_refs_with_times(repo, ref_prefix, grep=''):
+    """Return list of dicts with ref names, commit ids, and last update times
+
+    - repo: path to the repo
+    - ref_prefix: ref namespace to list (i.e. 'refs/heads', 'refs/remotes/origin')
+    - grep: grep pattern to filter names by (case-insensitive)
+
+    Results are ordered by most recent commit
+    """
+    ref_prefix = ref_prefix.rstrip('/')
+    output = await _output(repo, queries.refs_with_times(ref_prefix))
+    return queries.filter_refs(queries.parse_refs_with_times(output, ref_prefix), grep)
+
+
+async def get_qa_env_branches(repo, qa='', all_qa=False, fetch=True):
+    """Return a list of dicts with info relating to what is on specified qa env
+
+    - repo: path to the repo
+    - qa: name of qa branch that has things pushed to it
+        - if no name is passed in assume all_qa=True
+    - all_qa: if True and no qa passed in, return info for all qa envs
+    - fetch: if True, do a `git fetch` (see fetch_all) first
+    """
+    QA_BRANCHES = ewm._get_repo_settings('QA_BRANCHES', repo=_repo_name(repo))
+    if qa:
+        if qa not in QA_BRANCHES:
+            return
+        qa_branches = [qa]
+    else:
+        qa_branches = QA_BRANCHES
+    if fetch:
+        await fetch_all(repo)
+    env_branches_by_qa = ewm._group_qa_env_branches(
+        await get_refs_with_times(repo, 'refs/remotes/origin'),
+        qa_branches
+    )
+    results = []
+    for qa_name in qa_branches:
+        results.extend(env_branches_by_qa[qa_name])
+    return results
+
+
+async def get_empty_qa(repo, fetch=True):
+    """Return the set of qa names that have nothing on them
+
+    - repo: path to the repo
+    - fetch: if True, do a `git fetch` (see fetch_all) first
+    """
+    QA_BRANCHES = ewm._get_repo_settings('QA_BRANCHES', repo=_repo_name(repo))
+    env_branches = await get_qa_env_branches(repo, fetch=fetch)
+    return set(QA_BRANCHES) - set([b['branch'].split('--', 1)[0] for b in env_branches])
+
+
+async def _get_branch_name(repo):
+    return queries.parse_branch_name(await _output(repo, queries.BRANCH_NAME))
+
+
+async def _get_origin_url(repo):
+    return queries.first_line(await _output(repo, queries.ORIGIN_URL))
+
+
+async def _get_branch_date(repo, branch):
+    return queries.first_line(await _output(repo, queries.branch_date(branch)))
+
+
+async def _get_tracking_branch(repo, branch):
+    output = await _output(repo, queries.REMOTE_REF_NAMES)
+    return queries.parse_tracking_branch(output, branch)
+
+
+async def _get_last_tag(repo):
+    return queries.first_line(await _output(repo, queries.tags(limit=1)))
+
+
+async def _get_range_since_last_tag(repo):
+    tag, until = await asyncio.gather(
+        _get_last_tag(repo),
+        _output(repo, queries.LAST_COMMIT)
+    )
+    first_commit = ''
+    if not tag:
+        first_commit = await _output(repo, queries.FIRST_COMMIT)
+    return queries.make_commit_range(tag, first_commit, until)
+
+
+async def _get_commits_since_last_tag(repo):
+    commit_range = await _get_range_since_last_tag(repo)
+    if not commit_range:
+        return []
+    return queries.split_lines(await _output(repo, queries.commits(commit_range)))
+
+
+async def _get_commits_since_last_tag_summary(repo, n=10):
+    commit_range = await _get_range_since_last_tag(repo)
+    if not commit_range:
+        return queries.make_commit_summary(0, '')
+    count, commits = await asyncio.gather(
+        _output(repo, queries.count_commits(commit_range)),
+        _output(repo, queries.commits(commit_range, n=n))
+    )
+    return queries.make_commit_summary(queries.parse_count(count), commits)
+
+
+async def _get_status(repo):
+    output = await _output(repo, queries.STATUS)
+    return list(queries.parse_status(queries.split_lines(output)))
+
+
+async def _get_lines(repo, cmd):
+    return queries.split_lines(await _output(repo, cmd))
+
+
+async def get_repo_info_dict(repo, fields=None):
+    """Return a dict of info about the repo (see easy_workflow_manager.get_repo_info_dict)
+
+    - repo: path to the repo
+    - fields: list of keys (from REPO_INFO_FIELDS) to include; default is all
+
+    The git queries behind the fields are run concurrently
+    """
+    data = {}
+    repo = os.path.abspath(repo)
+    if not os.path.exists(os.path.join(repo, '.git')):
+        return data
+    fields = ewm._get_repo_info_fields(fields)
+
+    branch = ''
+    if fields & {'branch', 'branch_date', 'branch_tracking', 'branch_tracking_date'}:
+        branch = await _get_branch_name(repo)
+
+    async def tracking_info():
+        tracking = await _get_tracking_branch(repo, branch)
+        date = None
+        if 'branch_tracking_date' in fields:
+            date = await _get_branch_date(repo, tracking)
+        return tracking, date
+
+    tasks = {
+        'url': lambda: _get_origin_url(repo),
+        'branch_date': lambda: _get_branch_date(repo, branch),
+        'last_tag': lambda: _get_last_tag(repo),
+        'status': lambda: _get_status(repo),
+        'stashes': lambda: _get_lines(repo, queries.STASH_LIST),
+        'unpushed': lambda: _get_lines(repo, queries.UNPUSHED),
+        'commits_since_last_tag': lambda: _get_commits_since_last_tag(repo),
+        'commits_since_last_tag_summary': lambda: _get_commits_since_last_tag_summary(repo),
+    }
+    tasks = dict([(field, func) for field, func in tasks.items() if field in fields])
+    if fields & {'branch_tracking', 'branch_tracking_date'}:
+        tasks['tracking'] = tracking_info
+
+    results = {'path': repo, 'branch': branch}
+    values = await asyncio.gather(*[func() for func in tasks.values()])
+    results.update(zip(tasks.keys(), values))
+    if 'tracking' in results:
+        results['branch_tracking'], results['branch_tracking_date'] = results.pop('tracking')
+
+    return ewm._order_repo_info(results, fields)
+
+
+async def delete_remote_branches(repo, *branches, atomic=False):
+    """Delete the specified remote branches with a single push
+
+    - repo: path to the repo
+    - atomic: if True, either all of the branches are deleted or none are
+      (requires server support for atomic pushes)
+
+    Branches that no longer exist on the remote are reported and skipped.
+    Return True if all deletes were successful
+    """
+    branches = sorted(set(branches))
+    if not branches:
+        return True
+    missing = []
+    while branches:
+        args = ['push', '--porcelain'] + (['--atomic'] if atomic else [])
+        _, output = await _git(repo, *(args + ['origin', '--delete'] + branches))
+        print(output)
+        gone = set(ewm.RX_PUSH_MISSING_REF.findall(output)).intersection(branches)
+        if not gone:
+            break
+        missing.extend(sorted(gone))
+        branches = [b for b in branches if b not in gone]
+    return ewm._report_remote_deletes(output, branches, missing)
+
+
+async def _run_in_child(repo, func_name, show=False, **kwargs):
+    """Run easy_workflow_manager.<func_name>(**kwargs) in a child Python process
+    in repo and return its result
+
+    - show: if True, let the child's output through (otherwise it is discarded)
+
+    Callers hold the repo's lock (from _get_lock), so only one child runs per
+    repo at a time. Raise WorkflowError if the child fails
+    """
+    code = 'from easy_workflow_manager.aio import _child_main; _child_main()'
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable, '-c', code, func_name, json.dumps(kwargs),
+        cwd=repo,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=None if show else asyncio.subprocess.DEVNULL
+    )
+    output, _ = await proc.communicate()
+    if proc.returncode != 0 or not output:
+        raise WorkflowError('{} failed in {} (exit code {})'.format(
+            func_name, repo, proc.returncode
+        ))
+    return json.loads(output.decode('utf-8'))
+
+
+def _child_main():
+    """Entry point of the child process started by _run_in_child
+
+    Everything the function prints goes to stderr, so stdout only has the
+    result (as JSON)
+    """
+    func_name, kwargs = sys.argv[1], json.loads(sys.argv[2])
+    result_fd = os.dup(1)
+    os.dup2(2, 1)
+    result = getattr(ewm, func_name)(**kwargs)
+    sys.stdout.flush()
+    with os.fdopen(result_fd, 'w') as fp:
+        fp.write(json.dumps(result))
+
+
+async def deploy_to_qa(repo, qa, branches, precheck=False, refuse_conflicts=False,
+                       octopus=False, use_cache=False, force=False, show=False):
+    """Deploy remote branch(es) to the specified QA branch (non-interactively)
+
+    - repo: path to the repo
+    - qa: name of qa branch that will receive this deploy
+    - branches: string of branch names separated by any of , ; | (or list)
+    - precheck, refuse_conflicts, octopus, use_cache: see
+      easy_workflow_manager.deploy_to_qa
+    - force: if True, replace whatever is already on qa (otherwise
+      WorkflowError is raised if something is there)
+    - show: if True, show the output of the deploy
+
+    Nothing is deployed if qa or any of the branches are not valid.
+    Return qa name if deploy was successful
+    """
+    QA_BRANCHES = ewm._get_repo_settings('QA_BRANCHES', repo=_repo_name(repo))
+    if qa not in QA_BRANCHES or not branches:
+        return
+    if type(branches) == str:
+        branches = [branches]
+    names = []
+    for branch in branches:
+        names.extend(ih.string_to_list(branch))
+    remote_branches = await get_remote_branches(repo)
+    if not names or not set(names).issubset(remote_branches):
+        return
+    async with _get_lock(repo):
+        if not force:
+            await fetch_all(repo, force=True)
+            if await get_qa_env_branches(repo, qa=qa, fetch=False):
+                raise WorkflowError(
+                    'Something is already on {} (use force=True to replace it)'.format(qa)
+                )
+        return await _run_in_child(
+            repo, 'deploy_to_qa', show=show, qa=qa, branches=names,
+            precheck=precheck, refuse_conflicts=refuse_conflicts, octopus=octopus,
+            use_cache=use_cache, force=True
+        )
+
+
+async def merge_qa_to_source(repo, qa, show=False):
+    """Merge the QA-verified code to SOURCE_BRANCH and delete merged branch(es)
+    (non-interactively)
+
+    - repo: path to the repo
+    - qa: name of qa branch to merge to source
+    - show: if True, show the output of the merge
+
+    Raise WorkflowError if there is nothing on qa to merge.
+    Return qa name if merge(s) and delete(s) were successful
+    """
+    QA_BRANCHES = ewm._get_repo_settings('QA_BRANCHES', repo=_repo_name(repo))
+    if qa not in QA_BRANCHES:
+        return
+    async with _get_lock(repo):
+        await fetch_all(repo, force=True)
+        if not await get_qa_env_branches(repo, qa=qa, fetch=False):
+            raise WorkflowError('Nothing on {} to merge'.format(qa))
+        return await _run_in_child(repo, 'merge_qa_to_source', show=show, qa=qa, auto=True)
@@ -0,0 +1,182 @@
+"""Backends that answer the read-only git queries used by easy_workflow_manager
+
+- SubprocessBackend runs git (one process, no shell) for every query
+- PythonBackend reads refs, config, and objects in-process with git_reader,
+  falling back to SubprocessBackend for anything git_reader can't handle
+- CoprocessBackend answers object lookups (commit dates, tag messages) through
+  the pool of long-lived `git cat-file --batch` processes in coprocess,
+  falling back to SubprocessBackend for everything else
+"""
+import re
+import fs_helper as fh
+from functools import wraps
+from easy_workflow_manager import command, coprocess, git_reader, queries
+
+
+class SubprocessBackend(object):
+    """Answer queries by running git commands"""
+    name = 'subprocess'
+
+    def branch_name(self):
+        """Return current branch name ('HEAD' if detached)"""
+        output = command.run_output(queries.BRANCH_NAME, stderr=False)
+        return queries.parse_branch_name(output)
+
+    def local_branches(self):
+        """Return list of all local branch names"""
+        cmd = ['git', 'for-each-ref', '--format=%(refname:strip=2)', 'refs/heads']
+        output = command.run_output(cmd, stderr=False)
+        if not output:
+            return []
+        return re.split('\r?\n', output)
+
+    def branch_date(self, branch):
+        """Return datetime (and relative age) of branch"""
+        output = command.run_output(queries.branch_date(branch), stderr=False)
+        return queries.first_line(output)
+
+    def origin_url(self):
+        """Return url to remote origin (from .git/config file)"""
+        if not fh.repopath():
+            return
+        return queries.first_line(command.run_output(queries.ORIGIN_URL, stderr=False))
+
+    def first_commit_id(self):
+        """Return the first commit id for the repo"""
+        return command.run_output(queries.FIRST_COMMIT, stderr=False)
+
+    def last_commit_id(self):
+        """Return the abbreviated id of the last non-merge commit"""
+        return command.run_output(queries.LAST_COMMIT, stderr=False)
+
+    def tag_listing(self, tag):
+        """Return output of `git tag -n99 <tag>` (tag name and message lines)"""
+        return command.run_output(['git', 'tag', '-n99', tag], stderr=False)
+
+
+def _fallback(method):
+    """Decorator for PythonBackend methods to use SubprocessBackend on failure"""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        except (git_reader.GitReaderError, coprocess.CatFileError, OSError,
+                ValueError, KeyError, IndexError):
+            return getattr(SubprocessBackend, method.__name__)(self, *args, **kwargs)
+    return wrapper
+
+
+class PythonBackend(SubprocessBackend):
+    """Answer queries in-process by reading the files in the .git directory"""
+    name = 'python'
+    max_walk = 5000
+
+    def __init__(self):
+        self._roots = {}
+
+    def _reader(self):
+        return git_reader.get_reader(fh.repopath())
+
+    @_fallback
+    def branch_name(self):
+        reader = self._reader()
+        refname, sha = reader.read_head()
+        if not sha:
+            raise git_reader.GitReaderError('HEAD does not point to a commit')
+        if not refname:
+            return 'HEAD'
+        return reader.shorten_ref(refname)
+
+    @_fallback
+    def local_branches(self):
+        reader = self._reader()
+        refname, _ = reader.read_head()
+        if not refname:
+            raise git_reader.GitReaderError('Detached HEAD is listed by git branch')
+        return sorted([
+            name[11:]
+            for name in reader.list_refs('refs/heads/')
+        ])
+
+    @_fallback
+    def branch_date(self, branch):
+        reader = self._reader()
+        commit = reader.read_commit(reader.rev_parse(branch))
+        committer = commit['committer']
+        return '{} {}'.format(
+            git_reader.format_iso_date(committer['timestamp'], committer['tz']),
+            git_reader.format_relative_date(committer['timestamp'])
+        )
+
+    @_fallback
+    def origin_url(self):
+        if not fh.repopath():
+            return
+        return self._reader().config.get('remote.origin.url', '')
+
+    @_fallback
+    def first_commit_id(self):
+        # Finding the root means reading the whole history, which one
+        # `git rev-list` does much faster than walking commits here, so only
+        # the result (which can't change for a given HEAD) is kept
+        head = self._reader().rev_parse('HEAD')
+        if head not in self._roots:
+            root = SubprocessBackend.first_commit_id(self)
+            if not root:
+                return root
+            self._roots[head] = root
+        return self._roots[head]
+
+    @_fallback
+    def last_commit_id(self):
+        reader = self._reader()
+        for commit in reader.walk_commits(reader.rev_parse('HEAD'), limit=self.max_walk):
+            if len(commit['parents']) < 2:
+                return reader.abbreviate(commit['sha'])
+        return ''
+
+    @_fallback
+    def tag_listing(self, tag):
+        reader = self._reader()
+        sha = reader.read_ref('refs/tags/' + tag)
+        if not sha:
+            raise git_reader.GitReaderError('No tag named {}'.format(tag))
+        obj_type, data = reader.read_object(sha)
+        return git_reader.format_tag_lines(tag, obj_type, data)
+
+
+class CoprocessBackend(SubprocessBackend):
+    """Answer object lookups through long-lived `git cat-file --batch` processes"""
+    name = 'coprocess'
+
+    def _query(self, rev):
+        repo_path = fh.repopath()
+        if not repo_path:
+            raise git_reader.GitReaderError('Not in a git repo')
+        result = coprocess.POOL.query(repo_path, rev)
+        if result is None:
+            raise git_reader.GitReaderError('Unknown revision {}'.format(repr(rev)))
+        return result
+
+    @_fallback
+    def branch_date(self, branch):
+        sha, obj_type, data = self._query(branch or 'HEAD')
+        if obj_type != 'commit':
+            raise git_reader.GitReaderError('{} is a {}'.format(branch, obj_type))
+        committer = git_reader.parse_commit(sha, data)['committer']
+        return '{} {}'.format(
+            git_reader.format_iso_date(committer['timestamp'], committer['tz']),
+            git_reader.format_relative_date(committer['timestamp'])
+        )
+
+    @_fallback
+    def tag_listing(self, tag):
+        sha, obj_type, data = self._query('refs/tags/' + tag)
+        return git_reader.format_tag_lines(tag, obj_type, data)
+
+
+BACKENDS = {
+    SubprocessBackend.name: SubprocessBackend(),
+    PythonBackend.name: PythonBackend(),
+    CoprocessBackend.name: CoprocessBackend(),
+}
@@ -0,0 +1,397 @@
+"""Run commands for easy_workflow_manager, optionally recording a trace
+
+Commands are lists of the program and its arguments (i.e. ['git', 'status',
+'-s']) and are run directly, so each one spawns exactly one process and
+nothing needs to be quoted. A string is still accepted and run through the
+shell (like bg_helper does), which costs a `sh` process plus one per command
+in it.
+
+run, run_output, and run_or_die behave like the bg_helper functions of the
+same name (for the arguments ewm uses); iter_output yields the lines of a
+command's output as they are produced; run_output_async runs a list of args
+without blocking the asyncio event loop.
+
+Every command is counted in PROCESS_STATS (see get_process_stats). While
+tracing is on (see start_trace or the `tracing` context manager), each
+command is also recorded with
+
+- cmd: the command string (arguments are shell-quoted for display)
+- function: innermost public easy_workflow_manager function that ran it
+- operation: outermost public easy_workflow_manager function that ran it
+- cwd: working directory it ran in
+- start: epoch time it started
+- seconds: wall time
+- exit_code: exit status of the command
+- output_bytes: size of the captured output (None when output isn't captured)
+- processes: number of processes spawned (estimated for shell strings)
+
+The console scripts turn this on with --profile (print a summary) and
+--trace FILE (write the records as JSON)
+"""
+import json
+import os
+import shlex
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+API_MODULES = ('easy_workflow_manager', 'easy_workflow_manager.aio')
+SHELL_SEPARATORS = ('|', '||', '&&', ';', '&')
+PROCESS_STATS = {'commands': 0, 'processes': 0, 'shell_commands': 0, 'seconds': 0.0}
+_TRACE = {'enabled': False, 'start': None, 'records': []}
+_LOCK = threading.Lock()
+
+
+def get_process_stats():
+    """Return a dict with the number of commands run, processes spawned by
+    them, how many were shell strings, and seconds spent"""
+    with _LOCK:
+        return PROCESS_STATS.copy()
+
+
+def reset_process_stats():
+    """Set all PROCESS_STATS counts back to 0"""
+    with _LOCK:
+        PROCESS_STATS.update(commands=0, processes=0, shell_commands=0, seconds=0.0)
+
+
+def cmd_string(cmd):
+    """Return cmd as a string (arguments of a list are shell-quoted)"""
+    if isinstance(cmd, str):
+        return cmd
+    return ' '.join([shlex.quote(arg) for arg in cmd])
+
+
+def count_processes(cmd):
+    """Return the number of processes running cmd spawns
+
+    A list of args is one process. For a shell string it's an estimate: `sh`
+    plus one for each command separated by |, ||, &&, ;, or &
+    """
+    if not isinstance(cmd, str):
+        return 1
+    lexer = shlex.shlex(cmd, posix=True, punctuation_chars=True)
+    try:
+        tokens = list(lexer)
+    except ValueError:
+        tokens = []
+    return 2 + len([token for token in tokens if token in SHELL_SEPARATORS])
+
+
+def start_trace():
+    """Start recording commands (clearing anything recorded before)"""
+    with _LOCK:
+        _TRACE['enabled'] = True
+        _TRACE['start'] = time.time()
+        _TRACE['records'] = []
+
+
+def stop_trace():
+    """Stop recording commands and return the list of records"""
+    with _LOCK:
+        _TRACE['enabled'] = False
+        return _TRACE['records'][:]
+
+
+def is_tracing():
+    """Return True if commands are being recorded"""
+    return _TRACE['enabled']
+
+
+def get_trace():
+    """Return a copy of the list of records so far"""
+    with _LOCK:
+        return _TRACE['records'][:]
+
+
+@contextmanager
+def tracing():
+    """Context manager that records commands run inside of it
+
+    Yields the list that the records are added to when the block exits
+    """
+    records = []
+    start_trace()
+    try:
+        yield records
+    finally:
+        records.extend(stop_trace())
+
+
+def _get_callers(depth=2):
+    """Return (innermost, outermost) public API function names on the stack"""
+    names = []
+    frame = sys._getframe(depth)
+    while frame is not None:
+        name = frame.f_code.co_name
+        if (
+            frame.f_globals.get('__name__') in API_MODULES and
+            not name.startswith(('_', '<')) and
+            name != 'wrapper'
+        ):
+            names.append(name)
+        frame = frame.f_back
+    if not names:
+        return None, None
+    return names[0], names[-1]
+
+
+def record(cmd, start, exit_code, output_bytes=None, cwd=None):
+    """Count cmd in PROCESS_STATS and add a record for it (if tracing)
+
+    - cmd: list of args or shell string that was run
+    - start: epoch time it started
+    - cwd: directory cmd ran in (default is the current directory)
+    """
+    seconds = time.time() - start
+    processes = count_processes(cmd)
+    with _LOCK:
+        PROCESS_STATS['commands'] += 1
+        PROCESS_STATS['processes'] += processes
+        PROCESS_STATS['shell_commands'] += isinstance(cmd, str)
+        PROCESS_STATS['seconds'] += seconds
+    if not _TRACE['enabled']:
+        return
+    function, operation = _get_callers(depth=3)
+    entry = {
+        'cmd': cmd_string(cmd),
+        'function': function,
+        'operation': operation,
+        'cwd': cwd or os.getcwd(),
+        'start': start,
+        'seconds': seconds,
+        'exit_code': exit_code,
+        'output_bytes': output_bytes,
+        'processes': processes,
+    }
+    with _LOCK:
+        _TRACE['records'].append(entry)
+
+
+def _show(cmd, cwd=None):
+    if cwd:
+        print('\n$ cd {} && {}'.format(shlex.quote(cwd), cmd_string(cmd)))
+    else:
+        print('\n$ {}'.format(cmd_string(cmd)))
+
+
+def run(cmd, show=False, cwd=None, quiet=False):
+    """Run a command and return the exit status (see bg_helper.run)
+
+    - cmd: list of the program and its arguments, or string with shell command
+    - show: if True, show the command before executing
+    - cwd: directory to run the command in
+    - quiet: if True, discard stdout too (stderr is always discarded)
+    """
+    if show:
+        _show(cmd, cwd)
+    start = time.time()
+    ret_code = subprocess.call(
+        cmd,
+        shell=isinstance(cmd, str),
+        cwd=cwd,
+        stdout=subprocess.DEVNULL if quiet else None,
+        stderr=subprocess.DEVNULL
+    )
+    record(cmd, start, ret_code, cwd=cwd)
+    return ret_code
+
+
+def run_output(cmd, show=False, cwd=None, stderr=True):
+    """Run a command and return its output, stripped
+
+    - cmd: list of the program and its arguments, or string with shell command
+    - show: if True, show the command before executing
+    - cwd: directory to run the command in
+    - stderr: if True, include stderr in output; otherwise discard it
+    """
+    if show:
+        _show(cmd, cwd)
+    start = time.time()
+    proc = subprocess.run(
+        cmd,
+        shell=isinstance(cmd, str),
+        cwd=cwd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT if stderr else subprocess.DEVNULL
+    )
+    record(cmd, start, proc.returncode, len(proc.stdout), cwd=cwd)
+    return proc.stdout.decode('utf-8').strip()
+
+
+def run_or_die(cmd, show=False, cwd=None):
+    """Run a command; raise Exception (with its stderr) if it fails
+
+    - cmd: list of the program and its arguments, or string with shell command
+    - show: if True, show the command before executing
+    - cwd: directory to run the command in
+    """
+    if show:
+        _show(cmd, cwd)
+    start = time.time()
+    ret_code = 1
+    try:
+        proc = subprocess.run(
+            cmd, shell=isinstance(cmd, str), cwd=cwd, stderr=subprocess.PIPE
+        )
+        ret_code = proc.returncode
+    finally:
+        record(cmd, start, ret_code, cwd=cwd)
+    if ret_code != 0:
+        raise Exception(
+            proc.stderr.decode('utf-8').strip() or
+            'The return code was {} (not 0) for {}'.format(ret_code, repr(cmd_string(cmd)))
+        )
+
+
+def iter_output(cmd, cwd=None):
+    """Run a command and yield each line of its stdout as it is produced
+
+    - cmd: list of the program and its arguments, or string with shell command
+    - cwd: directory to run the command in
+
+    Lines are yielded without line endings and stderr is discarded. If the
+    generator is closed before the output is used up, the command is stopped
+    """
+    start = time.time()
+    proc = subprocess.Popen(
+        cmd,
+        shell=isinstance(cmd, str),
+        cwd=cwd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL
+    )
+    size = 0
+    try:
+        for line in proc.stdout:
+            size += len(line)
+            yield line.decode('utf-8').rstrip('\r\n')
+    finally:
+        # Closing the pipe first stops any other commands in a pipeline too
+        proc.stdout.close()
+        if proc.poll() is None:
+            proc.terminate()
+        proc.wait()
+        record(cmd, start, proc.returncode, size, cwd=cwd)
+
+
+async def run_output_async(args, cwd=None, stderr=True):
+    """Run a command without blocking the event loop; Return (exit code, output)
+
+    - args: list of the program and its arguments (not run through a shell)
+    - cwd: directory to run the command in
+    - stderr: if True, include stderr in output; otherwise discard it
+
+    Output is stripped
+    """
+    import asyncio
+    start = time.time()
+    proc = await asyncio.create_subprocess_exec(
+        *args,
+        cwd=cwd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT if stderr else subprocess.DEVNULL
+    )
+    output, _ = await proc.communicate()
+    record(args, start, proc.returncode, len(output), cwd=cwd)
+    return proc.returncode, output.decode('utf-8').strip()
+
+
+def get_profile(records, limit=10):
+    """Return dict summarizing records
+
+    - records: list of trace records
+    - limit: max number of slowest/repeated commands to include
+    """
+    total = sum([r['seconds'] for r in records])
+    processes = sum([r.get('processes', 1) for r in records])
+    by_function = defaultdict(lambda: {'count': 0, 'seconds': 0.0})
+    by_cmd = defaultdict(lambda: {'count': 0, 'seconds': 0.0})
+    for r in records:
+        by_function[r['function'] or '?']['count'] += 1
+        by_function[r['function'] or '?']['seconds'] += r['seconds']
+        by_cmd[(r['cmd'], r['cwd'])]['count'] += 1
+        by_cmd[(r['cmd'], r['cwd'])]['seconds'] += r['seconds']
+    return {
+        'commands': len(records),
+        'processes': processes,
+        'seconds': total,
+        'failed': len([r for r in records if r['exit_code']]),
+        'slowest': sorted(records, key=lambda r: r['seconds'], reverse=True)[:limit],
+        'repeated': sorted(
+            [
+                dict(cmd=cmd, cwd=cwd, **stats)
+                for (cmd, cwd), stats in by_cmd.items()
+                if stats['count'] > 1
+            ],
+            key=lambda r: r['seconds'],
+            reverse=True
+        )[:limit],
+        'functions': sorted(
+            [dict(function=name, **stats) for name, stats in by_function.items()],
+            key=lambda r: r['seconds'],
+            reverse=True
+        ),
+    }
+
+
+def _shorten(cmd, width=70):
+    cmd = ' '.join(cmd.split())
+    return cmd if len(cmd) <= width else cmd[:width - 3] + '...'
+
+
+def format_profile(records, elapsed=None, limit=10):
+    """Return a multi-line string summarizing records
+
+    - records: list of trace records
+    - elapsed: total wall time (seconds) of whatever ran the commands
+    - limit: max number of slowest/repeated commands to show
+    """
+    profile = get_profile(records, limit=limit)
+    lines = ['', '===== ewm profile =====']
+    if elapsed is not None:
+        lines.append('Total time: {:.3f}s'.format(elapsed))
+    lines.append('Commands: {} ({} failed, {} processes) taking {:.3f}s'.format(
+        profile['commands'], profile['failed'], profile['processes'], profile['seconds']
+    ))
+    if profile['functions']:
+        lines.append('\nBy function:')
+        for r in profile['functions']:
+            lines.append('  {:>9.1f}ms {:>4}x  {}'.format(
+                r['seconds'] * 1000, r['count'], r['function']
+            ))
+    if profile['slowest']:
+        lines.append('\nSlowest commands:')
+        for r in profile['slowest']:
+            lines.append('  {:>9.1f}ms  [{}] {}'.format(
+                r['seconds'] * 1000, r['function'] or '?', _shorten(r['cmd'])
+            ))
+    if profile['repeated']:
+        lines.append('\nRepeated commands:')
+        for r in profile['repeated']:
+            lines.append('  {:>9.1f}ms {:>4}x  {}'.format(
+                r['seconds'] * 1000, r['count'], _shorten(r['cmd'])
+            ))
+    return '\n'.join(lines)
+
+
+def write_trace(path, records, elapsed=None):
+    """Write records (and some context) to path as JSON
+
+    - path: file to write
+    - records: list of trace records
+    - elapsed: total wall time (seconds) of whatever ran the commands
+    """
+    data = {
+        'pid': os.getpid(),
+        'argv': sys.argv,
+        'start': _TRACE['start'],
+        'elapsed': elapsed,
+        'commands': records,
+    }
+    with open(path, 'w') as fp:
+        json.dump(data, fp, indent=2)
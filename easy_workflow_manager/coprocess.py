@@ -0,0 +1,222 @@
+"""Long-lived `git cat-file --batch` processes, shared through a bounded pool
+
+Each process answers object lookups over its stdin/stdout pipes, so many
+lookups cost one process startup instead of one each. Idle processes are closed
+by a background reaper thread, and all processes are closed at exit. Processes
+are always closed after the pool's lock is released, since closing one can wait
+for it to exit.
+"""
+import atexit
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+
+
+class CatFileError(Exception):
+    pass
+
+
+class CatFileProcess(object):
+    """A `git cat-file --batch` process for one repo"""
+    def __init__(self, repo_path):
+        self.repo_path = repo_path
+        self.proc = subprocess.Popen(
+            ['git', 'cat-file', '--batch'],
+            cwd=repo_path,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL
+        )
+        self.last_used = time.time()
+
+    @property
+    def alive(self):
+        return self.proc.poll() is None
+
+    def query(self, rev):
+        """Return (sha, type, data) for rev, or None if it doesn't exist
+
+        - rev: any object name git understands (sha, ref, 'tag^{}', etc.)
+        """
+        if '\n' in rev:
+            raise CatFileError('Object names may not contain newlines')
+        try:
+            self.proc.stdin.write(rev.encode('utf-8') + b'\n')
+            self.proc.stdin.flush()
+            header = self.proc.stdout.readline()
+        except (BrokenPipeError, OSError, ValueError) as e:
+            raise CatFileError(str(e))
+        if not header:
+            raise CatFileError('git cat-file exited')
+        parts = header.decode('utf-8', 'replace').split()
+        if len(parts) != 3:
+            return
+        sha, obj_type, size = parts
+        size = int(size)
+        data = self.proc.stdout.read(size)
+        self.proc.stdout.read(1)
+        if len(data) != size:
+            raise CatFileError('Short read from git cat-file')
+        return sha, obj_type, data
+
+    def close(self):
+        """Stop the process"""
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.proc.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+        self.proc.stdout.close()
+
+
+class CatFilePool(object):
+    """Bounded pool of CatFileProcess objects, keyed by repo_path
+
+    - max_per_repo: max number of live processes per repo; callers
+      wait for one to be released when the limit is reached
+    - idle_timeout: seconds a process may sit unused before it is closed
+    """
+    def __init__(self, max_per_repo=4, idle_timeout=300):
+        self.max_per_repo = max_per_repo
+        self.idle_timeout = idle_timeout
+        self._idle = {}
+        self._live = {}
+        self._cond = threading.Condition()
+        self._reaper = None
+        self._closed = False
+        self.stats = {'started': 0, 'queries': 0, 'reaped': 0}
+
+    def _start_reaper(self):
+        if self._reaper is None or not self._reaper.is_alive():
+            self._reaper = threading.Thread(target=self._reap_loop, name='ewm-cat-file-reaper')
+            self._reaper.daemon = True
+            self._reaper.start()
+
+    def _reap_loop(self):
+        while True:
+            with self._cond:
+                if self._closed or not self._live:
+                    return
+                self._cond.wait(timeout=max(self.idle_timeout / 2, 0.1))
+                expired = self._take_expired()
+            for proc in expired:
+                proc.close()
+
+    def _take_expired(self):
+        """Remove processes that have been idle too long (or died) from the pool
+        and return them, to be closed once the lock is released (call with lock
+        held)"""
+        cutoff = time.time() - self.idle_timeout
+        expired = []
+        for key, procs in list(self._idle.items()):
+            keep = []
+            for proc in procs:
+                if proc.last_used < cutoff or not proc.alive:
+                    expired.append(proc)
+                    self._live[key] -= 1
+                    self.stats['reaped'] += 1
+                else:
+                    keep.append(proc)
+            self._idle[key] = keep
+            if self._live[key] == 0:
+                del self._live[key]
+                del self._idle[key]
+        self._cond.notify_all()
+        return expired
+
+    def _acquire(self, key):
+        dead = []
+        try:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise CatFileError('Pool has been shut down')
+                    idle = self._idle.get(key)
+                    while idle:
+                        proc = idle.pop()
+                        if proc.alive:
+                            return proc
+                        dead.append(proc)
+                        self._live[key] -= 1
+                    if self._live.get(key, 0) < self.max_per_repo:
+                        self._live[key] = self._live.get(key, 0) + 1
+                        self._idle.setdefault(key, [])
+                        break
+                    self._cond.wait()
+        finally:
+            for proc in dead:
+                proc.close()
+        try:
+            proc = CatFileProcess(key)
+        except OSError:
+            with self._cond:
+                self._live[key] -= 1
+                self._cond.notify_all()
+            raise
+        with self._cond:
+            self.stats['started'] += 1
+            self._start_reaper()
+        return proc
+
+    def _release(self, key, proc, broken=False):
+        discard = False
+        with self._cond:
+            if broken or self._closed or not proc.alive:
+                discard = True
+                if key in self._live:
+                    self._live[key] -= 1
+            else:
+                proc.last_used = time.time()
+                self._idle[key].append(proc)
+            self._cond.notify_all()
+        if discard:
+            proc.close()
+
+    @contextmanager
+    def process(self, repo_path):
+        """Context manager that checks out a process for repo_path"""
+        proc = self._acquire(repo_path)
+        broken = False
+        try:
+            yield proc
+        except CatFileError:
+            broken = True
+            raise
+        finally:
+            self._release(repo_path, proc, broken=broken)
+
+    def query(self, repo_path, rev):
+        """Return (sha, type, data) for rev in repo_path, or None if missing
+
+        A process that breaks mid-query is discarded and the query is retried
+        once on a fresh process
+        """
+        for attempt in (1, 2):
+            try:
+                with self.process(repo_path) as proc:
+                    result = proc.query(rev)
+                    self.stats['queries'] += 1
+                    return result
+            except CatFileError:
+                if attempt == 2:
+                    raise
+
+    def shutdown(self):
+        """Close all processes and stop handing out new ones"""
+        with self._cond:
+            self._closed = True
+            procs = [proc for idle in self._idle.values() for proc in idle]
+            self._idle.clear()
+            self._live.clear()
+            self._cond.notify_all()
+        for proc in procs:
+            proc.close()
+
+
+POOL = CatFilePool()
+atexit.register(POOL.shutdown)
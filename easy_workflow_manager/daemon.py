@@ -0,0 +1,231 @@
+"""Optional resident server that runs read-only ewm commands for the scripts
+
+The server (`ewm-daemon`) listens on a Unix socket that only the current user
+can reach. It keeps REPO_SETTINGS_CACHE, the ref caches, and any git co-processes
+warm between commands. The console scripts call `run`, which forwards the command
+to the server when it's running and otherwise calls the function in-process.
+
+Each request is one line of JSON sent over a new connection:
+
+    {"command": "show_qa", "kwargs": {...}, "cwd": "...", "env": {...}}
+
+and gets one line of JSON back:
+
+    {"ok": true, "output": "<captured stdout>", "result": <return value>}
+
+Requests are handled one at a time, because each one changes the working
+directory and captures stdout. If the client's settings environment variables
+differ from the server's, the server declines and the client runs the command
+itself.
+"""
+import json
+import os
+import socket
+import sys
+from contextlib import redirect_stdout
+from io import StringIO
+from easy_workflow_manager.command import is_tracing
+
+
+COMMANDS = (
+    'show_remote_branches', 'show_local_branches', 'show_qa', 'show_repo_info',
+    'get_remote_branches', 'get_local_branches', 'get_merged_remote_branches',
+    'get_merged_local_branches', 'get_qa_env_branches', 'get_repo_info_dict',
+    'get_repo_info_string', 'get_tags', 'get_last_tag',
+)
+ENV_NAMES = (
+    'APP_ENV', 'QA_BRANCHES', 'IGNORE_BRANCHES', 'LOCAL_BRANCH', 'SOURCE_BRANCH',
+    'TAG_BRANCH', 'REF_CACHE_SECONDS', 'FETCH_WINDOW_SECONDS', 'GIT_BACKEND',
+    'USE_WORKTREE', 'MERGE_CACHE_SECONDS', 'MERGE_CACHE_ENTRIES',
+)
+CONNECT_TIMEOUT = 0.5
+
+
+def get_socket_path():
+    """Return path to the Unix socket for the current user
+
+    Uses EWM_DAEMON_SOCKET if set, otherwise a socket in XDG_RUNTIME_DIR, or in
+    /tmp/ewm-<uid>
+    """
+    path = os.environ.get('EWM_DAEMON_SOCKET')
+    if path:
+        return path
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir and os.path.isdir(runtime_dir):
+        return os.path.join(runtime_dir, 'ewm-daemon.sock')
+    return os.path.join('/tmp', 'ewm-{}'.format(os.getuid()), 'daemon.sock')
+
+
+def _get_env():
+    return dict([(name, os.environ.get(name)) for name in ENV_NAMES])
+
+
+def _send(request, path=None):
+    """Send request to the server and return its response (raise OSError if
+    the server isn't running)"""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(CONNECT_TIMEOUT)
+        sock.connect(path or get_socket_path())
+        sock.settimeout(None)
+        sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        with sock.makefile('rb') as fp:
+            line = fp.readline()
+    finally:
+        sock.close()
+    if not line:
+        raise ConnectionError('No response from ewm daemon')
+    return json.loads(line.decode('utf-8'))
+
+
+def forward(command, **kwargs):
+    """Run command in the server and print its output
+
+    - command: name of an easy_workflow_manager function in COMMANDS
+    - kwargs: keyword arguments for the function
+
+    Return (True, result) if the server ran the command, or (False, None) if
+    it is not running, is disabled by EWM_NO_DAEMON, declined the command, or
+    commands are being traced in this process
+    """
+    if os.environ.get('EWM_NO_DAEMON') or is_tracing():
+        return False, None
+    request = {
+        'command': command,
+        'kwargs': kwargs,
+        'cwd': os.getcwd(),
+        'env': _get_env(),
+    }
+    try:
+        response = _send(request)
+    except (OSError, ValueError):
+        return False, None
+    if not response.get('ok'):
+        return False, None
+    sys.stdout.write(response['output'])
+    sys.stdout.flush()
+    return True, response.get('result')
+
+
+def run(command, **kwargs):
+    """Run command in the server if it's running, otherwise in-process
+
+    - command: name of an easy_workflow_manager function in COMMANDS
+    - kwargs: keyword arguments for the function
+
+    Return the function's result
+    """
+    handled, result = forward(command, **kwargs)
+    if handled:
+        return result
+    import easy_workflow_manager as ewm
+    return getattr(ewm, command)(**kwargs)
+
+
+def is_running(path=None):
+    """Return pid of the server if it's running, else None"""
+    try:
+        response = _send({'command': 'ping'}, path=path)
+    except (OSError, ValueError):
+        return
+    return response.get('result')
+
+
+def stop(path=None):
+    """Ask the server to exit; Return True if it was running"""
+    try:
+        _send({'command': 'stop'}, path=path)
+    except (OSError, ValueError):
+        return False
+    return True
+
+
+def handle_request(request):
+    """Run a request in this process and return the response dict"""
+    import easy_workflow_manager as ewm
+    command = request.get('command')
+    if command == 'ping':
+        return {'ok': True, 'output': '', 'result': os.getpid()}
+    if command not in COMMANDS:
+        return {'ok': False, 'error': 'Unknown command {}'.format(repr(command))}
+    if request.get('env') != _get_env():
+        return {'ok': False, 'error': 'Settings environment differs from daemon'}
+    output = StringIO()
+    try:
+        os.chdir(request['cwd'])
+        with redirect_stdout(output):
+            result = getattr(ewm, command)(**request.get('kwargs', {}))
+        response = {'ok': True, 'output': output.getvalue(), 'result': result}
+        json.dumps(response)
+    except Exception as e:
+        response = {'ok': False, 'error': repr(e)}
+    return response
+
+
+def _make_socket_dir(path):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    if os.stat(directory).st_uid != os.getuid():
+        raise PermissionError('{} is owned by another user'.format(directory))
+
+
+def serve(path=None, show=True):
+    """Listen on the Unix socket and handle requests until asked to stop
+
+    - path: path to the socket (default from get_socket_path)
+    - show: if True, print a line for each request handled
+    """
+    path = path or get_socket_path()
+    pid = is_running(path)
+    if pid:
+        print('ewm daemon is already running (pid {}) on {}'.format(pid, path))
+        return
+    _make_socket_dir(path)
+    if os.path.exists(path):
+        os.remove(path)
+
+    # Load settings (and the helper packages) before the first request
+    import easy_workflow_manager as ewm
+    ewm.get_setting('LOCAL_BRANCH')
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o177)
+    try:
+        server.bind(path)
+    finally:
+        os.umask(old_umask)
+    server.listen(16)
+    if show:
+        print('ewm daemon (pid {}) listening on {}'.format(os.getpid(), path))
+    cwd = os.getcwd()
+    try:
+        while True:
+            conn, _ = server.accept()
+            with conn:
+                conn.settimeout(5)
+                try:
+                    with conn.makefile('rb') as fp:
+                        request = json.loads(fp.readline().decode('utf-8'))
+                except (OSError, ValueError):
+                    continue
+                command = request.get('command')
+                if command == 'stop':
+                    response = {'ok': True, 'output': '', 'result': None}
+                else:
+                    response = handle_request(request)
+                    os.chdir(cwd)
+                if show and command != 'ping':
+                    print('{} {} {}'.format(
+                        'ok' if response['ok'] else 'declined', command,
+                        request.get('cwd', '')
+                    ))
+                try:
+                    conn.settimeout(None)
+                    conn.sendall(json.dumps(response).encode('utf-8') + b'\n')
+                except OSError:
+                    pass
+                if command == 'stop':
+                    break
+    finally:
+        server.close()
+        if os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,642 @@
+"""Pure-Python, read-only access to refs, config, and objects of a git repo
+
+Supports loose refs, packed-refs, loose objects, and v2 pack files (including
+ofs/ref deltas) read via mmap. Anything that isn't supported (reftable,
+sha256 repos, shallow clones, complex revision expressions, etc.) raises
+GitReaderError so callers can fall back to running git.
+"""
+import heapq
+import mmap
+import os
+import re
+import struct
+import time
+import zlib
+from binascii import hexlify, unhexlify
+from datetime import datetime, timedelta, timezone
+
+
+RX_SHA = re.compile(r'^[0-9a-f]{40}$')
+RX_PERSON = re.compile(r'^(?P<name>.*) <(?P<email>.*)> (?P<timestamp>\d+) (?P<tz>[+-]\d{4})$')
+REF_RULES = (
+    '{}', 'refs/{}', 'refs/tags/{}', 'refs/heads/{}', 'refs/remotes/{}',
+    'refs/remotes/{}/HEAD'
+)
+OBJ_TYPES = {1: 'commit', 2: 'tree', 3: 'blob', 4: 'tag'}
+OBJ_OFS_DELTA = 6
+OBJ_REF_DELTA = 7
+SIGNATURE_HEADERS = (
+    '-----BEGIN PGP SIGNATURE-----', '-----BEGIN PGP MESSAGE-----',
+    '-----BEGIN SSH SIGNATURE-----', '-----BEGIN SIGNED MESSAGE-----'
+)
+_READERS = {}
+
+
+class GitReaderError(Exception):
+    pass
+
+
+def get_reader(repo_path):
+    """Return a (cached) GitReader for the repo at repo_path"""
+    if not repo_path:
+        raise GitReaderError('Not in a git repo')
+    reader = _READERS.get(repo_path)
+    if reader is None:
+        reader = GitReader(repo_path)
+        _READERS[repo_path] = reader
+    return reader
+
+
+def format_iso_date(timestamp, tz):
+    """Return date string in the format of git's %ci (i.e. '2020-01-31 13:45:00 -0500')
+
+    - timestamp: seconds since epoch
+    - tz: offset string from a commit header (i.e. '-0500')
+    """
+    sign = -1 if tz[0] == '-' else 1
+    offset = timedelta(hours=int(tz[1:3]), minutes=int(tz[3:5])) * sign
+    dt = datetime.fromtimestamp(timestamp, timezone(offset))
+    return '{} {}'.format(dt.strftime('%Y-%m-%d %H:%M:%S'), tz)
+
+
+def _plural(num, unit):
+    return '{} {}{}'.format(num, unit, '' if num == 1 else 's')
+
+
+def format_relative_date(timestamp, now=None):
+    """Return relative date string in the format of git's %cr (i.e. '3 days ago')
+
+    - timestamp: seconds since epoch
+    - now: seconds since epoch to compare against (default current time)
+
+    This follows show_date_relative from git's date.c
+    """
+    now = int(time.time() if now is None else now)
+    if now < timestamp:
+        return 'in the future'
+    diff = now - timestamp
+    if diff < 90:
+        return _plural(diff, 'second') + ' ago'
+    diff = (diff + 30) // 60
+    if diff < 90:
+        return _plural(diff, 'minute') + ' ago'
+    diff = (diff + 30) // 60
+    if diff < 36:
+        return _plural(diff, 'hour') + ' ago'
+    diff = (diff + 12) // 24
+    if diff < 14:
+        return _plural(diff, 'day') + ' ago'
+    if diff < 70:
+        return _plural((diff + 3) // 7, 'week') + ' ago'
+    if diff < 365:
+        return _plural((diff + 15) // 30, 'month') + ' ago'
+    if diff < 1825:
+        total_months = (diff * 12 * 2 + 365) // (365 * 2)
+        years, months = divmod(total_months, 12)
+        if months:
+            return '{}, {} ago'.format(_plural(years, 'year'), _plural(months, 'month'))
+        return _plural(years, 'year') + ' ago'
+    return _plural((diff + 183) // 365, 'year') + ' ago'
+
+
+def _parse_person(value):
+    match = RX_PERSON.match(value)
+    if not match:
+        raise GitReaderError('Could not parse {}'.format(repr(value)))
+    info = match.groupdict()
+    info['timestamp'] = int(info['timestamp'])
+    return info
+
+
+def parse_commit(sha, data):
+    """Return dict with tree, parents, author, committer, and message
+
+    - sha: id of the commit
+    - data: raw bytes of the commit object
+    """
+    header, _, message = data.partition(b'\n\n')
+    commit = {'sha': sha, 'parents': [], 'message': message.decode('utf-8', 'replace')}
+    for line in header.decode('utf-8', 'replace').split('\n'):
+        key, _, value = line.partition(' ')
+        if key == 'parent':
+            commit['parents'].append(value)
+        elif key == 'tree':
+            commit['tree'] = value
+        elif key in ('author', 'committer'):
+            commit[key] = _parse_person(value)
+    return commit
+
+
+def format_tag_lines(tag, obj_type, data, lines=99):
+    """Return what `git tag -n<lines> <tag>` shows for the object a tag points to
+
+    - tag: name of the tag
+    - obj_type: 'tag' for annotated tags, 'commit' for lightweight tags
+    - data: raw bytes of the object
+    - lines: max number of message lines to show
+    """
+    if obj_type not in ('tag', 'commit'):
+        raise GitReaderError('Tag {} points to a {}'.format(tag, obj_type))
+    _, _, message = data.partition(b'\n\n')
+    message = message.decode('utf-8', 'replace')
+    if obj_type == 'tag':
+        pos = 0
+        sig_start = len(message)
+        while pos < len(message):
+            if message.startswith(SIGNATURE_HEADERS, pos):
+                sig_start = pos
+            eol = message.find('\n', pos)
+            pos = len(message) if eol == -1 else eol + 1
+        message = message[:sig_start]
+    message = message.lstrip('\n')
+    shown = []
+    pos = 0
+    while len(shown) < lines and pos < len(message):
+        eol = message.find('\n', pos)
+        if eol == -1:
+            shown.append(message[pos:])
+            break
+        shown.append(message[pos:eol])
+        pos = eol + 1
+    return '{:<15} {}'.format(tag, '\n    '.join(shown))
+
+
+def _read_varint(data, pos):
+    """Return (value, new pos) for a little-endian base-128 size in a delta"""
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, pos
+
+
+def _apply_delta(base, delta):
+    """Return the result of applying a git pack delta to base"""
+    src_size, pos = _read_varint(delta, 0)
+    dst_size, pos = _read_varint(delta, pos)
+    if src_size != len(base):
+        raise GitReaderError('Delta base size mismatch')
+    out = bytearray()
+    delta_len = len(delta)
+    while pos < delta_len:
+        op = delta[pos]
+        pos += 1
+        if op & 0x80:
+            offset = size = 0
+            for i, shift in enumerate((0, 8, 16, 24)):
+                if op & (1 << i):
+                    offset |= delta[pos] << shift
+                    pos += 1
+            for i, shift in enumerate((0, 8, 16)):
+                if op & (0x10 << i):
+                    size |= delta[pos] << shift
+                    pos += 1
+            if size == 0:
+                size = 0x10000
+            out += base[offset:offset + size]
+        elif op:
+            out += delta[pos:pos + op]
+            pos += op
+        else:
+            raise GitReaderError('Invalid delta opcode')
+    if len(out) != dst_size:
+        raise GitReaderError('Delta result size mismatch')
+    return bytes(out)
+
+
+def _inflate(buf, pos, size):
+    """Return size bytes of zlib-inflated data that starts at buf[pos]"""
+    decompressor = zlib.decompressobj()
+    chunks = []
+    chunk_size = max(size + 64, 1024)
+    while not decompressor.eof:
+        data = buf[pos:pos + chunk_size]
+        if not data:
+            break
+        pos += len(data)
+        chunks.append(decompressor.decompress(data))
+    result = b''.join(chunks)
+    if len(result) != size:
+        raise GitReaderError('Inflated object has the wrong size')
+    return result
+
+
+class Pack(object):
+    """A pack file and its v2 index, both read via mmap"""
+    def __init__(self, idx_path):
+        self.idx_path = idx_path
+        self.pack_path = idx_path[:-4] + '.pack'
+        with open(idx_path, 'rb') as fp:
+            self.idx = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.idx[:8] != b'\xfftOc\x00\x00\x00\x02':
+            raise GitReaderError('Unsupported pack index {}'.format(idx_path))
+        self.fanout = struct.unpack('>256I', self.idx[8:8 + 1024])
+        self.count = self.fanout[255]
+        self._sha_start = 8 + 1024
+        self._offset_start = self._sha_start + 24 * self.count
+        self._large_offset_start = self._offset_start + 4 * self.count
+        self._pack = None
+
+    @property
+    def pack(self):
+        if self._pack is None:
+            with open(self.pack_path, 'rb') as fp:
+                self._pack = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._pack
+
+    def _sha_at(self, i):
+        start = self._sha_start + 20 * i
+        return self.idx[start:start + 20]
+
+    def find(self, binsha):
+        """Return index position of binsha, or a negative insertion point - 1"""
+        first = binsha[0]
+        lo = self.fanout[first - 1] if first else 0
+        hi = self.fanout[first]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            current = self._sha_at(mid)
+            if current < binsha:
+                lo = mid + 1
+            elif current > binsha:
+                hi = mid
+            else:
+                return mid
+        return -lo - 1
+
+    def neighbors(self, binsha):
+        """Return the shas (other than binsha) sorted just before/after it"""
+        pos = self.find(binsha)
+        if pos >= 0:
+            candidates = (pos - 1, pos + 1)
+        else:
+            pos = -pos - 1
+            candidates = (pos - 1, pos)
+        return [
+            self._sha_at(i)
+            for i in candidates
+            if 0 <= i < self.count
+        ]
+
+    def offset_of(self, binsha):
+        pos = self.find(binsha)
+        if pos < 0:
+            return
+        start = self._offset_start + 4 * pos
+        offset = struct.unpack('>I', self.idx[start:start + 4])[0]
+        if offset & 0x80000000:
+            start = self._large_offset_start + 8 * (offset & 0x7fffffff)
+            offset = struct.unpack('>Q', self.idx[start:start + 8])[0]
+        return offset
+
+    def read_at(self, offset, read_object):
+        """Return (type, data) of the object at offset, resolving deltas
+
+        - read_object: func that returns (type, data) for a sha (hex) that is
+          the base of a ref delta
+        """
+        deltas = []
+        while True:
+            pack = self.pack
+            byte = pack[offset]
+            pos = offset + 1
+            obj_type = (byte >> 4) & 7
+            size = byte & 15
+            shift = 4
+            while byte & 0x80:
+                byte = pack[pos]
+                pos += 1
+                size |= (byte & 0x7f) << shift
+                shift += 7
+            if obj_type == OBJ_OFS_DELTA:
+                byte = pack[pos]
+                pos += 1
+                base_distance = byte & 0x7f
+                while byte & 0x80:
+                    byte = pack[pos]
+                    pos += 1
+                    base_distance = ((base_distance + 1) << 7) | (byte & 0x7f)
+                deltas.append(_inflate(pack, pos, size))
+                offset = offset - base_distance
+                continue
+            elif obj_type == OBJ_REF_DELTA:
+                base_sha = hexlify(pack[pos:pos + 20]).decode('ascii')
+                deltas.append(_inflate(pack, pos + 20, size))
+                obj_type, data = read_object(base_sha)
+                break
+            elif obj_type in OBJ_TYPES:
+                obj_type = OBJ_TYPES[obj_type]
+                data = _inflate(pack, pos, size)
+                break
+            else:
+                raise GitReaderError('Unknown pack object type {}'.format(obj_type))
+        for delta in reversed(deltas):
+            data = _apply_delta(data, delta)
+        return obj_type, data
+
+
+class GitReader(object):
+    """Read-only view of the refs, config, and objects of one repo"""
+    def __init__(self, repo_path):
+        self.repo_path = repo_path
+        git_dir = os.path.join(repo_path, '.git')
+        if os.path.isfile(git_dir):
+            with open(git_dir, 'r') as fp:
+                text = fp.read().strip()
+            if not text.startswith('gitdir:'):
+                raise GitReaderError('Could not read {}'.format(git_dir))
+            git_dir = os.path.normpath(os.path.join(repo_path, text[7:].strip()))
+        if not os.path.isdir(git_dir):
+            raise GitReaderError('No git dir for {}'.format(repo_path))
+        self.git_dir = git_dir
+        self.common_dir = git_dir
+        commondir_file = os.path.join(git_dir, 'commondir')
+        if os.path.isfile(commondir_file):
+            with open(commondir_file, 'r') as fp:
+                self.common_dir = os.path.normpath(os.path.join(git_dir, fp.read().strip()))
+        if os.path.exists(os.path.join(self.common_dir, 'reftable')):
+            raise GitReaderError('reftable ref storage is not supported')
+        self.objects_dir = os.path.join(self.common_dir, 'objects')
+        self._packed_refs = None
+        self._packed_refs_mtime = None
+        self._packs = {}
+        self._packs_mtime = None
+        self._config = None
+        self._config_mtime = None
+
+    # --- config -----------------------------------------------------------
+
+    @property
+    def config(self):
+        """Dict of 'section.subsection.key' -> last value from .git/config"""
+        path = os.path.join(self.common_dir, 'config')
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if self._config is None or mtime != self._config_mtime:
+            self._config = self._parse_config(path)
+            self._config_mtime = mtime
+            if self._config.get('extensions.objectformat', 'sha1').lower() != 'sha1':
+                raise GitReaderError('Only sha1 repos are supported')
+        return self._config
+
+    def _parse_config(self, path):
+        config = {}
+        section = ''
+        try:
+            with open(path, 'r') as fp:
+                lines = fp.read().splitlines()
+        except OSError:
+            return config
+        for line in lines:
+            line = line.strip()
+            if not line or line[0] in '#;':
+                continue
+            if line.startswith('['):
+                header = line[1:line.index(']')]
+                if '"' in header:
+                    name, subsection = header.split('"', 1)
+                    section = '{}.{}'.format(name.strip().lower(), subsection.rsplit('"', 1)[0])
+                else:
+                    section = header.strip().lower()
+                continue
+            if '=' in line:
+                key, value = line.split('=', 1)
+                value = value.strip()
+                if value.startswith('"') and value.endswith('"') and len(value) > 1:
+                    value = value[1:-1]
+            else:
+                key, value = line, 'true'
+            config['{}.{}'.format(section, key.strip().lower())] = value
+        return config
+
+    # --- refs -------------------------------------------------------------
+
+    @property
+    def packed_refs(self):
+        """Dict of refname -> sha from packed-refs (re-read when it changes)"""
+        path = os.path.join(self.common_dir, 'packed-refs')
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if self._packed_refs is None or mtime != self._packed_refs_mtime:
+            refs = {}
+            if mtime is not None:
+                with open(path, 'r') as fp:
+                    for line in fp:
+                        if not line or line[0] in '#^':
+                            continue
+                        sha, _, refname = line.rstrip('\n').partition(' ')
+                        refs[refname] = sha
+            self._packed_refs = refs
+            self._packed_refs_mtime = mtime
+        return self._packed_refs
+
+    def _ref_path(self, refname):
+        if refname.startswith('refs/') and not refname.startswith(('refs/bisect/', 'refs/worktree/')):
+            return os.path.join(self.common_dir, refname)
+        return os.path.join(self.git_dir, refname)
+
+    def read_ref(self, refname, depth=0):
+        """Return the sha that refname points to (following symrefs), or None"""
+        if depth > 5:
+            raise GitReaderError('Symbolic ref loop at {}'.format(refname))
+        path = self._ref_path(refname)
+        try:
+            with open(path, 'r') as fp:
+                value = fp.read().strip()
+        except IsADirectoryError:
+            return
+        except OSError:
+            return self.packed_refs.get(refname)
+        if value.startswith('ref:'):
+            return self.read_ref(value[4:].strip(), depth + 1)
+        if not RX_SHA.match(value):
+            raise GitReaderError('Could not read ref {}'.format(refname))
+        return value
+
+    def read_head(self):
+        """Return (symbolic ref name or None, sha or None) for HEAD"""
+        with open(os.path.join(self.git_dir, 'HEAD'), 'r') as fp:
+            value = fp.read().strip()
+        if value.startswith('ref:'):
+            refname = value[4:].strip()
+            return refname, self.read_ref(refname)
+        if not RX_SHA.match(value):
+            raise GitReaderError('Could not read HEAD')
+        return None, value
+
+    def list_refs(self, prefix):
+        """Return dict of refname -> sha for all refs under prefix (i.e. 'refs/heads/')"""
+        prefix = prefix.rstrip('/') + '/'
+        refs = dict([
+            (refname, sha)
+            for refname, sha in self.packed_refs.items()
+            if refname.startswith(prefix)
+        ])
+        base = os.path.join(self.common_dir, prefix)
+        for dirpath, dirnames, filenames in os.walk(base):
+            for filename in filenames:
+                if filename.endswith('.lock'):
+                    continue
+                refname = os.path.relpath(os.path.join(dirpath, filename), self.common_dir)
+                refname = refname.replace(os.sep, '/')
+                sha = self.read_ref(refname)
+                if sha:
+                    refs[refname] = sha
+        return refs
+
+    def rev_parse(self, name):
+        """Return sha for a full sha, 'HEAD', or a ref name (resolved like git does)
+
+        Anything else (abbreviated shas, rev expressions) raises GitReaderError
+        """
+        name = name or 'HEAD'
+        if RX_SHA.match(name):
+            return name
+        if name == 'HEAD':
+            sha = self.read_head()[1]
+            if sha:
+                return sha
+            raise GitReaderError('HEAD does not point to a commit')
+        if re.search(r'[~^:@{}\s*?\[\\]', name) or '..' in name:
+            raise GitReaderError('Unsupported revision {}'.format(repr(name)))
+        for rule in REF_RULES:
+            sha = self.read_ref(rule.format(name))
+            if sha:
+                return sha
+        raise GitReaderError('Unknown revision {}'.format(repr(name)))
+
+    def shorten_ref(self, refname):
+        """Return shortest unambiguous name for refname (like --abbrev-ref)"""
+        for rule in reversed(REF_RULES):
+            head, _, tail = rule.partition('{}')
+            if refname.startswith(head) and refname.endswith(tail) and len(refname) > len(head) + len(tail):
+                short = refname[len(head):len(refname) - len(tail)]
+                rule_index = REF_RULES.index(rule)
+                for other in REF_RULES[:rule_index]:
+                    if self.read_ref(other.format(short)):
+                        raise GitReaderError('Ambiguous ref {}'.format(refname))
+                return short
+        return refname
+
+    # --- objects ----------------------------------------------------------
+
+    @property
+    def packs(self):
+        """List of Pack objects (re-scanned when objects/pack changes)"""
+        pack_dir = os.path.join(self.objects_dir, 'pack')
+        try:
+            mtime = os.stat(pack_dir).st_mtime_ns
+        except OSError:
+            return []
+        if mtime != self._packs_mtime:
+            packs = {}
+            for filename in sorted(os.listdir(pack_dir)):
+                if filename.endswith('.idx'):
+                    path = os.path.join(pack_dir, filename)
+                    if not os.path.isfile(path[:-4] + '.pack'):
+                        continue
+                    packs[path] = self._packs.get(path) or Pack(path)
+            self._packs = packs
+            self._packs_mtime = mtime
+        return list(self._packs.values())
+
+    def read_object(self, sha):
+        """Return (type, data) for the object with the given sha"""
+        path = os.path.join(self.objects_dir, sha[:2], sha[2:])
+        try:
+            with open(path, 'rb') as fp:
+                raw = zlib.decompress(fp.read())
+        except FileNotFoundError:
+            pass
+        else:
+            header, _, data = raw.partition(b'\x00')
+            obj_type, _, size = header.decode('ascii').partition(' ')
+            if int(size) != len(data):
+                raise GitReaderError('Corrupt loose object {}'.format(sha))
+            return obj_type, data
+        binsha = unhexlify(sha)
+        for pack in self.packs:
+            offset = pack.offset_of(binsha)
+            if offset is not None:
+                return pack.read_at(offset, self.read_object)
+        if os.path.isfile(os.path.join(self.objects_dir, 'info', 'alternates')):
+            raise GitReaderError('Alternate object stores are not supported')
+        raise GitReaderError('Object {} not found'.format(sha))
+
+    def read_commit(self, sha):
+        """Return dict with tree, parents, author, committer, and message"""
+        obj_type, data = self.read_object(sha)
+        if obj_type != 'commit':
+            raise GitReaderError('{} is a {}, not a commit'.format(sha, obj_type))
+        return parse_commit(sha, data)
+
+    def abbreviate(self, sha):
+        """Return shortest unique abbreviation of sha (like git's %h)
+
+        Honors core.abbrev; otherwise the minimum length is picked from the
+        approximate number of packed objects, the same way git does it
+        """
+        abbrev = self.config.get('core.abbrev', 'auto')
+        if abbrev.isdigit():
+            min_len = max(int(abbrev), 4)
+        elif abbrev == 'auto':
+            count = sum([pack.count for pack in self.packs])
+            bits = count.bit_length()
+            min_len = max((bits + 1) // 2, 7)
+        else:
+            raise GitReaderError('Unsupported core.abbrev {}'.format(repr(abbrev)))
+        binsha = unhexlify(sha)
+        common = 0
+        for pack in self.packs:
+            for other in pack.neighbors(binsha):
+                common = max(common, _common_hex_prefix(sha, hexlify(other).decode('ascii')))
+        try:
+            loose = os.listdir(os.path.join(self.objects_dir, sha[:2]))
+        except OSError:
+            loose = []
+        for name in loose:
+            if len(name) == 38 and name != sha[2:]:
+                common = max(common, 2 + _common_hex_prefix(sha[2:], name))
+        return sha[:min(max(min_len, common + 1), 40)]
+
+    def walk_commits(self, sha, limit=None):
+        """Yield commit dicts reachable from sha, newest commit date first
+
+        - limit: max number of commits to visit before raising GitReaderError
+        """
+        if os.path.isfile(os.path.join(self.common_dir, 'shallow')):
+            raise GitReaderError('Shallow repos are not supported')
+        if os.path.isdir(os.path.join(self.common_dir, 'refs', 'replace')) or \
+                os.path.isfile(os.path.join(self.common_dir, 'info', 'grafts')):
+            raise GitReaderError('Replace refs and grafts are not supported')
+        seen = set([sha])
+        first = self.read_commit(sha)
+        queue = [(-first['committer']['timestamp'], 0, first)]
+        counter = 1
+        while queue:
+            _, _, commit = heapq.heappop(queue)
+            yield commit
+            if limit is not None and counter > limit:
+                raise GitReaderError('Walked more than {} commits'.format(limit))
+            for parent in commit['parents']:
+                if parent not in seen:
+                    seen.add(parent)
+                    parent_commit = self.read_commit(parent)
+                    heapq.heappush(queue, (-parent_commit['committer']['timestamp'], counter, parent_commit))
+                    counter += 1
+
+
+def _common_hex_prefix(a, b):
+    i = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        i += 1
+    return i
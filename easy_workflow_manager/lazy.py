@@ -0,0 +1,35 @@
+"""Stand-ins for modules that are only imported the first time they are used
+
+Keeps `import easy_workflow_manager` (and the startup of every ewm-* script)
+from paying for helper packages that a particular code path never touches
+"""
+import importlib
+
+
+class LazyModule(object):
+    """Proxy for a module that is imported on first attribute access
+
+    - name: full name of the module to import
+    """
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        if self._module is None:
+            self.__dict__['_module'] = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        if self._module is None:
+            return '<lazy module {}>'.format(repr(self._name))
+        return repr(self._module)
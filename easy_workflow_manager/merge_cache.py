@@ -0,0 +1,102 @@
+"""Persistent cache of merge results, stored per repo under the git dir
+
+Maps the exact inputs of a merge_branches_locally run (the source commit, the
+ordered commits of the merged branches, and the merge mode) to the commit it
+produced, so an identical merge can be reused instead of redone. Entries are
+evicted once they haven't been used for max_age seconds, and only the
+max_entries most recently used are kept. Updates are done under
+ref_cache.locked, like the ref cache's.
+"""
+import os
+import time
+from easy_workflow_manager.ref_cache import CACHE_DIRNAME, load_file, locked, save_file
+
+
+CACHE_FILENAME = 'merge-results.json'
+
+
+def get_cache_file(git_dir):
+    """Return path to the merge result cache file for git_dir"""
+    return os.path.join(git_dir, CACHE_DIRNAME, CACHE_FILENAME)
+
+
+def make_key(source_sha, branch_shas, mode='sequential'):
+    """Return the cache key for a merge of branch_shas (in order) onto source_sha"""
+    return '{}:{}:{}'.format(mode, source_sha, ','.join(branch_shas))
+
+
+def _load(git_dir):
+    return load_file(get_cache_file(git_dir))
+
+
+def _save(git_dir, data):
+    save_file(get_cache_file(git_dir), data)
+
+
+def _evict(data, max_age, max_entries):
+    """Return data without entries unused for max_age seconds, keeping at most
+    max_entries of the most recently used"""
+    cutoff = time.time() - max_age
+    entries = sorted(
+        [(key, entry) for key, entry in data.items() if entry.get('used', 0) >= cutoff],
+        key=lambda item: item[1].get('used', 0),
+        reverse=True
+    )
+    return dict(entries[:max_entries])
+
+
+def get(git_dir, key, max_age):
+    """Return the cached merge commit for key, or None
+
+    - git_dir: path to the .git directory of a repo
+    - key: result of make_key
+    - max_age: max number of seconds since the entry was last used
+
+    Callers should make sure the commit still exists before using it
+    """
+    if not git_dir or not max_age or max_age <= 0:
+        return
+    with locked(get_cache_file(git_dir)):
+        data = _load(git_dir)
+        entry = data.get(key)
+        if not entry or time.time() - entry.get('used', 0) > max_age:
+            return
+        entry['used'] = time.time()
+        _save(git_dir, data)
+    return entry.get('commit')
+
+
+def put(git_dir, key, commit, max_age, max_entries):
+    """Store the merge commit for key and evict old entries
+
+    - git_dir: path to the .git directory of a repo
+    - key: result of make_key
+    - commit: full id of the commit the merge produced
+    - max_age: max number of seconds since an entry was last used
+    - max_entries: max number of entries to keep
+    """
+    if not git_dir or not max_age or not max_entries:
+        return
+    with locked(get_cache_file(git_dir)):
+        now = time.time()
+        data = _load(git_dir)
+        data[key] = {'commit': commit, 'created': now, 'used': now}
+        _save(git_dir, _evict(data, max_age, max_entries))
+
+
+def discard(git_dir, key):
+    """Remove the entry for key (e.g. when its commit no longer exists)"""
+    if not git_dir:
+        return
+    with locked(get_cache_file(git_dir)):
+        data = _load(git_dir)
+        if data.pop(key, None) is not None:
+            _save(git_dir, data)
+
+
+def clear(git_dir):
+    """Remove all cached merge results for git_dir"""
+    try:
+        os.remove(get_cache_file(git_dir))
+    except OSError:
+        pass
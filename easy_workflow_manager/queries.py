@@ -0,0 +1,160 @@
+"""Git commands and output parsing shared by easy_workflow_manager (and its
+backends) and easy_workflow_manager.aio
+
+Commands are tuples of args for command.run_output / command.run_output_async
+(run without a shell, stderr discarded), and the parse_* functions read their
+output. The sync and async APIs only differ in how they run the commands, so
+they can't drift apart in what they run or how the output is read.
+"""
+import re
+
+
+BRANCH_NAME = ('git', 'rev-parse', '--abbrev-ref', 'HEAD')
+ORIGIN_URL = ('git', 'config', '--get', 'remote.origin.url')
+FIRST_COMMIT = ('git', 'rev-list', '--max-parents=0', 'HEAD')
+LAST_COMMIT = ('git', 'log', '--no-merges', '--format=%h', '-1')
+LS_REMOTE_HEADS = ('git', 'ls-remote', '--heads')
+REMOTE_REF_NAMES = ('git', 'for-each-ref', '--format=%(refname:strip=2)', 'refs/remotes')
+STATUS = ('git', 'status', '-s')
+STASH_LIST = ('git', 'stash', 'list')
+UNPUSHED = ('git', 'log', '--find-renames', '--no-merges', '--oneline', '@{u}..')
+REF_TIMES_FORMAT = (
+    '%(refname)%09%(objectname)%09%(committerdate:unix)%09'
+    '%(committerdate:iso) %(committerdate:relative)'
+)
+
+
+def split_lines(output):
+    """Return list of the lines of output (empty list if there is no output)"""
+    return re.split('\r?\n', output) if output else []
+
+
+def first_line(output):
+    """Return the first line of output ('' if there is no output)"""
+    lines = split_lines(output)
+    return lines[0] if lines else ''
+
+
+def branch_date(branch):
+    """Command for the datetime (and relative age) of branch's last commit"""
+    return ('git', 'show', '-s', '--format=%ci %cr', branch, '--')
+
+
+def refs_with_times(ref_prefix):
+    """Command listing the refs under ref_prefix with their commit times"""
+    return (
+        'git', 'for-each-ref', '--sort=-committerdate',
+        '--format=' + REF_TIMES_FORMAT, ref_prefix
+    )
+
+
+def tags(limit=None):
+    """Command listing tag names, most recent first
+
+    - limit: max number of tags to list
+    """
+    cmd = ('git', 'for-each-ref', '--sort=-refname', '--sort=-creatordate')
+    if limit:
+        cmd += ('--count={}'.format(limit), )
+    return cmd + ('--format=%(refname:strip=2)', 'refs/tags')
+
+
+def commits(commit_range, n=None):
+    """Command listing the non-merge commits in commit_range (newest first)
+
+    - n: max number of commits to list
+    """
+    cmd = ('git', 'log', '--find-renames', '--no-merges', '--oneline')
+    if n is not None:
+        cmd += ('-n', str(n))
+    return cmd + (commit_range, )
+
+
+def count_commits(commit_range):
+    """Command counting the non-merge commits in commit_range"""
+    return ('git', 'rev-list', '--count', '--no-merges', commit_range)
+
+
+def parse_branch_name(output):
+    """Return current branch name from BRANCH_NAME output ('HEAD' if unknown)"""
+    return first_line(output) or 'HEAD'
+
+
+def parse_remote_heads(lines):
+    """Yield the branch names from lines of `git ls-remote --heads` output"""
+    for line in lines:
+        if '\trefs/heads/' in line:
+            yield line.split('\trefs/heads/', 1)[1]
+
+
+def parse_refs_with_times(output, ref_prefix):
+    """Return list of dicts from the output of refs_with_times(ref_prefix)
+
+    The 'branch' key of each dict is the ref name with ref_prefix removed
+    """
+    results = []
+    strip_len = len(ref_prefix) + 1
+    for line in split_lines(output):
+        try:
+            refname, sha, timestamp, time_data = line.split('\t', 3)
+        except ValueError:
+            continue
+        branch = refname[strip_len:]
+        if branch == 'HEAD':
+            continue
+        results.append({
+            'branch': branch,
+            'sha': sha,
+            'time': time_data,
+            'timestamp': int(timestamp or 0),
+        })
+    return results
+
+
+def filter_refs(results, grep=''):
+    """Return the dicts from parse_refs_with_times whose 'branch' matches grep
+    (case-insensitive)"""
+    if not grep:
+        return results
+    rx_grep = re.compile(grep, re.IGNORECASE)
+    return [result for result in results if rx_grep.search(result['branch'])]
+
+
+def parse_tracking_branch(output, branch):
+    """Return the remote tracking branch(es) of branch from REMOTE_REF_NAMES output"""
+    return '\n'.join([
+        name
+        for name in split_lines(output)
+        if name.endswith('/' + branch) and 'HEAD' not in name
+    ])
+
+
+def parse_status(lines):
+    """Yield the non-empty lines of STATUS output, stripped"""
+    for line in lines:
+        line = line.strip()
+        if line:
+            yield line
+
+
+def make_commit_range(tag, first_commit, until):
+    """Return 'tag..until' (or 'first_commit..until' if there is no tag), or ''
+    if there is nothing to compare"""
+    start = tag or first_commit
+    if not start or not until:
+        return ''
+    return '{}..{}'.format(start, until)
+
+
+def parse_count(output):
+    """Return the number from count_commits output (0 if it failed)"""
+    count = first_line(output)
+    return int(count) if count.isdigit() else 0
+
+
+def make_commit_summary(count, commits_output):
+    """Return dict with 'count' (from parse_count) and 'commits' (from the
+    output of commits)"""
+    if not count:
+        return {'count': 0, 'commits': []}
+    return {'count': count, 'commits': split_lines(commits_output)}
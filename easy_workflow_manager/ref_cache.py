@@ -0,0 +1,194 @@
+"""On-disk snapshot cache for ref listings, stored per repo under the git dir
+
+Each entry records a signature of the repo's ref storage (mtimes of
+packed-refs, FETCH_HEAD, and the directories under refs/remotes and refs/tags)
+taken right before the listing was generated. An entry is only served while
+that signature is unchanged and the entry is younger than the ttl.
+
+The times that branch prefixes were last fetched are kept in a separate file
+in the same directory, so the FETCH_WINDOW_SECONDS window for prefix fetches
+(which don't write FETCH_HEAD) holds across processes.
+
+Updates hold an flock on a sidecar lock file, so concurrent processes (or
+threads) updating different keys don't lose each other's entries.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+CACHE_DIRNAME = 'ewm-cache'
+CACHE_FILENAME = 'refs.json'
+FETCH_TIMES_FILENAME = 'fetch-times.json'
+WATCHED_FILES = ('packed-refs', 'FETCH_HEAD')
+WATCHED_DIRS = ('refs/remotes', 'refs/tags')
+
+
+def get_cache_file(git_dir):
+    """Return path to the ref cache file for git_dir"""
+    return os.path.join(git_dir, CACHE_DIRNAME, CACHE_FILENAME)
+
+
+def get_signature(git_dir):
+    """Return a list of mtimes that changes whenever refs are written
+
+    - git_dir: path to the .git directory of a repo
+
+    Git writes loose refs through a lockfile that is renamed into place, so the
+    mtime of the containing directory changes on every ref create/update/delete
+    """
+    signature = []
+    for name in WATCHED_FILES:
+        try:
+            signature.append(os.stat(os.path.join(git_dir, name)).st_mtime_ns)
+        except OSError:
+            signature.append(0)
+    for name in WATCHED_DIRS:
+        for dirpath, dirnames, filenames in os.walk(os.path.join(git_dir, name)):
+            dirnames.sort()
+            try:
+                signature.append(os.stat(dirpath).st_mtime_ns)
+            except OSError:
+                signature.append(0)
+    return signature
+
+
+@contextmanager
+def locked(cache_file):
+    """Hold an exclusive lock for a read-modify-write of cache_file
+
+    The lock is an flock on cache_file + '.lock' (if it can't be taken, e.g.
+    on Windows, the update goes ahead without it)
+    """
+    fp = None
+    if fcntl is not None:
+        try:
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            fp = open(cache_file + '.lock', 'a')
+            fcntl.flock(fp, fcntl.LOCK_EX)
+        except OSError:
+            if fp is not None:
+                fp.close()
+            fp = None
+    try:
+        yield
+    finally:
+        if fp is not None:
+            fcntl.flock(fp, fcntl.LOCK_UN)
+            fp.close()
+
+
+def load_file(cache_file):
+    """Return the dict stored in cache_file (empty dict if missing or unreadable)"""
+    try:
+        with open(cache_file, 'r') as fp:
+            data = json.load(fp)
+    except (OSError, ValueError):
+        data = {}
+    return data if type(data) == dict else {}
+
+
+def save_file(cache_file, data):
+    """Write data to cache_file through a temporary file that is renamed into
+    place (callers that loaded data first should hold the lock from locked)"""
+    tmp_file = '{}.{}.{}.tmp'.format(cache_file, os.getpid(), threading.get_ident())
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        with open(tmp_file, 'w') as fp:
+            json.dump(data, fp)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        pass
+
+
+def _load(git_dir):
+    return load_file(get_cache_file(git_dir))
+
+
+def get_entry(git_dir, key):
+    """Return the raw cache entry for key (dict with signature, created, value)
+
+    Unlike get, the entry is returned even if it is stale, so callers can
+    update an old listing instead of rebuilding it
+    """
+    if not git_dir:
+        return
+    return _load(git_dir).get(key)
+
+
+def get(git_dir, key, ttl, signature):
+    """Return the cached value for key, or None if missing or stale
+
+    - git_dir: path to the .git directory of a repo
+    - key: name of the cached listing
+    - ttl: max number of seconds an entry is served for
+    - signature: result of get_signature taken just now
+    """
+    if not git_dir or not ttl or ttl <= 0:
+        return
+    entry = _load(git_dir).get(key)
+    if not entry:
+        return
+    if entry.get('signature') != signature:
+        return
+    if time.time() - entry.get('created', 0) > ttl:
+        return
+    return entry.get('value')
+
+
+def put(git_dir, key, value, signature):
+    """Store value for key, along with the signature it was generated under
+
+    - git_dir: path to the .git directory of a repo
+    - key: name of the cached listing
+    - value: JSON serializable value
+    - signature: result of get_signature taken before value was generated
+    """
+    if not git_dir:
+        return
+    with locked(get_cache_file(git_dir)):
+        data = _load(git_dir)
+        data[key] = {
+            'signature': signature,
+            'created': time.time(),
+            'value': value,
+        }
+        save_file(get_cache_file(git_dir), data)
+
+
+def get_fetch_times_file(git_dir):
+    """Return path to the file with prefix fetch times for git_dir"""
+    return os.path.join(git_dir, CACHE_DIRNAME, FETCH_TIMES_FILENAME)
+
+
+def get_fetch_times(git_dir):
+    """Return dict of branch prefix -> timestamp of its last successful fetch"""
+    if not git_dir:
+        return {}
+    return load_file(get_fetch_times_file(git_dir))
+
+
+def put_fetch_times(git_dir, prefixes, timestamp):
+    """Record that the branches starting with prefixes were fetched at timestamp"""
+    if not git_dir:
+        return
+    fetch_times_file = get_fetch_times_file(git_dir)
+    with locked(fetch_times_file):
+        data = load_file(fetch_times_file)
+        for prefix in prefixes:
+            data[prefix] = timestamp
+        save_file(fetch_times_file, data)
+
+
+def clear(git_dir):
+    """Remove all cached listings for git_dir"""
+    try:
+        os.remove(get_cache_file(git_dir))
+    except OSError:
+        pass
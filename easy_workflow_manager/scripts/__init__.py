@@ -0,0 +1,36 @@
+import time
+from functools import wraps
+import click
+
+
+def profile_options(func):
+    """Add --profile and --trace options to a script's main function
+
+    - --profile: print a summary of the commands that were run (to stderr)
+    - --trace FILE: write a record of every command that was run to FILE as JSON
+    """
+    @click.option(
+        '--profile', 'profile', is_flag=True, default=False,
+        help='Show a summary of the commands that were run'
+    )
+    @click.option(
+        '--trace', 'trace_file', type=click.Path(dir_okay=False), default=None,
+        help='Write every command that was run to FILE as JSON'
+    )
+    @wraps(func)
+    def wrapper(*args, profile=False, trace_file=None, **kwargs):
+        if not profile and not trace_file:
+            return func(*args, **kwargs)
+        from easy_workflow_manager import command
+        start = time.time()
+        command.start_trace()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.time() - start
+            records = command.stop_trace()
+            if trace_file:
+                command.write_trace(trace_file, records, elapsed)
+            if profile:
+                click.echo(command.format_profile(records, elapsed), err=True)
+    return wrapper
@@ -1,7 +1,6 @@
 import click
-import input_helper as ih
 import easy_workflow_manager as ewm
-from pprint import pprint
+from easy_workflow_manager.scripts import profile_options
 
 
 @click.command()
@@ -10,6 +9,7 @@ from pprint import pprint
     help='Name of new branch to create'
 )
 @click.argument('branch', nargs=1, default='')
+@profile_options
 def main(branch, name):
     """Create a new branch from specified branch on origin"""
     ewm.branch_from(branch, name)
@@ -1,7 +1,6 @@
 import click
-import input_helper as ih
 import easy_workflow_manager as ewm
-from pprint import pprint
+from easy_workflow_manager.scripts import profile_options
 
 
 @click.command()
@@ -9,10 +8,15 @@ from pprint import pprint
     '--all', '-a', 'all_qa', is_flag=True, default=False,
     help='Select all qa environments'
 )
+@click.option(
+    '--atomic', 'atomic', is_flag=True, default=False,
+    help='Delete all of the branches or none of them'
+)
 @click.argument('qa', nargs=1, default='')
-def main(qa, all_qa):
+@profile_options
+def main(qa, all_qa, atomic):
     """Clear whatever is in a specific (or all) qa branch(es)"""
-    success = ewm.clear_qa(qa, all_qa=all_qa)
+    success = ewm.clear_qa(qa, all_qa=all_qa, atomic=atomic)
     if success:
         print('\nSuccessfully cleared qa branch(es)')
         ewm.show_qa(all_qa=True)
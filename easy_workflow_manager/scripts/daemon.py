@@ -0,0 +1,39 @@
+import click
+from easy_workflow_manager import daemon
+from easy_workflow_manager.scripts import profile_options
+
+
+@click.command()
+@click.option(
+    '--status', '-s', 'status', is_flag=True, default=False,
+    help='Show whether the daemon is running, then exit'
+)
+@click.option(
+    '--stop', 'stop', is_flag=True, default=False,
+    help='Stop the running daemon'
+)
+@click.option(
+    '--quiet', '-q', 'quiet', is_flag=True, default=False,
+    help='Don\'t print a line for each request handled'
+)
+@profile_options
+def main(status, stop, quiet):
+    """Run a resident server that answers ewm-show-* and ewm-repo-info"""
+    path = daemon.get_socket_path()
+    if status:
+        pid = daemon.is_running(path)
+        if pid:
+            print('ewm daemon is running (pid {}) on {}'.format(pid, path))
+        else:
+            print('ewm daemon is not running')
+    elif stop:
+        if daemon.stop(path):
+            print('Stopped ewm daemon on {}'.format(path))
+        else:
+            print('ewm daemon is not running')
+    else:
+        daemon.serve(path, show=not quiet)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,6 @@
 import click
-import input_helper as ih
 import easy_workflow_manager as ewm
-from pprint import pprint
+from easy_workflow_manager.scripts import profile_options
 
 
 @click.command()
@@ -9,10 +8,30 @@ from pprint import pprint
     '--grep', '-g', 'grep', default='',
     help='case-insensitive grep pattern to filter branch names by'
 )
+@click.option(
+    '--precheck', '-p', 'precheck', is_flag=True, default=False,
+    help='Show merge conflicts before merging anything'
+)
+@click.option(
+    '--refuse-conflicts', '-r', 'refuse_conflicts', is_flag=True, default=False,
+    help='Don\'t deploy if there would be merge conflicts'
+)
+@click.option(
+    '--octopus', '-o', 'octopus', is_flag=True, default=False,
+    help='Merge non-conflicting branches in a single merge'
+)
+@click.option(
+    '--use-cache', '-c', 'use_cache', is_flag=True, default=False,
+    help='Reuse an earlier merge of the same commits (see MERGE_CACHE_SECONDS)'
+)
 @click.argument('qa', nargs=1, default='')
-def main(qa, grep):
+@profile_options
+def main(qa, grep, precheck, refuse_conflicts, octopus, use_cache):
     """Select remote branch(es) to deploy to specified QA branch"""
-    deployed_to = ewm.deploy_to_qa(qa=qa, grep=grep)
+    deployed_to = ewm.deploy_to_qa(
+        qa=qa, grep=grep, precheck=precheck, refuse_conflicts=refuse_conflicts,
+        octopus=octopus, use_cache=use_cache
+    )
     if deployed_to:
         print('\nDeploy to {} was successful'.format(repr(deployed_to)))
 
@@ -1,11 +1,11 @@
 import click
-import input_helper as ih
 import easy_workflow_manager as ewm
-from pprint import pprint
+from easy_workflow_manager.scripts import profile_options
 
 
 @click.command()
 @click.argument('name', nargs=1, default='')
+@profile_options
 def main(name):
     """Create a new branch from SOURCE_BRANCH on origin"""
     name = ewm.prompt_for_new_branch_name(name)
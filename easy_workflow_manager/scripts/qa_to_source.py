@@ -1,11 +1,11 @@
 import click
-import input_helper as ih
 import easy_workflow_manager as ewm
-from pprint import pprint
+from easy_workflow_manager.scripts import profile_options
 
 
 @click.command()
 @click.argument('qa', nargs=1, default='')
+@profile_options
 def main(qa):
     """Merge the QA-verified code to SOURCE_BRANCH and delete merged branch(es)"""
     merged_from = ewm.merge_qa_to_source(qa)
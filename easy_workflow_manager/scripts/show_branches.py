@@ -1,6 +1,7 @@
 import click
-import input_helper as ih
 import easy_workflow_manager as ewm
+from easy_workflow_manager import daemon
+from easy_workflow_manager.scripts import profile_options
 
 
 @click.command()
@@ -12,16 +13,21 @@ import easy_workflow_manager as ewm
     '--local', '-l', 'local', is_flag=True, default=False,
     help='Also show local branches'
 )
+@click.option(
+    '--refresh', '-r', 'refresh', is_flag=True, default=False,
+    help='Ignore cached remote refs'
+)
 @click.argument('grep', nargs=1, default='')
-def main(grep, all_branches, local):
+@profile_options
+def main(grep, all_branches, local, refresh):
     """Show branches that match specified grep pattern"""
     if local:
         print('\nRemote:')
-    ewm.show_remote_branches(grep=grep, all_branches=all_branches)
+    daemon.run('show_remote_branches', grep=grep, all_branches=all_branches, refresh=refresh)
     if local:
         print('\nLocal:')
-        ewm.show_local_branches(grep=grep)
-        merged = ewm.get_merged_local_branches()
+        daemon.run('show_local_branches', grep=grep)
+        merged = daemon.run('get_merged_local_branches')
         if merged:
             SOURCE_BRANCH = ewm._get_repo_settings('SOURCE_BRANCH')
             print('\nLocal merged to origin/{}:'.format(SOURCE_BRANCH))
@@ -1,7 +1,6 @@
 import click
-import input_helper as ih
-import easy_workflow_manager as ewm
-from pprint import pprint
+from easy_workflow_manager import daemon
+from easy_workflow_manager.scripts import profile_options
 
 
 @click.command()
@@ -9,10 +8,15 @@ from pprint import pprint
     '--all', '-a', 'all_qa', is_flag=True, default=False,
     help='Select all qa environments'
 )
+@click.option(
+    '--refresh', '-r', 'refresh', is_flag=True, default=False,
+    help='Ignore cached remote refs'
+)
 @click.argument('qa', nargs=1, default='')
-def main(qa, all_qa):
+@profile_options
+def main(qa, all_qa, refresh):
     """Show what is in a specific (or all) qa branch(es)"""
-    ewm.show_qa(qa=qa, all_qa=all_qa)
+    daemon.run('show_qa', qa=qa, all_qa=all_qa, refresh=refresh)
 
 
 if __name__ == '__main__':
@@ -1,11 +1,31 @@
 import click
 import easy_workflow_manager as ewm
+from easy_workflow_manager import daemon
+from easy_workflow_manager.scripts import profile_options
 
 
 @click.command()
-def main():
+@click.option(
+    '--field', '-f', 'fields', multiple=True,
+    type=click.Choice(ewm.REPO_INFO_FIELDS),
+    help='Only show the given field (may be used multiple times)'
+)
+@click.option(
+    '--workspace', '-w', 'workspace', default=None,
+    type=click.Path(exists=True, file_okay=False),
+    help='Show info for every git repo found under this directory'
+)
+@click.option(
+    '--workers', '-j', 'workers', type=int, default=None,
+    help='Max number of worker processes for --workspace (default: CPU count)'
+)
+@profile_options
+def main(fields, workspace, workers):
     """Show info about the repo"""
-    ewm.show_repo_info()
+    if workspace:
+        ewm.show_workspace_info(workspace, fields=fields or None, workers=workers)
+    else:
+        daemon.run('show_repo_info', fields=fields or None)
 
 
 if __name__ == '__main__':
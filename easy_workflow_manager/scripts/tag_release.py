@@ -1,10 +1,10 @@
 import click
-import input_helper as ih
 import easy_workflow_manager as ewm
-from pprint import pprint
+from easy_workflow_manager.scripts import profile_options
 
 
 @click.command()
+@profile_options
 def main():
     """Select a recent remote commit on SOURCE_BRANCH to tag"""
     success = ewm.tag_release()
@@ -1,5 +1,6 @@
 import click
 import easy_workflow_manager as ewm
+from easy_workflow_manager.scripts import profile_options
 
 
 @click.command()
@@ -8,6 +9,7 @@ import easy_workflow_manager as ewm
     help='Do a `git stash pop` at the end if a stash was made'
 )
 @click.argument('branch', nargs=1, default='')
+@profile_options
 def main(branch, pop_stash):
     """Get latest changes from origin into branch"""
     success = ewm.update_branch(branch=branch, pop_stash=pop_stash)
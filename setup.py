@@ -21,6 +21,7 @@ setup(
     # setup_requires=['pytest-runner'],
     # tests_require=['pytest'],
     install_requires=requirements,
+    python_requires='>=3.7',
     include_package_data=True,
     package_dir={'': '.'},
     package_data={
@@ -30,6 +31,7 @@ setup(
         'console_scripts': [
             'ewm-branch-from=easy_workflow_manager.scripts.branch_from:main',
             'ewm-clear-qa=easy_workflow_manager.scripts.clear_qa:main',
+            'ewm-daemon=easy_workflow_manager.scripts.daemon:main',
             'ewm-deploy-to-qa=easy_workflow_manager.scripts.deploy_to_qa:main',
             'ewm-new-branch-from-source=easy_workflow_manager.scripts.new_branch_from_source:main',
             'ewm-qa-to-source=easy_workflow_manager.scripts.qa_to_source:main',
@@ -47,7 +49,9 @@ setup(
         'License :: OSI Approved :: MIT License',
         'Operating System :: MacOS :: MacOS X',
         'Operating System :: POSIX :: Linux',
-        'Programming Language :: Python :: 3.5',
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: 3.7',
         'Programming Language :: Python',
         'Topic :: Software Development :: Libraries',
         'Topic :: Software Development :: Version Control :: Git',
@@ -1,6 +1,14 @@
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+import threading
 import pytest
 import bg_helper as bh
 import easy_workflow_manager as ewm
+from easy_workflow_manager import aio, backends, command, coprocess, daemon, merge_cache, ref_cache
 from . import *
 
 
@@ -22,6 +30,17 @@ class TestNewRepo(object):
         assert ewm.get_local_branches(grep='my') == ['mybranch', 'mybranch2']
         assert ewm.get_merged_local_branches() == ['mybranch', 'mybranch2', 'otherbranch']
 
+    def test_branches_with_times(self):
+        remote = ewm.get_remote_branches_with_times()
+        assert sorted([b['branch'] for b in remote]) == ewm.get_remote_branches()
+        for branch in remote:
+            assert sorted(branch.keys()) == ['branch', 'sha', 'time', 'timestamp']
+            assert branch['time'].startswith(ewm.get_branch_date('origin/' + branch['branch']).split(' ')[0])
+        local = ewm.get_local_branches_with_times(grep='my')
+        assert sorted([b['branch'] for b in local]) == ['mybranch', 'mybranch2']
+        timestamps = [b['timestamp'] for b in local]
+        assert timestamps == sorted(timestamps, reverse=True)
+
     def test_qa(self):
         assert ewm.get_qa_env_branches() == []
         assert ewm.get_non_empty_qa() == set()
@@ -33,6 +52,8 @@ class TestNewRepo(object):
         env_branches = ewm.get_qa_env_branches(qa=qa)
         assert len(env_branches) == 1
         assert env_branches[0]['contains'] == ['mybranch2']
+        all_env_branches = ewm.get_qa_env_branches(all_qa=True)
+        assert [b['branch'] for b in all_env_branches] == ['qa1--with--mybranch2']
         assert sorted(list(ewm.get_empty_qa())) == ['qa2', 'qa3']
         all_branches = ewm.get_remote_branches(all_branches=True)
         assert all_branches == ['master', 'mybranch', 'mybranch2', 'otherbranch', 'qa1', 'qa1--with--mybranch2']
@@ -61,7 +82,457 @@ class TestNewRepo(object):
         ewm.show_repo_info()
         assert ewm.get_branch_name() == 'master'
 
+    def test_backends(self):
+        python = backends.BACKENDS['python']
+        subprocess = backends.BACKENDS['subprocess']
+        for method in ('branch_name', 'local_branches', 'origin_url', 'first_commit_id', 'last_commit_id'):
+            assert getattr(python, method)() == getattr(subprocess, method)()
+        for branch in ('master', 'origin/mybranch2', 'HEAD'):
+            assert python.branch_date(branch)[:25] == subprocess.branch_date(branch)[:25]
+        assert python.branch_date('master~1') == subprocess.branch_date('master~1')
+        cat_file = backends.BACKENDS['coprocess']
+        assert cat_file.branch_date('master~1') == subprocess.branch_date('master~1')
+        tag = ewm.get_last_tag()
+        assert python.tag_listing(tag) == subprocess.tag_listing(tag)
+        assert cat_file.tag_listing(tag) == subprocess.tag_listing(tag)
+
+    def test_repo_info(self):
+        info = ewm.get_repo_info_dict()
+        assert tuple(info.keys()) == ewm.REPO_INFO_FIELDS
+        assert info['commits_since_last_tag'] == ewm.get_commits_since_last_tag()
+        assert info['commits_since_last_tag_summary'] == ewm.get_commits_since_last_tag_summary()
+        assert 'commits_since_last_tag' not in ewm._get_display_fields()
+        assert info['branch_tracking'] == 'origin/master'
+        partial = ewm.get_repo_info_dict(fields=['last_tag', 'branch'])
+        assert list(partial.keys()) == ['branch', 'last_tag']
+        assert partial['branch'] == info['branch']
+        assert partial['last_tag'] == info['last_tag']
+        assert ewm.get_repo_info_string(fields=['branch']) == 'master'
+        with pytest.raises(ValueError):
+            ewm.get_repo_info_dict(fields=['nope'])
+
 
 class TestMoreStuff(object):
     def test_remote_branches(self):
         assert ewm.get_remote_branches(all_branches=True) == ['master']
+
+    def test_ref_cache(self):
+        git_dir = ewm.get_git_dir()
+        assert os.path.isfile(ref_cache.get_cache_file(git_dir))
+        signature = ref_cache.get_signature(git_dir)
+        ref_cache.put(git_dir, 'ls-remote-heads', ['master', 'fake'], signature)
+        assert ewm.get_remote_branches(all_branches=True) == ['master', 'fake']
+        assert ewm.get_remote_branches(all_branches=True, refresh=True) == ['master']
+        ewm.new_branch('cachedbranch')
+        assert ewm.get_remote_branches() == ['cachedbranch']
+
+        keys = ['concurrent-{}'.format(i) for i in range(8)]
+        threads = [
+            threading.Thread(target=ref_cache.put, args=(git_dir, key, [key], signature))
+            for key in keys
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert set(keys).issubset(ref_cache._load(git_dir))
+
+    def test_fetch_coalescing(self):
+        settings = ewm.REPO_SETTINGS_CACHE[ewm.get_local_repo_name()]
+        assert ewm.fetch_all(force=True) is True
+        assert ewm.fetch_all() is False
+        window = settings['FETCH_WINDOW_SECONDS']
+        settings['FETCH_WINDOW_SECONDS'] = 0
+        try:
+            before = ewm.get_fetch_stats()
+            with ewm.workflow_operation():
+                assert ewm.fetch_all() is True
+                ewm.get_qa_env_branches()
+                ewm.get_merged_remote_branches()
+            after = ewm.get_fetch_stats()
+            assert after['count'] - before['count'] == 1
+            assert after['skipped'] - before['skipped'] == 2
+        finally:
+            settings['FETCH_WINDOW_SECONDS'] = window
+
+        old = time.time() - 3600
+        os.utime(os.path.join(ewm.get_git_dir(), 'FETCH_HEAD'), (old, old))
+        assert ewm._fetch_branch_prefixes(['qa1', 'qa2']) is True
+        assert set(['qa1', 'qa2']).issubset(ref_cache.get_fetch_times(ewm.get_git_dir()))
+        code = (
+            'import easy_workflow_manager as ewm; '
+            'ewm._fetch_qa_branches(["qa1", "qa2"]); '
+            'ewm._fetch_qa_branches(["qa3"]); '
+            'print(ewm.get_fetch_stats()["count"])'
+        )
+        output = bh.run_output('{} -c {}'.format(sys.executable, repr(code)))
+        assert output == '1'
+
+    def test_tag_index(self):
+        assert ewm.get_tags() == []
+        assert ewm.get_last_tag() == ''
+        bh.run('GIT_COMMITTER_DATE="2020-01-01T00:00:00" git tag -a zzz-old -m old')
+        bh.run('git tag -a aaa-new -m new')
+        assert ewm.get_tags() == ['aaa-new', 'zzz-old']
+        assert ewm.get_tags(limit=1) == ['aaa-new']
+        bh.run('GIT_COMMITTER_DATE="2021-01-01T00:00:00" git tag -a mmm-mid -m mid')
+        assert ewm.get_tags() == ['aaa-new', 'mmm-mid', 'zzz-old']
+        assert ewm.get_tags(refresh=True) == ['aaa-new', 'mmm-mid', 'zzz-old']
+        assert ewm.get_last_tag() == 'aaa-new'
+        assert ewm.get_tag_message('mmm-mid') == 'mid'
+        bh.run('git tag rel/1')
+        assert [t[0] for t in ewm._read_tag_refs('rel/1', 'rel')] == ['rel/1']
+        assert ewm._read_tag_refs('rel', 'rel/*') == []
+        bh.run('git tag -d rel/1')
+        assert ewm.RX_NON_TAG.match('v1-3-gabc123')
+        assert ewm.RX_CONFIG_URL.match('url = git@host:repo.git').group(1) == 'git@host:repo.git'
+
+    def test_workspace(self, repos):
+        root = os.path.dirname(repos['local'])
+        assert ewm.find_repos(root) == [repos['local']]
+        append_to_file()
+        try:
+            summary = ewm.show_workspace_info(root, fields=['status'], workers=2)
+        finally:
+            bh.run('git checkout -- .')
+        assert summary['repos'] == [repos['local']]
+        assert summary['dirty'] == [repos['local']]
+        assert summary['errors'] == []
+
+    def test_delete_branches(self):
+        ewm.new_branch('deleteme1')
+        ewm.new_branch('deleteme2')
+        checkout_branch('master')
+        assert ewm.delete_remote_branches('deleteme1', 'deleteme2', 'neverpushed') is True
+        assert ewm.get_remote_branches(grep='deleteme', refresh=True) == []
+        assert ewm.delete_local_branches('deleteme1', 'nosuchbranch', atomic=True) is None
+        assert ewm.get_local_branches(grep='deleteme') == ['deleteme1', 'deleteme2']
+        assert ewm.delete_local_branches('deleteme1', 'nosuchbranch') is None
+        assert ewm.get_local_branches(grep='deleteme') == ['deleteme2']
+        assert ewm.delete_local_branches('deleteme2', atomic=True) is True
+        assert ewm.get_local_branches(grep='deleteme') == []
+
+    def test_force_push_grant(self):
+        with pytest.raises(AssertionError):
+            ewm.force_push_local('qa1', 'mybranch')
+        with ewm._force_push_grant('tag_release'):
+            with pytest.raises(AssertionError):
+                ewm.force_push_local('qa1', 'mybranch')
+        with ewm._force_push_grant('deploy_to_qa'):
+            with pytest.raises(AssertionError):
+                ewm.force_push_local('qa1', 'mybranch', to_source=True)
+            assert ewm.force_push_local('qa1', 'mybranch') is None
+        assert ewm._PUSH_GRANTS.stack == []
+
+    def test_lazy_imports(self):
+        code = (
+            'import sys, easy_workflow_manager; '
+            'print(" ".join(sorted(set(sys.modules).intersection(['
+            '"settings_helper", "input_helper", "dt_helper", "bg_helper", "fs_helper"'
+            ']))))'
+        )
+        output = bh.run_output('{} -c {}'.format(sys.executable, repr(code)))
+        assert output == ''
+        logger = ewm.logger
+        handlers = len(logger.handlers)
+        assert ewm.logger is logger
+        assert len(logger.handlers) == handlers
+
+    def test_daemon(self, repos, monkeypatch):
+        path = os.path.join(os.path.dirname(repos['local']), 'ewm-daemon', 'daemon.sock')
+        monkeypatch.setenv('EWM_DAEMON_SOCKET', path)
+        assert daemon.forward('get_local_branches') == (False, None)
+        server = threading.Thread(target=daemon.serve, kwargs={'show': False})
+        server.start()
+        try:
+            for _ in range(50):
+                if daemon.is_running():
+                    break
+                time.sleep(0.05)
+            assert daemon.is_running() == os.getpid()
+            assert oct(os.stat(path).st_mode & 0o777) == '0o600'
+            local_branches = ewm.get_local_branches()
+            assert daemon.forward('get_local_branches') == (True, local_branches)
+            assert daemon.run('get_last_tag') == ewm.get_last_tag()
+            assert daemon.forward('deploy_to_qa') == (False, None)
+            request = {'command': 'get_local_branches', 'cwd': os.getcwd(), 'env': {}}
+            assert daemon.handle_request(request)['ok'] is False
+        finally:
+            daemon.stop()
+            server.join(5)
+        assert not os.path.exists(path)
+
+    def test_precheck_merge_conflicts(self):
+        ewm.new_branch('conflict1')
+        change_file_line(text='ONE')
+        add_commit_push()
+        ewm.new_branch('conflict2')
+        change_file_line(text='TWO')
+        append_to_file(fname='other-file.txt')
+        add_commit_push()
+        assert ewm.precheck_merge_conflicts('conflict1', 'conflict2') == {
+            'conflict1': [], 'conflict2': ['some-file.txt']
+        }
+        assert ewm.precheck_merge_conflicts('conflict2') == {'conflict2': []}
+        assert ewm.precheck_merge_conflicts('conflict1', 'nosuchbranch') is None
+        assert ewm.get_branch_name() == 'conflict2'
+        assert ewm.get_status() == []
+        assert ewm.deploy_to_qa('qa1', branches='conflict1, conflict2', refuse_conflicts=True) is None
+        assert ewm.get_branch_name() == 'conflict2'
+        assert ewm.get_qa_env_branches('qa1', refresh=True) == []
+        checkout_branch('master')
+        assert ewm.delete_remote_branches('conflict1', 'conflict2') is True
+
+    def test_worktree(self):
+        settings = ewm.REPO_SETTINGS_CACHE[ewm.get_local_repo_name()]
+        checkout_branch('master')
+        append_to_file()
+        settings['USE_WORKTREE'] = True
+        try:
+            assert ewm.deploy_to_qa('qa2', branches='cachedbranch') == 'qa2'
+            assert ewm.get_branch_name() == 'master'
+            assert ewm.get_status() == ['M some-file.txt']
+            assert ewm.get_stashlist() == []
+            path = ewm.get_worktree_path()
+            assert path.startswith(ewm.get_git_dir())
+            assert bh.run_output('git -C {} rev-parse --abbrev-ref HEAD'.format(path)) == settings['LOCAL_BRANCH']
+            assert [b['contains'] for b in ewm.get_qa_env_branches('qa2', refresh=True)] == [['cachedbranch']]
+            assert ewm.clear_qa('qa2', force=True) is True
+        finally:
+            settings['USE_WORKTREE'] = False
+            bh.run('git checkout -- .')
+        assert ewm.merge_branches_locally('cachedbranch') is True
+        assert ewm.get_branch_name() == settings['LOCAL_BRANCH']
+        checkout_branch('master')
+
+    def test_octopus_merge(self):
+        for name in ('octopus1', 'octopus2', 'octopus3'):
+            ewm.new_branch(name)
+            make_file(fname=name + '.txt')
+            add_commit_push()
+        checkout_branch('master')
+        assert ewm.merge_branches_locally('octopus1', 'octopus2', 'octopus3', octopus=True) is True
+        LOCAL_BRANCH = ewm._get_repo_settings('LOCAL_BRANCH')
+        assert ewm.get_branch_name() == LOCAL_BRANCH
+        parents = bh.run_output('git rev-list --parents -n 1 HEAD').split()[1:]
+        heads = bh.run_output('git rev-parse origin/octopus1 origin/octopus2 origin/octopus3').split()
+        assert parents == heads
+        for name in ('octopus1', 'octopus2', 'octopus3'):
+            assert os.path.isfile(name + '.txt')
+        checkout_branch('master')
+        assert ewm.delete_remote_branches('octopus1', 'octopus2', 'octopus3') is True
+
+    def test_merge_cache(self, capsys):
+        git_dir = ewm.get_git_dir()
+        merge_cache.clear(git_dir)
+        for name in ('cached1', 'cached2'):
+            ewm.new_branch(name)
+            make_file(fname=name + '.txt')
+            add_commit_push()
+        checkout_branch('master')
+        capsys.readouterr()
+        assert ewm.merge_branches_locally('cached1', 'cached2', use_cache=True) is True
+        merged = bh.run_output('git rev-parse HEAD')
+        assert 'Reusing earlier merge' not in capsys.readouterr().out
+        key = ewm._get_merge_cache_key(('cached1', 'cached2'), 'master')
+        assert list(merge_cache._load(git_dir).keys()) == [key]
+
+        checkout_branch('master')
+        assert ewm.merge_branches_locally('cached1', 'cached2', use_cache=True) is True
+        assert 'Reusing earlier merge' in capsys.readouterr().out
+        assert ewm.get_branch_name() == ewm._get_repo_settings('LOCAL_BRANCH')
+        assert bh.run_output('git rev-parse HEAD') == merged
+        assert ewm._get_merge_cache_key(('cached2', 'cached1'), 'master') != key
+
+        merge_cache.put(git_dir, key, '0' * 40, 60, 10)
+        assert ewm._get_cached_merge(key) is None
+        assert merge_cache._load(git_dir) == {}
+        merge_cache.put(git_dir, 'a', merged, 60, 1)
+        merge_cache.put(git_dir, 'b', merged, 60, 1)
+        assert list(merge_cache._load(git_dir).keys()) == ['b']
+        assert merge_cache.get(git_dir, 'b', 60) == merged
+        checkout_branch('master')
+        assert ewm.delete_remote_branches('cached1', 'cached2') is True
+
+    def test_command_trace(self, tmpdir):
+        with command.tracing() as records:
+            ewm.get_remote_branches(refresh=True)
+            ewm.get_qa_env_branches(refresh=True)
+            assert command.run_output('git rev-parse --verify nope') != ''
+        assert command.is_tracing() is False
+        assert records[0]['cmd'].startswith('git ls-remote')
+        assert records[0]['function'] == 'get_remote_branches'
+        assert records[0]['operation'] == 'get_remote_branches'
+        assert records[0]['exit_code'] == 0
+        assert records[0]['output_bytes'] > 0
+        assert [r['operation'] for r in records[1:-1]] == ['get_qa_env_branches'] * (len(records) - 2)
+        assert records[-1]['function'] is None
+        assert records[-1]['exit_code'] != 0
+        profile = command.get_profile(records + records[:1])
+        assert profile['commands'] == len(records) + 1
+        assert profile['failed'] == 1
+        assert profile['repeated'][0]['cmd'] == records[0]['cmd']
+        assert 'Repeated commands:' in command.format_profile(records + records[:1], 1.0)
+
+        trace_file = str(tmpdir.join('trace.json'))
+        assert bh.run(
+            '{} -m easy_workflow_manager.scripts.show_qa --refresh --profile --trace {} 2>/dev/null'.format(
+                sys.executable, trace_file
+            )
+        ) == 0
+        with open(trace_file, 'r') as fp:
+            data = json.load(fp)
+        assert [r['operation'] for r in data['commands']][0] == 'show_qa'
+
+    def test_process_stats(self):
+        assert command.count_processes(['git', 'status', '-s']) == 1
+        assert command.count_processes('git branch -r | grep "/a b$" | grep -v HEAD') == 4
+        assert command.cmd_string(['git', 'log', '--format=%h %s']) == "git log '--format=%h %s'"
+        command.reset_process_stats()
+        with command.tracing() as records:
+            assert ewm.get_tracking_branch() == 'origin/master'
+            ewm.get_merged_local_branches()
+            backends.BACKENDS['subprocess'].origin_url()
+        stats = command.get_process_stats()
+        assert stats['shell_commands'] == 0
+        assert stats['commands'] == stats['processes'] == len(records) > 0
+        assert [r['processes'] for r in records] == [1] * len(records)
+        assert '0 failed, {} processes'.format(len(records)) in command.format_profile(records)
+
+    def test_cat_file_pool(self):
+        repo = ewm.get_local_repo_path()
+        pool = coprocess.CatFilePool(idle_timeout=0.2)
+        assert pool.query(repo, 'HEAD')[1] == 'commit'
+        proc = pool._idle[repo][0]
+        close = proc.close
+        unlocked = []
+
+        def take_lock():
+            if pool._cond.acquire(timeout=1):
+                pool._cond.release()
+                unlocked.append(True)
+
+        def close_and_check():
+            thread = threading.Thread(target=take_lock)
+            thread.start()
+            thread.join()
+            close()
+
+        proc.close = close_and_check
+        for _ in range(50):
+            if not proc.alive:
+                break
+            time.sleep(0.1)
+        assert unlocked == [True]
+        assert pool.stats['reaped'] == 1
+        pool.shutdown()
+
+    def test_aio(self):
+        repo = ewm.get_local_repo_path()
+        ewm.new_branch('aio1')
+        ewm.new_branch('aio2')
+        checkout_branch('master')
+
+        async def query():
+            return await asyncio.gather(
+                aio.get_remote_branches(repo, all_branches=True),
+                aio.get_qa_env_branches(repo),
+                aio.get_qa_env_branches(repo, fetch=False),
+                aio.get_repo_info_dict(repo),
+                aio.get_empty_qa(repo),
+            )
+
+        remote, envs, envs2, info, empty = asyncio.run(query())
+        assert remote == ewm.get_remote_branches(all_branches=True, refresh=True)
+        assert envs == envs2 == ewm.get_qa_env_branches(refresh=True)
+        assert info == ewm.get_repo_info_dict()
+        assert empty == ewm.get_empty_qa()
+        assert 'qa2' in empty
+
+        make_file('aio-untracked.txt')
+        info = asyncio.run(aio.get_repo_info_dict(repo))
+        assert info == ewm.get_repo_info_dict()
+        assert info['status'] == ['?? aio-untracked.txt']
+        assert info['branch_tracking'] == 'origin/master'
+        os.remove('aio-untracked.txt')
+
+        assert asyncio.run(aio.deploy_to_qa(repo, 'qa2', 'aio1, nope')) is None
+        assert asyncio.run(aio.deploy_to_qa(repo, 'qa2', 'aio1, aio2')) == 'qa2'
+        with pytest.raises(aio.WorkflowError):
+            asyncio.run(aio.deploy_to_qa(repo, 'qa2', 'aio2'))
+        assert asyncio.run(aio.deploy_to_qa(repo, 'qa2', 'aio1;aio2', force=True)) == 'qa2'
+        with pytest.raises(aio.WorkflowError):
+            asyncio.run(aio.merge_qa_to_source(repo, 'qa3'))
+        env_branches = asyncio.run(aio.get_qa_env_branches(repo, qa='qa2', fetch=False))
+        assert [b['branch'] for b in env_branches] == ['qa2--with--aio1--aio2']
+        assert asyncio.run(aio.delete_remote_branches(
+            repo, 'qa2', 'qa2--with--aio1--aio2', 'aio1', 'aio2', 'nope'
+        )) is True
+        assert 'aio1' not in asyncio.run(aio.get_remote_branches(repo))
+        checkout_branch('master')
+
+    def test_iter_listings(self):
+        make_file('untracked-1.txt')
+        make_file('untracked-2.txt')
+        assert list(ewm.iter_untracked_files()) == ewm.get_untracked_files()
+        assert sorted(ewm.get_untracked_files()) == ['untracked-1.txt', 'untracked-2.txt']
+        assert list(ewm.iter_status()) == ewm.get_status() == ['?? untracked-1.txt', '?? untracked-2.txt']
+        assert list(ewm.iter_remote_branches(all_branches=True)) == ewm.get_remote_branches(all_branches=True, refresh=True)
+        assert list(ewm.iter_remote_branches(grep='AIO')) == ewm.get_remote_branches(grep='AIO', refresh=True)
+        assert list(ewm.iter_tags()) == ewm.get_tags()
+        ewm.REPO_SETTINGS_CACHE[ewm.get_local_repo_name()]['REF_CACHE_SECONDS'] = 0
+        try:
+            assert list(ewm.iter_tags()) == ewm.get_tags()
+        finally:
+            del ewm.REPO_SETTINGS_CACHE[ewm.get_local_repo_name()]
+        assert list(ewm.iter_commits_since_last_tag()) == ewm.get_commits_since_last_tag()
+        os.remove('untracked-1.txt')
+        os.remove('untracked-2.txt')
+
+        with command.tracing() as records:
+            lines = command.iter_output('yes')
+            assert next(lines) == 'y'
+            lines.close()
+        assert len(records) == 1
+        assert records[0]['exit_code'] != 0
+        assert records[0]['seconds'] < 5
+
+    def test_remote_branches_by_prefix(self):
+        assert ewm._get_literal_prefixes('^qa1$|^qa1--') == ['QA1', 'Qa1', 'qA1', 'qa1']
+        assert ewm._get_literal_prefixes('qa1') is None
+        assert ewm._get_literal_prefixes('^qa(1|2)') is None
+        assert ewm._get_literal_prefixes('^pre-one$|^Pre-') == [
+            'PRE-', 'PRe-', 'PrE-', 'Pre-', 'pRE-', 'pRe-', 'prE-', 'pre-'
+        ]
+        checkout_branch('master')
+        for branch in ('pre-one', 'Pre-two', 'not-pre'):
+            ewm.new_branch(branch)
+        checkout_branch('master')
+        grep = '^pre-one$|^pre-t'
+        with command.tracing() as records:
+            assert ewm.get_remote_branches(grep=grep, refresh=True) == ['Pre-two', 'pre-one']
+        assert [r['cmd'].split()[:2] for r in records] == [['git', 'ls-remote']]
+        assert ewm.get_remote_branches(grep=grep, refresh=True) == [
+            b for b in ewm.iter_remote_branches(all_branches=True)
+            if re.search(grep, b, re.I)
+        ]
+        assert ewm.delete_remote_branches('pre-one', 'Pre-two', 'not-pre') is True
+        assert ewm.get_remote_branches(grep=grep, refresh=True) == []
+
+    def test_commits_since_last_tag_summary(self):
+        for i in range(3):
+            append_to_file(text='summary {}'.format(i))
+            add_commit_push()
+        commits = ewm.get_commits_since_last_tag()
+        assert len(commits) >= 3
+        summary = ewm.get_commits_since_last_tag_summary(n=2)
+        assert summary == {'count': len(commits), 'commits': commits[:2]}
+        assert ewm.get_commits_since_last_tag_summary(n=0)['commits'] == []
+        info = ewm.get_repo_info_dict(fields=['commits_since_last_tag', 'commits_since_last_tag_summary'])
+        assert list(info.keys()) == ['commits_since_last_tag', 'commits_since_last_tag_summary']
+        assert info['commits_since_last_tag_summary'] == ewm.get_commits_since_last_tag_summary()
+        assert info['commits_since_last_tag'] == commits
+        assert ewm._get_display_fields(['commits_since_last_tag', 'commits_since_last_tag_summary']) == [
+            'commits_since_last_tag_summary'
+        ]
+        assert commits[0] in ewm.get_repo_info_string(fields=['commits_since_last_tag'])